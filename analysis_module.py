@@ -0,0 +1,251 @@
+"""
+Functions for comparing measurement runs of Digital Twin Web.
+
+All runs of a measurement folder are summarized into one index file with
+one row per run, measurement, DTID (or network depth) and event. Each row
+holds percentiles and a compact latency histogram, so that runs can be
+compared without reading their main logs again. The sizes and modification
+times of the main logs are stored with the rows, so that runs that were
+still being written when indexed are indexed again.
+"""
+import csv, math, os
+
+import statistics_module as stats
+import monitoring_module as monitor
+
+INDEX_FILENAME = 'index.csv'
+INDEX_COLUMNS = ['Run', 'Measurement', 'Key', 'Event', 'Count', 'Mean', 'P50', 'P90', 'P99', 'Max', 'Histogram', 'Logs']
+
+# Timed events and the log column holding their value
+TIMED_EVENTS = {
+    'DTID > hosturl fetch time': 'Time',
+    'Hosturl > DT doc fetch time': 'Time',
+    'DT doc received': 'Time',
+    'Duration to fetch all children': 'Duration',
+    'Registry DNS resolution time': 'Duration',
+    'Base DNS resolution time': 'Duration',
+    'Bulk fetch time': 'Duration',
+}
+
+
+def find_runs(folderpath: str) -> list:
+    """
+    Returns:
+      Sorted list of names of run folders in a measurement folder
+    """
+    return sorted(name for name in os.listdir(folderpath)
+        if name.startswith('measurements-') and os.path.isdir(os.path.join(folderpath, name)))
+
+
+def find_logs(runpath: str) -> list:
+    """
+    Returns:
+      List of (measurement name, main log path, key column) tuples of a run
+    """
+    logs = []
+    registry_log = os.path.join(runpath, 'registry_measurement', 'main_log.csv')
+    if os.path.exists(registry_log):
+        logs.append(('registry_measurement', registry_log, 'Base'))
+    networkpath = os.path.join(runpath, 'network_measurements')
+    if os.path.isdir(networkpath):
+        for key in sorted(os.listdir(networkpath)):
+            network_log = os.path.join(networkpath, key, 'main_log.csv')
+            if os.path.exists(network_log):
+                logs.append(('network_measurements/' + key, network_log, 'Depth'))
+    return logs
+
+
+def log_signature(runpath: str) -> str:
+    """
+    Returns:
+      Sizes and modification times of the main logs of a run, empty if it has no logs
+    """
+    parts = []
+    for measurement, logpath, _ in find_logs(runpath):
+        status = os.stat(logpath)
+        parts.append('{}:{}:{}'.format(measurement, status.st_size, status.st_mtime_ns))
+    return ';'.join(parts)
+
+
+def summarize_log(filepath: str, key_column: str) -> list:
+    """
+    Summarizes the events of a main log per key, reading the log row by row.
+
+    Args:
+      filepath: Path to measurement log file
+      key_column: 'Base' to group by DTID, 'Depth' to group by network depth
+
+    Returns:
+      List of index rows without the Run and Measurement columns
+    """
+    key_index = stats.LOG_COLUMNS.index(key_column)
+    values = {}
+    failures = {}
+    with open(filepath, 'r', newline='') as logfile:
+        for row in csv.reader(logfile):
+            if len(row) < len(stats.LOG_COLUMNS) or row[0] == 'Time':
+                continue
+            event = row[2]
+            key = row[key_index] if key_column != 'Depth' else 'depth ' + row[key_index]
+            if event in TIMED_EVENTS:
+                value = row[stats.LOG_COLUMNS.index(TIMED_EVENTS[event])]
+                values.setdefault((key, event), []).append(float(value))
+            elif event in monitor.FAILURE_EVENTS:
+                failures[(key, event)] = failures.get((key, event), 0) + 1
+
+    rows = []
+    for (key, event), group in sorted(values.items()):
+        group.sort()
+        counts = [0] * (len(stats.HISTOGRAM_BOUNDS) + 1)
+        for value in group:
+            counts[stats.histogram_index(value)] += 1
+        rows.append([key, event, len(group),
+            '{:4.6f}'.format(sum(group) / len(group)),
+            '{:4.6f}'.format(stats.quantile(group, 0.5)),
+            '{:4.6f}'.format(stats.quantile(group, 0.9)),
+            '{:4.6f}'.format(stats.quantile(group, 0.99)),
+            '{:4.6f}'.format(group[-1]),
+            stats.format_histogram(counts)])
+    for (key, event), count in sorted(failures.items()):
+        rows.append([key, event, count, '', '', '', '', '', ''])
+    return rows
+
+
+def index_runs(folderpath: str) -> int:
+    """
+    Adds runs that are not yet indexed to the index file of a measurement
+    folder and indexes again runs whose main logs have changed since.
+
+    Args:
+      folderpath: Measurement folder, e.g. measurements/<foldername>
+
+    Returns:
+      Number of indexed or re-indexed runs
+    """
+    indexpath = os.path.join(folderpath, INDEX_FILENAME)
+    rows = []
+    signatures = {}
+    header = None
+    if os.path.exists(indexpath):
+        with open(indexpath, 'r', newline='') as indexfile:
+            reader = csv.reader(indexfile)
+            header = next(reader, None)
+            for row in reader:
+                rows.append(row)
+                signatures[row[0]] = row[INDEX_COLUMNS.index('Logs')] if header == INDEX_COLUMNS else None
+
+    changed = {}
+    for run in find_runs(folderpath):
+        signature = log_signature(os.path.join(folderpath, run))
+        if signature and signatures.get(run) != signature:
+            changed[run] = signature
+
+    # Rows of changed runs and indexes of an older format are rewritten, new runs are appended
+    rewrite = header != INDEX_COLUMNS or any(run in signatures for run in changed)
+    if not changed and not rewrite:
+        return 0
+    temppath = indexpath + '.tmp'
+    with open(temppath if rewrite else indexpath, 'w' if rewrite else 'a', newline='') as indexfile:
+        writer = csv.writer(indexfile)
+        if rewrite:
+            writer.writerow(INDEX_COLUMNS)
+            for row in rows:
+                if row[0] not in changed:
+                    # Runs indexed in an older format without logs left keep an empty Logs column
+                    writer.writerow(row[:len(INDEX_COLUMNS)-1] + [signatures[row[0]] or ''])
+        for run, signature in changed.items():
+            print(('Re-indexing ' if run in signatures else 'Indexing ') + run)
+            for measurement, logpath, key_column in find_logs(os.path.join(folderpath, run)):
+                for row in summarize_log(logpath, key_column):
+                    writer.writerow([run, measurement] + row + [signature])
+    if rewrite:
+        os.replace(temppath, indexpath)
+    return len(changed)
+
+
+def read_index(folderpath: str, runs=None) -> list:
+    """
+    Reads index rows of a measurement folder.
+
+    Args:
+      runs: Collection of run names to read, None for all runs
+
+    Returns:
+      List of index rows as dicts
+    """
+    rows = []
+    with open(os.path.join(folderpath, INDEX_FILENAME), 'r', newline='') as indexfile:
+        for row in csv.DictReader(indexfile):
+            if runs is None or row['Run'] in runs:
+                rows.append(row)
+    return rows
+
+
+def indexed_runs(folderpath: str) -> list:
+    """
+    Returns:
+      Sorted list of run names in the index file
+    """
+    runs = set()
+    with open(os.path.join(folderpath, INDEX_FILENAME), 'r', newline='') as indexfile:
+        reader = csv.reader(indexfile)
+        next(reader, None)
+        for row in reader:
+            runs.add(row[0])
+    return sorted(runs)
+
+
+def pool_histograms(rows: list) -> dict:
+    """
+    Sums the histograms of timed index rows over runs.
+
+    Returns:
+      Dict of histogram counts by (measurement, key, event)
+    """
+    pooled = {}
+    for row in rows:
+        if not row['Histogram']:
+            continue
+        group = (row['Measurement'], row['Key'], row['Event'])
+        counts = stats.parse_histogram(row['Histogram'])
+        if group in pooled:
+            pooled[group] = [a + b for a, b in zip(pooled[group], counts)]
+        else:
+            pooled[group] = counts
+    return pooled
+
+
+def find_regressions(baseline_rows: list, candidate_rows: list, alpha=0.01, min_change=0.1) -> list:
+    """
+    Compares the latency distributions of two sets of runs.
+
+    A group is flagged as a regression if its distribution differs
+    significantly (two-sample Kolmogorov-Smirnov test) and its median
+    has grown by at least min_change.
+
+    Args:
+      baseline_rows: Index rows of the baseline runs
+      candidate_rows: Index rows of the candidate runs
+      alpha: Significance level
+      min_change: Minimum relative growth of the median, e.g. 0.1 for 10 %
+
+    Returns:
+      List of comparison dicts for all groups present in both, regressions first
+    """
+    baseline = pool_histograms(baseline_rows)
+    candidate = pool_histograms(candidate_rows)
+    results = []
+    for group in sorted(set(baseline) & set(candidate)):
+        d, p = stats.ks_test_histograms(baseline[group], candidate[group])
+        median_baseline = stats.histogram_quantile(baseline[group], 0.5)
+        median_candidate = stats.histogram_quantile(candidate[group], 0.5)
+        change = median_candidate / median_baseline - 1 if median_baseline > 0 else math.nan
+        results.append({
+            'measurement': group[0], 'key': group[1], 'event': group[2],
+            'baseline_count': sum(baseline[group]), 'candidate_count': sum(candidate[group]),
+            'baseline_p50': median_baseline, 'candidate_p50': median_candidate,
+            'change': change, 'd': d, 'p': p,
+            'regression': p < alpha and change >= min_change,
+        })
+    results.sort(key=lambda result: not result['regression'])
+    return results
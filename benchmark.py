@@ -0,0 +1,193 @@
+""" Benchmarks the measurement client against a local zero-latency Twinbase.
+
+Runs the registry and network measurement paths of measurement_module against
+an in-process DTID registry and Twinbase server (fake_twinbase_module) so that
+the results describe the client itself and not the network.
+
+Reports for each case:
+    throughput: DT doc resolutions per second
+    overhead: Wall clock time per resolution (ms)
+    memory: Peak Python memory allocated during one sample (MB)
+
+With --local-twins, the network path also traverses a twin folder created
+by create-twins-tree.py from memory (localtwins_module), which measures
+traversal, parsing and logging without any HTTP.
+
+Results are compared to stored baselines in benchmarks/baseline.yaml
+if the file exists.
+
+Usage examples:
+    python3 benchmark.py
+    python3 benchmark.py --samples 10 --save-baseline
+    python3 benchmark.py --registry-concurrency 1 50 --network-trees 2x3 3x3
+    python3 benchmark.py --network-modes strict pipeline speculative bulk
+    python3 benchmark.py --local-twins twintree-<timestamp>
+
+"""
+
+import argparse, os, sys, tempfile, time, tracemalloc
+import yaml
+
+import measurement_module as meas
+import localtwins_module as localtwins
+import runplan_module as runplan
+from fake_twinbase_module import FakeTwinbase
+
+BASELINE_FILEPATH = os.path.join('benchmarks', 'baseline.yaml')
+
+
+def run_case(kind: str, backend: FakeTwinbase, dtids: list, resolutions: int, samples: int, mode='strict', local_twins=None) -> dict:
+    """
+    Runs one benchmark case for a number of samples.
+
+    Args:
+      kind: 'registry' or 'network'
+      backend: Running fake Twinbase serving the DTIDs, None for local twins
+      dtids: Origin DTIDs given to the measurement path
+      resolutions: Number of DT docs resolved in one sample
+      samples: Number of timed samples
+      mode: Traversal mode of the network path: 'strict' fetches children
+        after the parent, 'pipeline' as soon as they are parsed,
+        'speculative' also prefetches children of the previous sample and
+        'bulk' fetches the DT docs of children in bulk
+      local_twins: Twin folder to traverse from memory instead of the backend
+
+    Returns:
+      Dict of throughput, overhead and memory results
+    """
+    params = {'samples': samples, 'timeout_registry': 10.0, 'timeout_base': 10.0, 'dtids': dtids, 'local_twins': local_twins}
+    if kind == 'network':
+        params.update({'pipeline': mode in ('pipeline', 'speculative'), 'speculative_prefetch': mode == 'speculative',
+            'bulk_fetch': mode == 'bulk'})
+    params = runplan.RunParams(params, kind)
+    previous = []
+
+    def sample(log, number):
+        if kind == 'registry':
+            meas.get_multiple_dt_docs(params, log, number, show_time=False)
+        else:
+            tree = meas.start_loop_through_children(params, log, time.perf_counter(), number,
+                show_time=False, previous=previous[-1] if previous else None)
+            previous[:] = [tree]
+
+    durations = []
+    with tempfile.TemporaryFile('w') as log:
+        # Warm up once so that imports and socket setup are not measured
+        sample(log, 0)
+        for number in range(1, samples+1):
+            start = time.perf_counter()
+            sample(log, number)
+            durations.append(time.perf_counter() - start)
+
+        # Memory is traced in a separate sample as tracing slows execution
+        tracemalloc.start()
+        sample(log, samples+1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    durations.sort()
+    median = durations[len(durations)//2]
+    return {
+        'resolutions': resolutions,
+        'throughput': round(resolutions / median, 1),
+        'overhead_ms': round(median / resolutions * 1000, 4),
+        'memory_mb': round(peak / 1000000, 3),
+    }
+
+
+def benchmark_registry(concurrency: int, samples: int) -> dict:
+    """
+    Benchmarks get_multiple_dt_docs resolving a number of DTIDs concurrently.
+    """
+    with FakeTwinbase(depth=0, width=0, trees=concurrency) as backend:
+        return run_case('registry', backend, backend.origins, concurrency, samples)
+
+
+def benchmark_network(depth: int, width: int, trees: int, samples: int, mode='strict') -> dict:
+    """
+    Benchmarks start_loop_through_children traversing a number of trees concurrently.
+    """
+    with FakeTwinbase(depth=depth, width=width, trees=trees, bulk=mode == 'bulk') as backend:
+        return run_case('network', backend, backend.origins, len(backend.docs), samples, mode)
+
+
+def benchmark_local(folderpath: str, samples: int, mode='strict') -> dict:
+    """
+    Benchmarks start_loop_through_children traversing a local twin folder from memory.
+    """
+    twinbase = localtwins.load(folderpath)
+    return run_case('network', None, twinbase.origins(), len(twinbase.docs), samples, mode, local_twins=folderpath)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Prints comparison against baseline results.
+
+    Returns:
+      True if no case regressed more than the tolerance in throughput.
+    """
+    ok = True
+    print('\nComparison to baseline ' + BASELINE_FILEPATH + ':')
+    for case, result in results.items():
+        if case not in baseline:
+            print('  {:<28} no baseline'.format(case))
+            continue
+        ratio = result['throughput'] / baseline[case]['throughput']
+        status = 'ok'
+        if ratio < 1 - tolerance:
+            status = 'REGRESSION'
+            ok = False
+        print('  {:<28} throughput {:6.2f}x baseline  memory {:6.2f}x baseline  {}'.format(
+            case, ratio, result['memory_mb'] / max(baseline[case]['memory_mb'], 1e-9), status))
+    return ok
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the measurement client against a local zero-latency Twinbase.')
+    parser.add_argument('--samples', type=int, default=5, help='Timed samples per case')
+    parser.add_argument('--registry-concurrency', type=int, nargs='*', default=[1, 10, 100],
+        help='Numbers of DTIDs resolved concurrently in the registry path')
+    parser.add_argument('--network-trees', nargs='*', default=['2x2', '3x3', '4x4'],
+        help='Tree sizes as <depth>x<width> for the network path')
+    parser.add_argument('--network-concurrency', type=int, nargs='*', default=[1, 4],
+        help='Numbers of trees traversed concurrently in the network path')
+    parser.add_argument('--network-modes', nargs='*', default=['strict'], choices=['strict', 'pipeline', 'speculative', 'bulk'],
+        help='Traversal modes of the network path')
+    parser.add_argument('--local-twins', nargs='*', default=[],
+        help='Twin folders created by create-twins-tree.py to traverse from memory')
+    parser.add_argument('--save-baseline', action='store_true', help='Store results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative throughput drop')
+    args = parser.parse_args()
+
+    results = {}
+    for concurrency in args.registry_concurrency:
+        case = 'registry-c{}'.format(concurrency)
+        results[case] = benchmark_registry(concurrency, args.samples)
+        print('{:<28} {}'.format(case, results[case]))
+    for size in args.network_trees:
+        depth, width = [int(x) for x in size.split('x')]
+        for trees in args.network_concurrency:
+            for mode in args.network_modes:
+                case = 'network-{}-c{}'.format(size, trees) + ('' if mode == 'strict' else '-' + mode)
+                results[case] = benchmark_network(depth, width, trees, args.samples, mode)
+                print('{:<28} {}'.format(case, results[case]))
+    for folderpath in args.local_twins:
+        for mode in args.network_modes:
+            case = 'local-' + os.path.basename(os.path.normpath(folderpath)) + ('' if mode == 'strict' else '-' + mode)
+            results[case] = benchmark_local(folderpath, args.samples, mode)
+            print('{:<28} {}'.format(case, results[case]))
+
+    ok = True
+    if os.path.exists(BASELINE_FILEPATH):
+        with open(BASELINE_FILEPATH, 'r') as yamlfile:
+            baseline = yaml.load(yamlfile, Loader=yaml.FullLoader)
+        ok = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_FILEPATH), exist_ok=True)
+        with open(BASELINE_FILEPATH, 'w') as yamlfile:
+            yaml.dump(results, yamlfile, default_flow_style=False, sort_keys=False)
+        print('\nSaved baseline to ' + BASELINE_FILEPATH)
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,125 @@
+"""
+Bulk fetching of the DT docs of twins hosted on the same Twinbase.
+
+Fetching the children of a twin takes one /index.json request per child.
+A Twinbase may advertise a bulk endpoint with the Bulk-Docs header of its
+DT doc responses, e.g. "Bulk-Docs: /bulk.json". The DT docs of twins
+<id1>, <id2>, ... are then fetched with one request to
+<base>/bulk.json?ids=<id1>,<id2>,... which returns a JSON object of the
+DT docs by twin id. Twin ids are the last path segment of hosting URLs.
+
+install() makes the base fetches of an event loop record the advertised
+endpoints and the fetch times of single DT docs, against which the
+latency saved by bulk fetches is estimated.
+"""
+import asyncio, statistics
+
+BULK_HEADER = 'bulk-docs'
+MAX_IDS = 100               # Twin ids in one bulk request
+
+
+def origin_of(url: str) -> str:
+    """
+    Scheme and network location of a URL, e.g. https://example.org
+    """
+    scheme, rest = url.split('://', 1)
+    return scheme + '://' + rest.split('/', 1)[0]
+
+
+def twin_id_of(url: str) -> str:
+    """
+    Twin id of a hosting URL, i.e. its last path segment.
+    """
+    return url.rstrip('/').rsplit('/', 1)[1]
+
+
+def header_bytes(response) -> int:
+    """
+    Approximate size of the status line and headers of an HTTP/1.1 response.
+    """
+    return len('HTTP/1.1 200 OK\r\n\r\n') + sum(len(str(name)) + len(str(value)) + 4
+        for name, value in response.headers.items())
+
+
+class BulkFetcher:
+    """
+    Bulk endpoints and single DT doc fetch times of the Twinbases seen by an event loop.
+
+    Attributes:
+      endpoints: Path of the bulk endpoint by Twinbase origin
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self._single_times = {}
+
+    def observe(self, url: str, response, duration=None):
+        """
+        Records the bulk endpoint advertised by a response and the fetch
+        time (s) of a single DT doc.
+        """
+        origin = origin_of(url)
+        path = response.headers.get(BULK_HEADER)
+        if path:
+            self.endpoints[origin] = '/' + path.lstrip('/')
+        if duration is not None and url.endswith('/index.json'):
+            self._single_times.setdefault(origin, []).append(duration)
+
+    def endpoint(self, hosting_url: str):
+        """
+        Returns:
+          Path of the bulk endpoint of the Twinbase of a hosting URL, None if not advertised.
+        """
+        return self.endpoints.get(origin_of(hosting_url))
+
+    def bulk_urls(self, hosting_urls: list) -> list:
+        """
+        Groups hosting URLs into bulk requests.
+
+        Only Twinbases with a bulk endpoint and at least two of the hosting
+        URLs are grouped.
+
+        Returns:
+          List of tuples of bulk request URL and the hosting URLs it fetches
+        """
+        groups = {}
+        for url in hosting_urls:
+            if self.endpoint(url) is not None:
+                groups.setdefault(origin_of(url), []).append(url)
+        requests = []
+        for origin, urls in groups.items():
+            if len(urls) < 2:
+                continue
+            for i in range(0, len(urls), MAX_IDS):
+                batch = urls[i:i+MAX_IDS]
+                ids = ','.join(twin_id_of(url) for url in batch)
+                requests.append((origin + self.endpoints[origin] + '?ids=' + ids, batch))
+        return requests
+
+    def single_fetch_time(self, url: str):
+        """
+        Returns:
+          Median fetch time (s) of single DT docs from the Twinbase of a URL, None if none fetched.
+        """
+        times = self._single_times.get(origin_of(url))
+        return statistics.median(times) if times else None
+
+
+def install(loop) -> BulkFetcher:
+    """
+    Makes measurements running in an event loop fetch DT docs in bulk from
+    Twinbases that advertise a bulk endpoint.
+    """
+    loop.bulk_fetcher = BulkFetcher()
+    return loop.bulk_fetcher
+
+
+def running_fetcher():
+    """
+    Returns:
+      BulkFetcher installed to the running event loop, None if not installed.
+    """
+    try:
+        return getattr(asyncio.get_running_loop(), 'bulk_fetcher', None)
+    except RuntimeError:
+        return None
@@ -0,0 +1,134 @@
+""" Compares network measurements over HTTP/1.1 and HTTP/2.
+
+Traverses the same twin trees alternately with base fetches over HTTP/1.1
+and over HTTP/2, so that both protocols see the same network conditions,
+and reports tree fetch times and connections used by each protocol.
+
+By default the trees of the network measurements in params.yaml are used.
+With --local, a generated tree is served by a local stand-in Twinbase
+(fake_twinbase_module) that serves both HTTP/1.1 and HTTP/2 with prior
+knowledge, optionally with added latency per request.
+
+Needs the optional h2 package.
+
+Usage examples:
+    python3 compare_http2.py
+    python3 compare_http2.py --samples 20 --csv http2.csv
+    python3 compare_http2.py --local 3x4 --latency 0.02
+
+"""
+
+import argparse, csv, io, sys, time
+
+import measurement_module as meas
+import runplan_module as runplan
+from fake_twinbase_module import FakeTwinbase
+
+PROTOCOLS = ['HTTP/1.1', 'HTTP/2']
+
+
+def measure_sample(params: runplan.RunParams, http2: bool, backend=None) -> dict:
+    """
+    Traverses the trees of a network measurement once.
+
+    Args:
+      backend: Local FakeTwinbase serving the trees, if any, to count
+        the connections of both protocols
+
+    Returns:
+      Dict of tree fetch time (s), DT docs fetched and base connections opened
+    """
+    params = runplan.RunParams(dict(params.to_dict(), http2=http2), 'network')
+    before = dict(backend.connections) if backend is not None else None
+    log = io.StringIO()
+    start = time.perf_counter()
+    tree = meas.start_loop_through_children(params, log, start, 1, show_time=False)
+    duration = time.perf_counter() - start
+
+    connections = None
+    if backend is not None:
+        connections = sum(backend.connections[protocol] - before[protocol] for protocol in PROTOCOLS)
+    elif http2:
+        for row in csv.reader(io.StringIO(log.getvalue())):
+            if len(row) >= 4 and row[2] == 'HTTP/2 connections opened':
+                connections = int(row[3])
+    return {'duration': duration, 'docs': len(tree), 'connections': connections}
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values)-1, int(round(q / 100 * (len(values)-1))))]
+
+
+def compare(name: str, params: runplan.RunParams, samples: int, backend=None, writer=None) -> dict:
+    """
+    Measures a network measurement alternately over both protocols and prints a report.
+
+    Returns:
+      Dict of results by protocol
+    """
+    results = {protocol: [] for protocol in PROTOCOLS}
+    # Warm up once so that imports and name resolution are not measured
+    for protocol in PROTOCOLS:
+        measure_sample(params, protocol == 'HTTP/2', backend)
+    for number in range(1, samples+1):
+        for protocol in PROTOCOLS:
+            result = measure_sample(params, protocol == 'HTTP/2', backend)
+            results[protocol].append(result)
+            if writer is not None:
+                writer.writerow([name, protocol, number, '{:4.6f}'.format(result['duration']),
+                    result['docs'], '' if result['connections'] is None else result['connections']])
+
+    print('\n' + name)
+    print('  {:<10} {:>12} {:>12} {:>8} {:>12}'.format('Protocol', 'median (s)', 'p90 (s)', 'docs', 'connections'))
+    for protocol in PROTOCOLS:
+        durations = [result['duration'] for result in results[protocol]]
+        connections = [result['connections'] for result in results[protocol] if result['connections'] is not None]
+        print('  {:<10} {:>12.4f} {:>12.4f} {:>8} {:>12}'.format(protocol,
+            percentile(durations, 50), percentile(durations, 90), results[protocol][-1]['docs'],
+            percentile(connections, 50) if connections else '-'))
+    median_1 = percentile([result['duration'] for result in results['HTTP/1.1']], 50)
+    median_2 = percentile([result['duration'] for result in results['HTTP/2']], 50)
+    print('  HTTP/2 median is {:.2f}x the HTTP/1.1 median'.format(median_2 / median_1))
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare network measurements over HTTP/1.1 and HTTP/2.')
+    parser.add_argument('--samples', type=int, default=10, help='Samples per protocol')
+    parser.add_argument('--local', metavar='DEPTHxWIDTH', help='Measure a generated tree served locally')
+    parser.add_argument('--trees', type=int, default=1, help='Number of local trees')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency (s) added to each local request')
+    parser.add_argument('--csv', help='Write the samples to a CSV file')
+    args = parser.parse_args()
+
+    if meas.http2.h2 is None:
+        print('HTTP/2 needs the h2 package: pip install h2')
+        sys.exit(1)
+
+    csvfile = open(args.csv, 'w', newline='') if args.csv else None
+    writer = None
+    if csvfile is not None:
+        writer = csv.writer(csvfile, lineterminator='\n')
+        writer.writerow(['Measurement', 'Protocol', 'Number', 'Duration', 'Docs', 'Connections'])
+
+    try:
+        if args.local:
+            depth, width = [int(x) for x in args.local.split('x')]
+            with FakeTwinbase(depth, width, trees=args.trees, latency=args.latency, http2=True) as backend:
+                params = runplan.RunParams({'samples': args.samples, 'timeout_registry': 10.0,
+                    'timeout_base': 10.0, 'dtids': backend.origins}, 'network')
+                compare('local-' + args.local, params, args.samples, backend, writer)
+        else:
+            try:
+                plan = runplan.load_plan()
+            except runplan.PlanError as e:
+                print('Invalid parameter file:\n' + str(e))
+                sys.exit(1)
+            for key, params in plan.network.items():
+                compare(key, params, args.samples, writer=writer)
+    finally:
+        if csvfile is not None:
+            csvfile.close()
+            print('\nSamples written to ' + args.csv)
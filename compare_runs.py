@@ -0,0 +1,87 @@
+""" Compares measurement runs and flags latency regressions.
+
+Indexes all runs in "measurements/<foldername>" into "measurements/<foldername>/index.csv"
+(only runs not yet indexed or changed since are read) and compares the latest run to earlier runs.
+
+Arguments:
+    foldername: Measurement folder name, read from the parameter file by default.
+    --candidate: Run to check, the latest run by default.
+    --baseline: Run to compare against. By default the runs preceding the candidate.
+    --baseline-runs: Number of preceding runs pooled as the baseline, 1 by default.
+
+Usage examples:
+    python3 compare_runs.py
+    python3 compare_runs.py test_runs --baseline-runs 10 --alpha 0.001
+
+"""
+
+import argparse, os, sys
+import yaml
+import analysis_module as analysis
+
+parser = argparse.ArgumentParser(description='Compare measurement runs and flag latency regressions.')
+parser.add_argument('foldername', nargs='?', help='Measurement folder name under measurements/')
+parser.add_argument('--candidate', help='Run to check, latest by default')
+parser.add_argument('--baseline', help='Run to compare against')
+parser.add_argument('--baseline-runs', type=int, default=1, help='Number of preceding runs pooled as baseline')
+parser.add_argument('--alpha', type=float, default=0.01, help='Significance level')
+parser.add_argument('--min-change', type=float, default=0.1, help='Minimum relative growth of median')
+parser.add_argument('--all', action='store_true', help='Print all compared groups, not only regressions')
+args = parser.parse_args()
+
+# Read foldername from current params.yaml
+foldername = args.foldername
+if foldername is None:
+    try:
+        with open('params.yaml', 'r') as yamlfile:
+            params = yaml.load(yamlfile, Loader=yaml.FullLoader)
+    except:
+        print('Could not open params.yaml, using params-example.yaml instead.')
+        with open('params-example.yaml', 'r') as yamlfile:
+            params = yaml.load(yamlfile, Loader=yaml.FullLoader)
+    foldername = params['foldername']
+folderpath = os.path.join('measurements', foldername)
+
+
+##### Index #####
+
+print('Indexed ' + str(analysis.index_runs(folderpath)) + ' new or changed runs in ' + folderpath)
+runs = analysis.indexed_runs(folderpath)
+if len(runs) < 2:
+    print('At least two runs are needed for comparison.')
+    sys.exit(0)
+
+
+##### Compare #####
+
+candidate = args.candidate or runs[-1]
+if args.baseline:
+    baseline = [args.baseline]
+else:
+    preceding = [run for run in runs if run < candidate]
+    baseline = preceding[-args.baseline_runs:]
+if candidate not in runs or not baseline or not set(baseline) <= set(runs):
+    print('Could not find the runs to compare in ' + folderpath)
+    sys.exit(1)
+
+print('\nCandidate: ' + candidate)
+print('Baseline: ' + ', '.join(baseline) + '\n')
+rows = analysis.read_index(folderpath, set(baseline) | {candidate})
+results = analysis.find_regressions(
+    [row for row in rows if row['Run'] in baseline],
+    [row for row in rows if row['Run'] == candidate],
+    alpha=args.alpha, min_change=args.min_change)
+
+regressions = 0
+for result in results:
+    if result['regression']:
+        regressions += 1
+    elif not args.all:
+        continue
+    print('{:<10} {:<32} {:<30} {:<28} median {:8.4f} s -> {:8.4f} s ({:+6.1%}) D={:.3f} p={:.2g}'.format(
+        'REGRESSION' if result['regression'] else 'ok',
+        result['measurement'], result['key'][-30:], result['event'],
+        result['baseline_p50'], result['candidate_p50'], result['change'], result['d'], result['p']))
+
+print('\n' + str(regressions) + ' regressions in ' + str(len(results)) + ' compared groups.')
+sys.exit(1 if regressions else 0)
@@ -0,0 +1,124 @@
+""" Coordinates measurements of Digital Twin Web over several workers.
+
+Distributes the samples of the measurement runs defined in params.yaml to
+workers started with worker.py, starts each run at the same moment on all
+workers and merges the logs of the workers.
+
+Results are written to a new folder "measurements/<foldername>/measurements-<timestamp>"
+with the same structure as run_measurements.py. Each run folder has:
+    main_log.csv: Rows of all workers ordered by timestamp, with a Worker column
+    workers/<worker>.csv: Measurement log of each worker
+
+Arguments:
+    --workers: Number of workers to wait for before measuring.
+    --local-workers: Number of workers to start on this host.
+    --replicate: Every worker measures all samples instead of a share of them.
+    --connect-timeout: Seconds to wait for all workers to connect.
+
+Usage examples:
+    python3 coordinator.py --local-workers 4
+    python3 coordinator.py --address 0.0.0.0 --port 9470 --workers 3 --replicate
+
+"""
+
+import argparse, os, sys, time
+from datetime import datetime, timezone
+import yaml
+import distributed_module as distributed
+import runplan_module as runplan
+import measurement_module as meas
+import monitoring_module as monitor
+import plotting_module as plot
+
+parser = argparse.ArgumentParser(description='Coordinate measurements over several workers.')
+parser.add_argument('--address', default='127.0.0.1', help='Address to listen on for workers')
+parser.add_argument('--port', type=int, default=9470, help='TCP port to listen on for workers')
+parser.add_argument('--workers', type=int, default=0, help='Number of remote workers to wait for')
+parser.add_argument('--local-workers', type=int, default=0, help='Number of workers to start on this host')
+parser.add_argument('--replicate', action='store_true', help='Every worker measures all samples')
+parser.add_argument('--start-delay', type=float, default=2.0, help='Seconds from sending a run to its start')
+parser.add_argument('--connect-timeout', type=float, default=300.0, help='Seconds to wait for all workers to connect')
+args = parser.parse_args()
+
+if args.workers + args.local_workers < 1:
+    print('Give the number of workers with --workers or --local-workers.')
+    sys.exit(1)
+
+measurement_starttime = time.perf_counter()
+
+
+##### Prepare measurement #####
+
+# Validate parameters before any worker measures anything
+try:
+    plan = runplan.load_plan()
+except runplan.PlanError as e:
+    print('\nCould not use parameters, please check them. Exiting.\n' + str(e))
+    sys.exit(1)
+params = plan.params
+
+foldername_measurements = os.path.join('measurements', plan.foldername)
+folderpath = os.path.join(foldername_measurements, 'measurements-' + datetime.now(timezone.utc).isoformat()[:-13])
+os.makedirs(folderpath)
+print('\nWriting to folder: ' + folderpath + '\n')
+
+with open (os.path.join(folderpath, 'params.yaml'), 'w') as yamlfile:
+    yaml.dump(params, yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+# Measurement runs as (kind, name, run parameters, folder)
+folders = {'registry': 'registry_measurement', 'network': 'network_measurements', 'race': 'race_measurements'}
+runs = []
+for kind, key, run_params in plan.runs():
+    if kind == 'registry':
+        runs.append((kind, key, run_params, os.path.join(folderpath, folders[kind])))
+    else:
+        runs.append((kind, key, run_params, os.path.join(folderpath, folders[kind], key)))
+
+
+##### Connect workers #####
+
+coordinator = distributed.Coordinator(args.address, args.port)
+coordinator.start_local_workers(args.local_workers)
+print('Waiting for ' + str(args.workers + args.local_workers) + ' workers on port ' + str(coordinator.port))
+try:
+    coordinator.accept_workers(args.workers + args.local_workers, timeout=args.connect_timeout)
+except (TimeoutError, ConnectionError) as e:
+    print('\nCould not connect workers: ' + str(e) + '. Exiting.')
+    for process in coordinator.processes:
+        process.kill()
+    coordinator.close()
+    sys.exit(1)
+
+
+#####  Run measurements #####
+
+try:
+    for kind, key, run_params, run_folderpath in runs:
+        print('\n---- Running ' + kind + ' measurement: ' + key + ' ----\n')
+        os.makedirs(run_folderpath)
+        with open (os.path.join(run_folderpath, 'params.yaml'), 'w') as yamlfile:
+            yaml.dump(run_params.to_dict(), yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
+        filepath = coordinator.run(kind, key, run_params, run_folderpath,
+            replicate=args.replicate, start_delay=args.start_delay)
+
+        print('Plotting ' + filepath)
+        if kind == 'registry':
+            plot.plot_registry_fetch_times(filepath, run_folderpath, run_params.dtids)
+        elif kind == 'network':
+            plot.plot_network_fetch_times(filepath, run_folderpath, run_params.domains[run_params.dtids[0]])
+        else:
+            meas.summarize_race_measurement(filepath, run_folderpath, run_params)
+finally:
+    coordinator.close()
+
+
+#####  Postprocess #####
+
+latestpath = os.path.join(foldername_measurements, 'latest')
+monitor.update_latest(folderpath, latestpath)
+print('\nUpdated ' + latestpath + ' to point to this measurement')
+
+print('\nMeasurement finished, see this folder for results:')
+print(folderpath)
+
+print('\nThis measurement took ' + str(int(round(time.perf_counter() - measurement_starttime))) + ' seconds in total.' )
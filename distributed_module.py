@@ -0,0 +1,334 @@
+"""
+Coordination of measurements over several worker processes or hosts.
+
+A coordinator distributes the samples of each measurement run to workers,
+starts them at the same moment and merges the logs returned by the workers
+into one main log. The workers may run on different hosts to measure from
+several vantage points.
+
+Messages are JSON objects, one per line, over a TCP connection that each
+worker opens to the coordinator:
+    worker -> coordinator: {"type": "hello", "name": <worker name>}
+    worker -> coordinator: {"type": "sync"}, answered with the coordinator
+        clock as {"type": "sync", "time": <s since epoch>}
+    worker -> coordinator: {"type": "ready", "offset": <coordinator clock - worker clock (s)>}
+    coordinator -> worker: {"type": "task", "kind": "registry", "network" or "race",
+        "key": <run name>, "params": <run parameters>, "numbers": <sample numbers>,
+        "start_at": <start time in coordinator clock (s since epoch)>}
+    worker -> coordinator: {"type": "result", "key": <run name>, "log": <main log>}
+    coordinator -> worker: {"type": "done"}
+"""
+import csv, io, json, os, re, socket, subprocess, sys, tempfile, time
+
+import measurement_module as meas
+import retry_module as retry
+import runplan_module as runplan
+import statistics_module as stats
+
+# Clock synchronization round trips per worker, the fastest is used
+SYNC_ROUNDS = 8
+
+# Column appended to merged main logs
+WORKER_COLUMN = 'Worker'
+
+# Seconds between checks of local worker processes while waiting for workers to connect
+POLL_INTERVAL = 1.0
+
+# Seconds a connected worker may take to introduce itself and synchronize its clock
+HANDSHAKE_TIMEOUT = 30.0
+
+# Seconds of silence after which a worker connection is probed, and the probes
+# sent before the connection is considered lost, e.g. when the worker host goes down
+KEEPALIVE_IDLE = 10
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_PROBES = 3
+
+
+def send_message(stream, message: dict):
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+
+def receive_message(stream) -> dict:
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('Connection closed')
+    return json.loads(line)
+
+
+def enable_keepalive(connection):
+    """
+    Makes reads from a connection fail instead of waiting forever if the peer disappears.
+    """
+    connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Not available on all platforms, the system defaults are used there
+    for option, value in (('TCP_KEEPIDLE', KEEPALIVE_IDLE), ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+            ('TCP_KEEPCNT', KEEPALIVE_PROBES)):
+        if hasattr(socket, option):
+            connection.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def shard_samples(samples: int, workers: int, replicate=False) -> list:
+    """
+    Divides sample numbers between workers.
+
+    Args:
+      samples: Number of samples in the run
+      workers: Number of workers
+      replicate: If True, every worker measures all samples, e.g. to compare
+        vantage points. Otherwise the samples are divided round-robin.
+
+    Returns:
+      List of lists of sample numbers, one per worker
+    """
+    if replicate:
+        return [list(range(1, samples+1)) for _ in range(workers)]
+    return [list(range(worker+1, samples+1, workers)) for worker in range(workers)]
+
+
+def merge_worker_logs(logs: dict, offsets: dict, filepath: str) -> int:
+    """
+    Merges main logs of workers into one main log ordered by timestamp.
+
+    Timestamps are moved to the coordinator clock and the name of the worker
+    is appended to each row. Rows without a timestamp are left out.
+
+    Args:
+      logs: Dict of main log contents by worker name
+      offsets: Dict of clock offsets (s) by worker name
+      filepath: Path to the merged main log
+
+    Returns:
+      Number of merged rows
+    """
+    timestamp_index = len(stats.LOG_COLUMNS)
+    rows = []
+    for name, log in logs.items():
+        offset_ns = int(round(offsets.get(name, 0) * 1e9))
+        for row in csv.reader(io.StringIO(log)):
+            if len(row) > timestamp_index and row[0] != 'Time':
+                row = row[:timestamp_index] + [int(row[timestamp_index]) + offset_ns, name]
+                rows.append(row)
+    rows.sort(key=lambda row: row[timestamp_index])
+    with open(filepath, 'w', newline='') as logfile:
+        writer = csv.writer(logfile, lineterminator='\n')
+        writer.writerow(stats.LOG_COLUMNS + [stats.TIMESTAMP_COLUMN, WORKER_COLUMN])
+        writer.writerows(rows)
+    return len(rows)
+
+
+class Coordinator:
+    """
+    Accepts worker connections and distributes measurement runs to them.
+
+    Args:
+      address: Address to listen on
+      port: TCP port to listen on, 0 for any free port
+
+    Attributes:
+      processes: Local worker processes started by start_local_workers()
+    """
+
+    def __init__(self, address='127.0.0.1', port=0):
+        self._server = socket.create_server((address, port))
+        self.port = self._server.getsockname()[1]
+        self.workers = {}
+        self.offsets = {}
+        self.processes = []
+
+    def start_local_workers(self, count: int):
+        """
+        Starts workers on this host as child processes that connect to the coordinator.
+        """
+        workerpath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker.py')
+        for _ in range(count):
+            self.processes.append(subprocess.Popen([sys.executable, workerpath,
+                '127.0.0.1:' + str(self.port), '--name', 'local-' + str(len(self.processes)+1)]))
+
+    def _check_processes(self):
+        for process in self.processes:
+            if process.poll() is not None:
+                raise ConnectionError('Local worker exited with code ' + str(process.returncode) + ' before connecting')
+
+    def accept_workers(self, count: int, timeout=None):
+        """
+        Waits until a number of workers have connected and synchronized their clocks.
+
+        Args:
+          timeout: Time (s) to wait for all workers, None to wait until they connect
+
+        Raises:
+          TimeoutError: If the workers did not connect in time.
+          ConnectionError: If a local worker exited before connecting.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._server.settimeout(POLL_INTERVAL)
+        while len(self.workers) < count:
+            self._check_processes()
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(str(len(self.workers)) + ' of ' + str(count) + ' workers connected in ' + str(timeout) + ' s')
+            try:
+                connection, address = self._server.accept()
+            except socket.timeout:
+                continue
+            connection.settimeout(HANDSHAKE_TIMEOUT)
+            stream = connection.makefile('rw', encoding='utf-8', newline='\n')
+            try:
+                hello = receive_message(stream)
+                name = hello['name']
+                while name in self.workers:
+                    name += '_'
+                while True:
+                    message = receive_message(stream)
+                    if message['type'] == 'sync':
+                        send_message(stream, {'type': 'sync', 'time': time.time()})
+                    elif message['type'] == 'ready':
+                        break
+            except (OSError, ValueError, KeyError) as e:
+                print('Worker from ' + address[0] + ' failed to connect: ' + repr(e))
+                connection.close()
+                continue
+            connection.settimeout(None)
+            enable_keepalive(connection)
+            self.workers[name] = (connection, stream)
+            self.offsets[name] = message['offset']
+            print('Worker ' + name + ' connected from ' + address[0]
+                + ' with clock offset {:4.6f} s'.format(message['offset']))
+
+    def run(self, kind: str, key: str, params: dict, folderpath: str, replicate=False, start_delay=2.0) -> str:
+        """
+        Runs one measurement run on all workers and merges their logs.
+
+        Worker logs are written to <folderpath>/workers/<worker>.csv and the
+        merged log to <folderpath>/main_log.csv.
+
+        Args:
+          kind: 'registry', 'network' or 'race'
+          key: Name of the run
+          params: RunParams or dict of run parameters
+          replicate: If True, every worker measures all samples
+          start_delay: Time (s) given to workers to receive the task before
+            the synchronized start
+
+        Returns:
+          Path to the merged main log
+        """
+        params = runplan.as_run_params(params, kind)
+        names = list(self.workers)
+        shards = shard_samples(params.samples, len(names), replicate)
+        start_at = time.time() + start_delay
+        for name, numbers in zip(names, shards):
+            send_message(self.workers[name][1], {'type': 'task', 'kind': kind, 'key': key,
+                'params': params.to_dict(), 'numbers': numbers, 'start_at': start_at})
+
+        folderpath_workers = os.path.join(folderpath, 'workers')
+        os.makedirs(folderpath_workers, exist_ok=True)
+        logs = {}
+        for name in names:
+            try:
+                result = receive_message(self.workers[name][1])
+            except (ConnectionError, OSError) as e:
+                print('Lost worker ' + name + ': ' + str(e))
+                del self.workers[name]
+                continue
+            logs[name] = result['log']
+            filename = re.sub(r'[^\w.-]', '_', name) + '.csv'
+            with open(os.path.join(folderpath_workers, filename), 'w') as logfile:
+                logfile.write(result['log'])
+
+        filepath = os.path.join(folderpath, 'main_log.csv')
+        count = merge_worker_logs(logs, self.offsets, filepath)
+        print('Merged ' + str(count) + ' rows from ' + str(len(logs)) + ' workers to ' + filepath)
+        return filepath
+
+    def close(self):
+        """
+        Tells the workers that the measurements are done and waits for local workers to exit.
+        """
+        for connection, stream in self.workers.values():
+            try:
+                send_message(stream, {'type': 'done'})
+            except OSError:
+                pass
+            connection.close()
+        self.workers = {}
+        self._server.close()
+        for process in self.processes:
+            try:
+                process.wait(timeout=HANDSHAKE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
+
+
+def synchronize_clock(stream) -> float:
+    """
+    Estimates the offset of the coordinator clock from the local clock.
+
+    Returns:
+      Offset (s) to add to local time to get coordinator time
+    """
+    best_rtt, offset = None, 0.0
+    for _ in range(SYNC_ROUNDS):
+        sent = time.time()
+        send_message(stream, {'type': 'sync'})
+        coordinator_time = receive_message(stream)['time']
+        received = time.time()
+        if best_rtt is None or received - sent < best_rtt:
+            best_rtt = received - sent
+            offset = coordinator_time - (sent + received) / 2
+    return offset
+
+
+def measure_shard(kind: str, params: dict, numbers: list, filepath: str):
+    """
+    Measures the given samples of a run to a main log.
+    """
+    params = runplan.as_run_params(params, kind)
+    # Retry and hedging policy keeps attempt durations over samples
+    policy = retry.RequestPolicy.from_params(params)
+    previous = None
+    for number in numbers:
+        print('Sample ' + str(number) + ' / ' + str(params.samples))
+        time.sleep(0.2)
+        if kind == 'registry':
+            meas.init_registry_measurement(params, filepath, number, policy=policy)
+        elif kind == 'network':
+            previous = meas.init_network_measurement(params, filepath, number, previous=previous)
+        else:
+            meas.init_race_measurement(params, filepath, number, policy=policy)
+
+
+def run_worker(host: str, port: int, name: str):
+    """
+    Connects to a coordinator and measures the tasks it sends until done.
+    """
+    with socket.create_connection((host, port)) as connection:
+        stream = connection.makefile('rw', encoding='utf-8', newline='\n')
+        send_message(stream, {'type': 'hello', 'name': name})
+        offset = synchronize_clock(stream)
+        send_message(stream, {'type': 'ready', 'offset': offset})
+        print('Connected to coordinator at ' + host + ':' + str(port) + ' with clock offset {:4.6f} s'.format(offset))
+
+        while True:
+            try:
+                message = receive_message(stream)
+            except ConnectionError:
+                print('Coordinator closed the connection')
+                return
+            if message['type'] == 'done':
+                return
+            print('\n-- Running ' + message['kind'] + ' measurement: ' + message['key']
+                + ' (' + str(len(message['numbers'])) + ' samples)')
+            with tempfile.TemporaryDirectory() as folderpath:
+                filepath = os.path.join(folderpath, 'main_log.csv')
+                # Start at the same moment as the other workers
+                delay = message['start_at'] - offset - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                measure_shard(message['kind'], message['params'], message['numbers'], filepath)
+                log = ''
+                if os.path.exists(filepath):
+                    with open(filepath, 'r') as logfile:
+                        log = logfile.read()
+            send_message(stream, {'type': 'result', 'key': message['key'], 'log': log})
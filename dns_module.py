@@ -0,0 +1,292 @@
+"""
+Asynchronous DNS resolution with an in-process cache.
+
+HTTP clients running on asyncio resolve host names with the getaddrinfo()
+method of the event loop, which runs the blocking socket.getaddrinfo() in a
+small thread pool. install() replaces that method of an event loop with a
+resolver that queries the DNS server directly over UDP, caches the answers
+for their TTL and shares one query between concurrent lookups of a host.
+
+Names that cannot be resolved directly (e.g. names in /etc/hosts or names
+needing search domains) fall back to socket.getaddrinfo() and are cached
+for DEFAULT_TTL seconds.
+"""
+import asyncio, ipaddress, random, socket, struct, time
+
+DEFAULT_TTL = 60            # Cache time (s) of answers without a TTL
+QUERY_TIMEOUT = 2.0         # Timeout (s) of one DNS query
+RESOLV_CONF = '/etc/resolv.conf'
+HOSTS = '/etc/hosts'
+
+_TYPE_A = 1
+_TYPE_AAAA = 28
+
+
+def _read_nameservers(filepath=RESOLV_CONF) -> list:
+    nameservers = []
+    try:
+        with open(filepath, 'r') as conffile:
+            for line in conffile:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == 'nameserver':
+                    nameservers.append(parts[1])
+    except OSError:
+        pass
+    return nameservers
+
+
+def _read_hosts(filepath=HOSTS) -> set:
+    names = set()
+    try:
+        with open(filepath, 'r') as hostsfile:
+            for line in hostsfile:
+                names.update(line.split('#')[0].split()[1:])
+    except OSError:
+        pass
+    return names
+
+
+def _build_query(query_id: int, host: str, record_type: int) -> bytes:
+    # Header: id, flags (recursion desired), 1 question, 0 answers, 0 authority, 0 additional
+    query = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)
+    for label in host.rstrip('.').split('.'):
+        encoded = label.encode('idna')
+        query += bytes([len(encoded)]) + encoded
+    return query + b'\x00' + struct.pack('!HH', record_type, 1)
+
+
+def _skip_name(message: bytes, offset: int) -> int:
+    while True:
+        length = message[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            # Compressed name ends with a pointer
+            return offset + 2
+        offset += length + 1
+
+
+def _parse_response(message: bytes, query_id: int, record_type: int):
+    """
+    Returns:
+      Tuple of list of addresses and the smallest TTL of the answers
+
+    Raises:
+      OSError: If the response is an error, truncated or has no addresses.
+    """
+    response_id, flags, questions, answers = struct.unpack('!HHHH', message[:8])
+    if response_id != query_id:
+        raise OSError('DNS response id does not match the query')
+    if flags & 0x0200:
+        raise OSError('DNS response is truncated')
+    if flags & 0x000F:
+        raise OSError('DNS response code ' + str(flags & 0x000F))
+    offset = 12
+    for _ in range(questions):
+        offset = _skip_name(message, offset) + 4
+    addresses = []
+    ttl = None
+    for _ in range(answers):
+        offset = _skip_name(message, offset)
+        answer_type, _, answer_ttl, length = struct.unpack('!HHIH', message[offset:offset+10])
+        offset += 10
+        if answer_type == record_type:
+            family = socket.AF_INET if record_type == _TYPE_A else socket.AF_INET6
+            addresses.append(socket.inet_ntop(family, message[offset:offset+length]))
+            ttl = answer_ttl if ttl is None else min(ttl, answer_ttl)
+        offset += length
+    if not addresses:
+        raise OSError('No addresses in DNS response')
+    return addresses, ttl
+
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self):
+        self.response = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if not self.response.done():
+            self.response.set_result(data)
+
+    def error_received(self, exc):
+        if not self.response.done():
+            self.response.set_exception(exc)
+
+
+class DnsResolver:
+    """
+    Caching asynchronous DNS resolver.
+
+    Args:
+      nameservers: DNS server addresses, read from /etc/resolv.conf by default
+      default_ttl: Cache time (s) of addresses resolved with the fallback
+      min_ttl: Minimum cache time (s) of any address
+    """
+
+    def __init__(self, nameservers=None, default_ttl=DEFAULT_TTL, min_ttl=0):
+        self.nameservers = nameservers if nameservers is not None else _read_nameservers()
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self._hosts = _read_hosts()
+        self._cache = {}
+        self._pending = {}
+
+    def cached(self, host: str):
+        """
+        Returns:
+          List of cached addresses of a host, None if not cached or expired.
+        """
+        entry = self._cache.get(host)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    @property
+    def hosts(self) -> list:
+        """
+        Host names resolved so far.
+        """
+        return list(self._cache)
+
+    async def resolve(self, host: str) -> list:
+        """
+        Resolves the addresses of a host name.
+
+        Concurrent lookups of the same host share one query.
+
+        Returns:
+          List of IP addresses
+        """
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+        addresses = self.cached(host)
+        if addresses is not None:
+            return addresses
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(host)
+        if pending is None or pending.get_loop() is not loop:
+            pending = loop.create_task(self._lookup(host))
+            self._pending[host] = pending
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            if pending.done() and self._pending.get(host) is pending:
+                del self._pending[host]
+
+    async def _lookup(self, host: str) -> list:
+        addresses, ttl = None, self.default_ttl
+        if self.nameservers and '.' in host.rstrip('.') and host not in self._hosts:
+            for record_type in (_TYPE_A, _TYPE_AAAA):
+                try:
+                    addresses, ttl = await self._query(host, record_type)
+                    break
+                except (OSError, asyncio.TimeoutError, IndexError, struct.error):
+                    continue
+        if addresses is None:
+            infos = await asyncio.get_running_loop().run_in_executor(
+                None, socket.getaddrinfo, host, None, 0, socket.SOCK_STREAM)
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            ttl = self.default_ttl
+        self._cache[host] = (time.monotonic() + max(ttl, self.min_ttl), addresses)
+        return addresses
+
+    async def _query(self, host: str, record_type: int):
+        loop = asyncio.get_running_loop()
+        query_id = random.randrange(65536)
+        transport, protocol = await loop.create_datagram_endpoint(
+            _DnsProtocol, remote_addr=(self.nameservers[0], 53))
+        try:
+            transport.sendto(_build_query(query_id, host, record_type))
+            message = await asyncio.wait_for(protocol.response, QUERY_TIMEOUT)
+        finally:
+            transport.close()
+        return _parse_response(message, query_id, record_type)
+
+    async def getaddrinfo(self, host, port, *, family=0, type=0, proto=0, flags=0):
+        """
+        Replacement of asyncio loop.getaddrinfo() using the cache.
+        """
+        if isinstance(host, bytes):
+            host = host.decode('idna')
+        if host is None or flags & socket.AI_PASSIVE:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, socket.getaddrinfo, host, port, family, type, proto, flags)
+        infos = []
+        for address in await self.resolve(host):
+            address_family = socket.AF_INET6 if ':' in address else socket.AF_INET
+            if family not in (0, socket.AF_UNSPEC, address_family):
+                continue
+            sockaddr = (address, int(port or 0)) if address_family == socket.AF_INET else (address, int(port or 0), 0, 0)
+            infos.append((address_family, type or socket.SOCK_STREAM, proto or socket.IPPROTO_TCP, '', sockaddr))
+        if not infos:
+            raise socket.gaierror(socket.EAI_NONAME, 'No addresses for ' + host)
+        return infos
+
+    async def preresolve(self, hosts) -> dict:
+        """
+        Resolves host names concurrently, e.g. before timing starts.
+
+        Returns:
+          Dict of resolution times (s) by host name
+        """
+        async def timed(host):
+            start = time.perf_counter()
+            try:
+                await self.resolve(host)
+            except OSError as e:
+                print('Could not resolve host ' + host + ': ' + str(e))
+            return time.perf_counter() - start
+
+        hosts = list(dict.fromkeys(hosts))
+        durations = await asyncio.gather(*[timed(host) for host in hosts])
+        return dict(zip(hosts, durations))
+
+
+# Resolver shared by all event loops so that the cache persists over samples
+RESOLVER = None
+
+
+def install(loop, resolver=None) -> DnsResolver:
+    """
+    Makes an event loop resolve host names with a caching resolver.
+
+    Args:
+      loop: asyncio event loop
+      resolver: DnsResolver, the shared RESOLVER by default
+
+    Returns:
+      The installed DnsResolver
+    """
+    global RESOLVER
+    if resolver is None:
+        if RESOLVER is None:
+            RESOLVER = DnsResolver()
+        resolver = RESOLVER
+    loop.getaddrinfo = resolver.getaddrinfo
+    loop.dns_resolver = resolver
+    return resolver
+
+
+def running_resolver():
+    """
+    Returns:
+      DnsResolver installed to the running event loop, None if not installed.
+    """
+    try:
+        return getattr(asyncio.get_running_loop(), 'dns_resolver', None)
+    except RuntimeError:
+        return None
+
+
+def host_of(url: str) -> str:
+    """
+    Host name of a URL without port.
+    """
+    netloc = url.split('/')[2]
+    if netloc.startswith('['):
+        return netloc[1:netloc.index(']')]
+    return netloc.rsplit(':', 1)[0] if ':' in netloc else netloc
@@ -0,0 +1,142 @@
+"""
+Incremental parsing of DT docs received as a stream of bytes.
+
+Only the top-level "relations" array of a DT doc is decoded. Everything
+else is skipped without building Python objects, so that memory use does
+not depend on the size of embedded data in the DT doc.
+"""
+import codecs, json, re
+
+# Characters that change the parser state. Everything else is skipped.
+_STRUCTURAL = re.compile(r'[\[\]{}",:\\]')
+
+
+class DocTooLarge(Exception):
+    """
+    Raised when a DT doc exceeds the configured maximum size.
+    """
+    pass
+
+
+class ChildRelationParser:
+    """
+    Extracts child DTIDs from a JSON DT doc fed in chunks.
+
+    Each element of the top-level "relations" array is decoded separately
+    as soon as it has been received completely.
+
+    Args:
+      max_size: Maximum accepted size of the DT doc in bytes. None for no limit.
+
+    Example:
+      parser = ChildRelationParser(max_size=1000000)
+      async for chunk in response.body:
+          for child in parser.feed(chunk):
+              ...
+      parser.close()
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.size = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key = None
+        self._last_key = None
+        self._in_relations = False
+        self._capture = None
+
+    def feed(self, data: bytes) -> list:
+        """
+        Parses the next chunk of the DT doc.
+
+        Returns:
+          List of child DTIDs completed in this chunk.
+
+        Raises:
+          DocTooLarge: If the total size exceeds max_size.
+        """
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise DocTooLarge('DT doc is larger than ' + str(self.max_size) + ' bytes')
+        text = self._decoder.decode(data)
+        children = []
+        capture_start = 0 if self._capture is not None else None
+        key_start = 0 if self._key is not None else None
+        skip = -1
+        if self._escape:
+            skip = 0
+            self._escape = False
+
+        for match in _STRUCTURAL.finditer(text):
+            pos = match.start()
+            if pos == skip:
+                continue
+            char = match.group()
+
+            if self._in_string:
+                if char == '\\':
+                    if pos == len(text) - 1:
+                        self._escape = True
+                    skip = pos + 1
+                elif char == '"':
+                    self._in_string = False
+                    if key_start is not None:
+                        self._key += text[key_start:pos]
+                        self._last_key = json.loads('"' + self._key + '"')
+                        self._key = None
+                        key_start = None
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._expect_key = False
+                    self._key = ''
+                    key_start = pos + 1
+            elif char in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = char == '{'
+                elif self._depth == 2 and char == '[' and self._last_key == 'relations':
+                    self._in_relations = True
+                elif self._depth == 3 and char == '{' and self._in_relations:
+                    self._capture = ''
+                    capture_start = pos
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 2 and self._capture is not None:
+                    self._capture += text[capture_start:pos+1]
+                    self._add_child(self._capture, children)
+                    self._capture = None
+                    capture_start = None
+                elif self._depth == 1:
+                    self._in_relations = False
+            elif char == ',' and self._depth == 1:
+                self._expect_key = True
+
+        if self._capture is not None:
+            self._capture += text[capture_start:]
+        if self._key is not None:
+            self._key += text[key_start:]
+        return children
+
+    def close(self):
+        """
+        Checks that the whole DT doc was received.
+
+        Raises:
+          ValueError: If the DT doc ended before its top-level object was closed.
+        """
+        self._decoder.decode(b'', final=True)
+        if self._depth != 0 or self._in_string:
+            raise ValueError('DT doc ended unexpectedly')
+
+    @staticmethod
+    def _add_child(text, children):
+        relation = json.loads(text)
+        if relation.get('relationType') == 'child':
+            children.append(relation['dt-id'])
@@ -0,0 +1,248 @@
+"""
+Local stand-in for a DTID registry and a Twinbase server.
+
+Serves a generated twin tree from memory with zero added latency so that
+the measurement client itself can be benchmarked and tested without network.
+The base can also serve HTTP/2 with prior knowledge (h2c), which needs the
+optional h2 package, and a bulk endpoint returning several DT docs at once,
+see bulk_module.
+"""
+import json, random, socket, threading, time, urllib.parse, uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import h2.config, h2.connection, h2.events, h2.exceptions
+except ImportError:
+    h2 = None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _RegistryHandler(BaseHTTPRequestHandler):
+    """
+    Redirects /<twin-id> to the hosting URL of the twin like a DTID registry.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.twinbase.delay()
+        twin_id = self.path.strip('/')
+        if twin_id not in self.server.twinbase.docs:
+            self.send_error(404)
+            return
+        self.send_response(302)
+        self.send_header('Location', self.server.twinbase.base_url + twin_id)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _BaseHandler(BaseHTTPRequestHandler):
+    """
+    Serves the twin page at /<twin-id> and the DT doc at /<twin-id>/index.json
+
+    If the twinbase has bulk enabled, DT docs advertise the bulk endpoint
+    /bulk.json?ids=<twin-id>,<twin-id>,... with the Bulk-Docs header.
+
+    Connections starting with the HTTP/2 connection preface are served over
+    HTTP/2 if the twinbase has http2 enabled.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        twinbase = self.server.twinbase
+        http2 = twinbase.http2 and self.request.recv(3, socket.MSG_PEEK | socket.MSG_WAITALL) == b'PRI'
+        with twinbase.lock:
+            twinbase.connections['HTTP/2' if http2 else 'HTTP/1.1'] += 1
+        if http2:
+            self.handle_http2()
+        else:
+            super().handle()
+
+    def respond(self, path: str):
+        """
+        Returns:
+          Tuple of status, content type, body and extra headers of a response
+        """
+        twinbase = self.server.twinbase
+        path, _, query = path.partition('?')
+        parts = path.strip('/').split('/')
+        docs = twinbase.docs
+        if twinbase.bulk and parts == ['bulk.json']:
+            ids = urllib.parse.parse_qs(query).get('ids', [''])[0].split(',')
+            body = b'{' + b','.join(json.dumps(twin_id).encode() + b':' + docs[twin_id]
+                for twin_id in ids if twin_id in docs) + b'}'
+            return 200, 'application/json', body, []
+        if parts[0] not in docs:
+            return 404, 'text/plain', b'Not found', []
+        if len(parts) == 2 and parts[1] == 'index.json':
+            headers = [('Bulk-Docs', '/bulk.json')] if twinbase.bulk else []
+            return 200, 'application/json', docs[parts[0]], headers
+        return 200, 'text/html', b'<html><body>Twin ' + parts[0].encode() + b'</body></html>', []
+
+    def do_GET(self):
+        self.server.twinbase.delay()
+        status, content_type, body, headers = self.respond(self.path)
+        if status != 200:
+            self.send_error(status)
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_http2(self):
+        config = h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+        connection = h2.connection.H2Connection(config=config)
+        # Guards the connection state and the socket, notified when flow control windows open
+        window_open = threading.Condition()
+        with window_open:
+            connection.initiate_connection()
+            self.request.sendall(connection.data_to_send())
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                data = b''
+            with window_open:
+                if not data:
+                    window_open.notify_all()
+                    return
+                try:
+                    events = connection.receive_data(data)
+                    self.request.sendall(connection.data_to_send())
+                except (h2.exceptions.ProtocolError, OSError):
+                    return
+                for event in events:
+                    if isinstance(event, h2.events.RequestReceived):
+                        path = dict(event.headers)[':path']
+                        threading.Thread(target=self.respond_http2, daemon=True,
+                            args=(connection, window_open, event.stream_id, path)).start()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                window_open.notify_all()
+
+    def respond_http2(self, connection, window_open, stream_id, path):
+        self.server.twinbase.delay()
+        status, content_type, body, headers = self.respond(path)
+        try:
+            with window_open:
+                connection.send_headers(stream_id, [(':status', str(status)),
+                    ('content-type', content_type), ('content-length', str(len(body)))]
+                    + [(name.lower(), value) for name, value in headers])
+                self.request.sendall(connection.data_to_send())
+                while body:
+                    window = min(connection.local_flow_control_window(stream_id), connection.max_outbound_frame_size)
+                    if window <= 0:
+                        window_open.wait(1.0)
+                        continue
+                    connection.send_data(stream_id, body[:window], end_stream=len(body) <= window)
+                    self.request.sendall(connection.data_to_send())
+                    body = body[window:]
+        except (h2.exceptions.StreamClosedError, h2.exceptions.ProtocolError, OSError):
+            # Stream was reset or the connection closed
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTwinbase:
+    """
+    In-process DTID registry and Twinbase server for a set of twin trees.
+
+    The registry and the base are served from separate ports like in real
+    deployments, where registry and hosting domains differ.
+
+    Args:
+      depth: The depth of each tree, i.e. steps from origin to the leaves.
+      width: The number of children of each non-leaf twin.
+      trees: The number of separate trees, i.e. origin DTIDs.
+      latency: Delay of each response (s)
+      tail_probability: Probability of a response being delayed by tail_latency instead
+      tail_latency: Delay of slow responses (s)
+      http2: Serve HTTP/2 with prior knowledge from the base in addition to HTTP/1.1
+      bulk: Serve and advertise the bulk endpoint of the base
+
+    Attributes:
+      connections: Number of connections accepted by the base per protocol
+    """
+
+    def __init__(self, depth: int, width: int, trees=1, latency=0.0, tail_probability=0.0, tail_latency=0.0, http2=False, bulk=False):
+        if http2 and h2 is None:
+            raise ImportError('HTTP/2 needs the h2 package: pip install h2')
+        self.latency = latency
+        self.tail_probability = tail_probability
+        self.tail_latency = tail_latency
+        self.http2 = http2
+        self.bulk = bulk
+        self.lock = threading.Lock()
+        self.connections = {'HTTP/1.1': 0, 'HTTP/2': 0}
+        self.docs = {}
+        self.origins = []
+        self._registry = _Server(('127.0.0.1', 0), _RegistryHandler)
+        self._base = _Server(('localhost', 0), _BaseHandler)
+        for server in (self._registry, self._base):
+            server.twinbase = self
+        self.registry_url = 'http://127.0.0.1:{}/'.format(self._registry.server_port)
+        self.base_url = 'http://localhost:{}/'.format(self._base.server_port)
+        for _ in range(trees):
+            self.origins.append(self._create_tree(depth, width, parent='http://d-t.fi/juuso'))
+
+    def _create_tree(self, depth, width, parent):
+        twin_id = str(uuid.uuid4())
+        dtid = self.registry_url + twin_id
+        relations = [{'dt-id': parent, 'relationType': 'parent'}]
+        if depth > 0:
+            for _ in range(width):
+                child = self._create_tree(depth-1, width, parent=dtid)
+                relations.append({'dt-id': child, 'relationType': 'child'})
+        doc = {
+            'dt-id': dtid,
+            'hosting-iri': self.base_url + twin_id,
+            'name': 'Twin ' + twin_id.split('-')[0],
+            'relations': relations,
+        }
+        self.docs[twin_id] = json.dumps(doc).encode()
+        return dtid
+
+    def delay(self):
+        """
+        Sleeps for the latency of one response.
+        """
+        if self.tail_probability and random.random() < self.tail_probability:
+            time.sleep(self.tail_latency)
+        elif self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def dtids(self) -> list:
+        """
+        DTIDs of all twins served.
+        """
+        return [self.registry_url + twin_id for twin_id in self.docs]
+
+    def start(self):
+        for server in (self._registry, self._base):
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+        return self
+
+    def stop(self):
+        for server in (self._registry, self._base):
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
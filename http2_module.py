@@ -0,0 +1,344 @@
+"""
+HTTP/2 client for fetching DT docs over multiplexed connections.
+
+All requests of an event loop to the same host share one HTTP/2
+connection, so that the DT docs of a tree hosted on one Twinbase are not
+fetched over separate connections. https hosts must support HTTP/2 with
+ALPN, http hosts must accept HTTP/2 with prior knowledge (h2c). Hosts that
+do not support HTTP/2 or do not answer the HTTP/2 handshake in time are
+fetched with asks over HTTP/1.1 instead. Responses with a status other
+than 2xx raise BadStatus, so that error pages are not parsed as DT docs.
+
+Needs the optional h2 package.
+"""
+import asyncio, json, ssl
+
+import asks
+
+try:
+    import h2.config, h2.connection, h2.events, h2.exceptions
+except ImportError:
+    h2 = None
+
+USER_AGENT = 'dtweb-measurements'
+
+
+class Http2NotSupported(Exception):
+    """
+    Raised when a host does not negotiate HTTP/2.
+    """
+
+
+class _Body:
+    """
+    Streamed response body like the body of asks responses.
+    """
+
+    def __init__(self, response):
+        self._response = response
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __aiter__(self):
+        return self._response._iterate_chunks()
+
+    async def close(self):
+        if self._response._close is not None:
+            self._response._close()
+
+
+class Http2Response:
+    """
+    Response of an HTTP/2 request with the attributes of asks responses used here.
+    """
+
+    def __init__(self, url: str, status_code: int, headers: dict, close=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = b''
+        self._chunks = asyncio.Queue()
+        self._close = close
+
+    @property
+    def body(self):
+        """
+        Streamed response body, iterated with async for.
+        """
+        return _Body(self)
+
+    async def _iterate_chunks(self):
+        while True:
+            chunk = await self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                return
+            yield chunk
+
+    async def read(self):
+        async for chunk in self._iterate_chunks():
+            self.content += chunk
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _Stream:
+
+    def __init__(self, url):
+        self.url = url
+        self.response = asyncio.get_running_loop().create_future()
+        self.chunks = None
+
+
+class Http2Connection:
+    """
+    HTTP/2 connection to one host, shared by concurrent requests.
+    """
+
+    def __init__(self, scheme: str, host: str, port: int):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.authority = host if port in (80, 443) else host + ':' + str(port)
+        self.closed = False
+        self._streams = {}
+        self._stream_slots = None
+
+    async def connect(self, timeout=None):
+        context = None
+        if self.scheme == 'https':
+            context = ssl.create_default_context()
+            context.set_alpn_protocols(['h2'])
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context), timeout)
+        if context is not None:
+            protocol = self._writer.get_extra_info('ssl_object').selected_alpn_protocol()
+            if protocol != 'h2':
+                self._writer.close()
+                raise Http2NotSupported(self.authority + ' does not support HTTP/2')
+        config = h2.config.H2Configuration(client_side=True, header_encoding='utf-8')
+        self._connection = h2.connection.H2Connection(config=config)
+        self._connection.initiate_connection()
+        self._writer.write(self._connection.data_to_send())
+        # The server must answer with a SETTINGS frame, HTTP/1.1 servers answer with an error,
+        # close or wait for a request
+        try:
+            data = await asyncio.wait_for(self._reader.readexactly(9), timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            data = b''
+        if len(data) < 9 or data[3] != 0x4:
+            self._writer.close()
+            raise Http2NotSupported(self.authority + ' does not support HTTP/2')
+        self._stream_slots = asyncio.Condition()
+        self._reading = asyncio.ensure_future(self._read(data))
+
+    async def _read(self, data):
+        error = ConnectionError('HTTP/2 connection closed by ' + self.authority)
+        try:
+            while True:
+                if data is None:
+                    data = await self._reader.read(65536)
+                if not data:
+                    break
+                for event in self._connection.receive_data(data):
+                    if isinstance(event, h2.events.ConnectionTerminated):
+                        error = ConnectionError('HTTP/2 connection terminated by ' + self.authority)
+                    self._handle(event)
+                self._writer.write(self._connection.data_to_send())
+                data = None
+        except (OSError, h2.exceptions.ProtocolError) as e:
+            error = ConnectionError(str(e))
+        finally:
+            self.closed = True
+            for stream_id in list(self._streams):
+                self._end_stream(stream_id, error)
+            if self._stream_slots is not None:
+                async with self._stream_slots:
+                    self._stream_slots.notify_all()
+
+    def _handle(self, event):
+        stream = self._streams.get(getattr(event, 'stream_id', None))
+        if isinstance(event, h2.events.ResponseReceived) and stream is not None:
+            headers = dict(event.headers)
+            stream_id = event.stream_id
+            response = Http2Response(stream.url, int(headers.pop(':status')), headers,
+                close=lambda: self.reset(stream_id))
+            stream.chunks = response._chunks
+            stream.response.set_result(response)
+        elif isinstance(event, h2.events.DataReceived):
+            self._connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            if stream is not None and stream.chunks is not None:
+                stream.chunks.put_nowait(event.data)
+        elif isinstance(event, h2.events.StreamEnded):
+            self._end_stream(event.stream_id)
+        elif isinstance(event, h2.events.StreamReset):
+            self._end_stream(event.stream_id, ConnectionError('HTTP/2 stream reset by ' + self.authority))
+
+    def _end_stream(self, stream_id, error=None):
+        stream = self._streams.pop(stream_id, None)
+        if stream is None:
+            return
+        if not stream.response.done():
+            stream.response.set_exception(error or ConnectionError('HTTP/2 stream ended without response'))
+        elif stream.chunks is not None:
+            stream.chunks.put_nowait(error)
+        asyncio.ensure_future(self._release_slot())
+
+    async def _release_slot(self):
+        async with self._stream_slots:
+            self._stream_slots.notify_all()
+
+    async def get(self, url: str, path: str, stream=False) -> Http2Response:
+        """
+        Sends a GET request on a new stream of the connection.
+
+        Args:
+          stream: If True, returns when the headers are received and the body
+            is read by iterating response.body. Otherwise the whole body is read.
+
+        Raises:
+          BadStatus: If the response status is not 2xx. Redirects are not followed.
+        """
+        async with self._stream_slots:
+            # Wait for a free stream if the server limits concurrent streams
+            await self._stream_slots.wait_for(lambda: self.closed or
+                self._connection.open_outbound_streams < self._connection.remote_settings.max_concurrent_streams)
+        if self.closed:
+            raise ConnectionError('HTTP/2 connection to ' + self.authority + ' is closed')
+        stream_id = self._connection.get_next_available_stream_id()
+        self._streams[stream_id] = _Stream(url)
+        response_future = self._streams[stream_id].response
+        self._connection.send_headers(stream_id, [
+            (':method', 'GET'), (':authority', self.authority), (':scheme', self.scheme),
+            (':path', path), ('user-agent', USER_AGENT)], end_stream=True)
+        self._writer.write(self._connection.data_to_send())
+        try:
+            response = await response_future
+            if not 200 <= response.status_code < 300:
+                self.reset(stream_id)
+                raise asks.errors.BadStatus('{} status for url: {}'.format(response.status_code, url),
+                    response, response.status_code)
+            if not stream:
+                await response.read()
+        except asyncio.CancelledError:
+            self.reset(stream_id)
+            raise
+        return response
+
+    def reset(self, stream_id):
+        """
+        Cancels a stream that has not ended.
+        """
+        if stream_id in self._streams and not self.closed:
+            self._streams.pop(stream_id)
+            try:
+                self._connection.reset_stream(stream_id)
+                self._writer.write(self._connection.data_to_send())
+            except h2.exceptions.StreamClosedError:
+                pass
+            asyncio.ensure_future(self._release_slot())
+
+    async def close(self):
+        if not self.closed:
+            self._connection.close_connection()
+            self._writer.write(self._connection.data_to_send())
+        self._reading.cancel()
+        self._writer.close()
+
+
+class Http2Client:
+    """
+    Fetches URLs over one HTTP/2 connection per host.
+
+    Hosts that do not support HTTP/2 are fetched with asks over HTTP/1.1.
+
+    Attributes:
+      connections_opened: Number of HTTP/2 connections opened
+      http1_hosts: Hosts fetched over HTTP/1.1
+    """
+
+    def __init__(self):
+        self.connections_opened = 0
+        self.http1_hosts = set()
+        self._connections = {}
+
+    async def _connection(self, scheme, host, port, timeout):
+        key = (scheme, host, port)
+        connection = self._connections.get(key)
+        if connection is None or (isinstance(connection, Http2Connection) and connection.closed):
+            # Concurrent requests wait for the same connection attempt
+            connection = asyncio.ensure_future(self._connect(scheme, host, port, timeout))
+            self._connections[key] = connection
+        if isinstance(connection, asyncio.Future):
+            try:
+                return await asyncio.shield(connection)
+            except Exception:
+                if self._connections.get(key) is connection:
+                    del self._connections[key]
+                raise
+        return connection
+
+    async def _connect(self, scheme, host, port, timeout):
+        connection = Http2Connection(scheme, host, port)
+        await connection.connect(timeout)
+        self.connections_opened += 1
+        self._connections[(scheme, host, port)] = connection
+        return connection
+
+    async def get(self, url: str, timeout=None, stream=False):
+        """
+        Fetches a URL.
+
+        Returns:
+          Http2Response, or an asks response for hosts without HTTP/2
+        """
+        scheme, rest = url.split('://', 1)
+        netloc, _, path = rest.partition('/')
+        host, _, port = netloc.partition(':')
+        port = int(port) if port else (443 if scheme == 'https' else 80)
+        if (scheme, host, port) not in self.http1_hosts:
+            try:
+                connection = await self._connection(scheme, host, port, timeout)
+                return await asyncio.wait_for(connection.get(url, '/' + path, stream=stream), timeout)
+            except Http2NotSupported:
+                self.http1_hosts.add((scheme, host, port))
+        return await asks.get(url, timeout=timeout, stream=stream)
+
+    async def close(self):
+        for connection in self._connections.values():
+            if isinstance(connection, Http2Connection):
+                await connection.close()
+        self._connections = {}
+
+
+def install(loop) -> Http2Client:
+    """
+    Makes base fetches of measurements running in an event loop use HTTP/2.
+
+    Close the client with loop.run_until_complete(client.close()) before
+    closing the loop.
+
+    Raises:
+      ImportError: If the h2 package is not installed.
+    """
+    if h2 is None:
+        raise ImportError('HTTP/2 needs the h2 package: pip install h2')
+    loop.http2_client = Http2Client()
+    return loop.http2_client
+
+
+def running_client():
+    """
+    Returns:
+      Http2Client installed to the running event loop, None if not installed.
+    """
+    try:
+        return getattr(asyncio.get_running_loop(), 'http2_client', None)
+    except RuntimeError:
+        return None
@@ -0,0 +1,195 @@
+"""
+Local twin folders served from memory instead of a DTID registry and Twinbase.
+
+A folder created by create-twins-tree.py holds one <twin-id>/index.yaml DT
+doc per twin. load() parses the folder once and keeps its DT docs in
+memory, so that measurements of the twins measure the traversal, parsing
+and logging of the client without any network. The hosting URL of a twin
+is file://<folder>/<twin-id>.
+
+Parsing YAML is slow for large folders, so the parsed DT docs are also
+cached to measurements/cache/local-twins/, one file per folder. The twin
+folder itself is only read. A cached DT doc is used while the modification
+time and size of its index.yaml are unchanged, so only added or edited
+twins are parsed again.
+"""
+import asyncio, hashlib, json, os, time
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+SCHEME = 'file://'
+CACHE_FOLDER = os.path.join('measurements', 'cache', 'local-twins')
+CHUNK_SIZE = 65536          # Bytes per chunk of streamed DT docs
+
+# Loaded LocalTwinbase by real path of the folder
+LOADED = {}
+
+
+class LocalResponse:
+    """
+    DT doc or twin page from a local folder with the attributes of asks responses used here.
+    """
+
+    def __init__(self, url: str, content: bytes, status_code=200):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'content-length': str(len(content)), 'content-type': 'application/json'}
+
+    def json(self):
+        return json.loads(self.content)
+
+    @property
+    def body(self):
+        """
+        Streamed response body, iterated with async for.
+        """
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def __aiter__(self):
+        for start in range(0, len(self.content), CHUNK_SIZE):
+            yield self.content[start:start+CHUNK_SIZE]
+
+    async def close(self):
+        pass
+
+
+class LocalTwinbase:
+    """
+    DT docs of a local twin folder by DTID.
+
+    Args:
+      folderpath: Folder created by create-twins-tree.py
+
+    Attributes:
+      folderpath: Absolute path of the folder
+      docs: JSON encoded DT doc by twin id
+      twin_ids: Twin id by DTID
+    """
+
+    def __init__(self, folderpath: str):
+        self.folderpath = os.path.realpath(folderpath)
+        self.base_url = SCHEME + self.folderpath + '/'
+        self.docs = {}
+        self.twin_ids = {}
+        for twin_id, doc in self._read().items():
+            self.docs[twin_id] = json.dumps(doc).encode()
+            self.twin_ids[doc['dt-id']] = twin_id
+
+    def _read(self) -> dict:
+        cachepath = os.path.join(CACHE_FOLDER, hashlib.sha1(self.folderpath.encode()).hexdigest() + '.json')
+        # Cached DT doc and [modification time (ns), size] of its index.yaml by twin id
+        cached = {'docs': {}, 'files': {}}
+        try:
+            with open(cachepath, 'r') as cachefile:
+                cached = json.load(cachefile)
+        except (OSError, ValueError):
+            pass
+
+        docs, files = {}, {}
+        with os.scandir(self.folderpath) as entries:
+            for entry in entries:
+                docpath = os.path.join(entry.path, 'index.yaml')
+                if not entry.is_dir() or not os.path.exists(docpath):
+                    continue
+                status = os.stat(docpath)
+                files[entry.name] = [status.st_mtime_ns, status.st_size]
+                if cached['files'].get(entry.name) == files[entry.name]:
+                    docs[entry.name] = cached['docs'][entry.name]
+                else:
+                    with open(docpath, 'r') as yamlfile:
+                        docs[entry.name] = yaml.load(yamlfile, Loader=SafeLoader)
+
+        if files != cached['files']:
+            try:
+                os.makedirs(CACHE_FOLDER, exist_ok=True)
+                with open(cachepath, 'w') as cachefile:
+                    json.dump({'folder': self.folderpath, 'files': files, 'docs': docs}, cachefile)
+            except OSError:
+                print('Could not write cache of local twins: ' + cachepath)
+        return docs
+
+    def origins(self) -> list:
+        """
+        Returns:
+          DTIDs of the twins whose parent is not in the folder
+        """
+        origins = []
+        for dtid, twin_id in self.twin_ids.items():
+            relations = json.loads(self.docs[twin_id]).get('relations') or []
+            parents = [relation['dt-id'] for relation in relations if relation.get('relationType') == 'parent']
+            if not any(parent in self.twin_ids for parent in parents):
+                origins.append(dtid)
+        return origins
+
+    def host_url(self, dtid: str) -> str:
+        """
+        Resolves a DTID like a DTID registry.
+
+        Raises:
+          LookupError: If the DTID is not in the folder.
+        """
+        twin_id = self.twin_ids.get(dtid)
+        if twin_id is None:
+            raise LookupError('DTID not in local twins: ' + dtid)
+        return self.base_url + twin_id
+
+    def get(self, url: str) -> LocalResponse:
+        """
+        Serves <hosting URL>/index.json like a Twinbase.
+
+        Raises:
+          LookupError: If the URL is not a DT doc in the folder.
+        """
+        path = url[len(self.base_url):] if url.startswith(self.base_url) else ''
+        twin_id, _, filename = path.partition('/')
+        if twin_id not in self.docs or filename not in ('index.json', ''):
+            raise LookupError('Not found in local twins: ' + url)
+        if not filename:
+            return LocalResponse(url, b'<html><body>Twin ' + twin_id.encode() + b'</body></html>')
+        return LocalResponse(url, self.docs[twin_id])
+
+
+def load(folderpath: str) -> LocalTwinbase:
+    """
+    Returns:
+      LocalTwinbase of a folder, parsed only on the first call
+    """
+    key = os.path.realpath(folderpath)
+    if key not in LOADED:
+        start = time.perf_counter()
+        LOADED[key] = LocalTwinbase(key)
+        print('Loaded ' + str(len(LOADED[key].docs)) + ' local twins from ' + folderpath
+            + ' in {:.2f} s'.format(time.perf_counter() - start))
+    return LOADED[key]
+
+
+def install(loop, twinbase: LocalTwinbase) -> LocalTwinbase:
+    """
+    Makes measurements running in an event loop resolve DTIDs and fetch DT
+    docs from a local twin folder instead of the network.
+    """
+    loop.local_twinbase = twinbase
+    return twinbase
+
+
+def running_twinbase():
+    """
+    Returns:
+      LocalTwinbase installed to the running event loop, None if not installed.
+    """
+    try:
+        return getattr(asyncio.get_running_loop(), 'local_twinbase', None)
+    except RuntimeError:
+        return None
@@ -1,7 +1,7 @@
 """
 Functions for executing measurements on Digital Twin Web.
 """
-import time, os
+import time, os, csv, json
 import psutil
 from datetime import datetime, timezone
 
@@ -9,52 +9,352 @@ import asyncio, asks
 from contextlib import closing
 
 import plotting_module as plot
+import docstream_module as docstream
+from twintree_module import TwinTree
+import statistics_module as stats
+import retry_module as retry
+import dns_module as dns
+import http2_module as http2
+import bulk_module as bulk
+import localtwins_module as localtwins
+import runplan_module as runplan
 import yaml
 
+# Observers notified of each measurement row written to main logs.
+# An observer has an observe(row) method taking the row as a list of columns.
+LOG_OBSERVERS = []
+
+
+class TimestampedLog:
+    """
+    Main log file that appends an absolute timestamp to each measurement row.
+
+    Timestamps are integer nanoseconds since the Unix epoch. They are
+    measured with the monotonic perf_counter_ns() from an epoch anchor taken
+    when the log is opened, so that rows of a sample stay in order even if
+    the system clock is adjusted, and rows of parallel processes or hosts
+    can be merged by time. Header rows and lines that are not CSV rows,
+    e.g. "It took ... seconds", are written as is.
+    """
+
+    def __init__(self, logfile):
+        self._file = logfile
+        self.anchor_ns = time.time_ns()
+        self._anchor_perf_ns = time.perf_counter_ns()
+
+    def timestamp_ns(self) -> int:
+        """
+        Returns:
+          Current time as nanoseconds since the Unix epoch
+        """
+        return self.anchor_ns + time.perf_counter_ns() - self._anchor_perf_ns
+
+    def write(self, text: str):
+        timestamp = ',' + str(self.timestamp_ns()) + '\n'
+        lines = []
+        for line in text.splitlines(True):
+            if line.endswith('\n') and ',' in line and not line.startswith('Time,'):
+                line = line[:-1] + timestamp
+            lines.append(line)
+        self._file.write(''.join(lines))
+
+    def close(self):
+        self._file.close()
+
+
+class ObservedLog:
+    """
+    Main log file that passes each written measurement row to observers.
+    """
+
+    def __init__(self, logfile, observers):
+        self._file = logfile
+        self._observers = observers
+
+    def write(self, text: str):
+        self._file.write(text)
+        for row in csv.reader(text.splitlines()):
+            if len(row) >= len(stats.LOG_COLUMNS) and row[0] != 'Time':
+                for observer in self._observers:
+                    observer.observe(row)
+
+    @property
+    def anchor_ns(self) -> int:
+        return self._file.anchor_ns
+
+    def close(self):
+        self._file.close()
+
+
+def open_main_log(filepath: str):
+    """
+    Opens a main log file for appending.
+
+    Returns:
+      TimestampedLog, wrapped in ObservedLog if there are LOG_OBSERVERS
+    """
+    try:
+        main_logfile = TimestampedLog(open(filepath, "a"))
+    except:
+        print("Couldn't open file \"" + filepath + "\", exiting...")
+        exit()
+    if LOG_OBSERVERS:
+        return ObservedLog(main_logfile, LOG_OBSERVERS)
+    return main_logfile
+
+
 async def fetch_host_url_async(dtid: str, timeout=None) -> str:
     """
     Fetches hosting URL based on a DTID
 
+    DTIDs are resolved from a local twin folder instead if one is installed
+    to the running event loop.
+
     Returns:
         Hosting URL as a string
 
     """
+    twinbase = localtwins.running_twinbase()
+    if twinbase is not None:
+        return twinbase.host_url(dtid)
     r = await asks.get(dtid, timeout=timeout)
     return r.url
 
 
-async def fetch_dt_doc_async(dtid: str, timeout_registry=3.0, timeout_base=2.0) -> dict:
+async def fetch_base_async(url: str, timeout=None, stream=False):
+    """
+    Fetches a URL from a Twinbase, over HTTP/2 if an HTTP/2 client is
+    installed to the running event loop. file:// URLs are fetched from the
+    local twin folder installed to the running event loop.
+
+    Bulk endpoints advertised by the response are recorded if a bulk
+    fetcher is installed to the running event loop.
+
+    Returns:
+      Response with the attributes of asks responses
+    """
+    start = time.perf_counter()
+    client = http2.running_client()
+    if url.startswith(localtwins.SCHEME) and localtwins.running_twinbase() is not None:
+        r = localtwins.running_twinbase().get(url)
+    elif client is not None:
+        r = await client.get(url, timeout=timeout, stream=stream)
+    elif stream:
+        r = await asks.get(url, stream=True)
+    else:
+        r = await asks.get(url, timeout=timeout)
+    fetcher = bulk.running_fetcher()
+    if fetcher is not None:
+        fetcher.observe(url, r, None if stream else time.perf_counter() - start)
+    return r
+
+
+async def fetch_dt_doc_async(dtid: str, timeout_registry=3.0, timeout_base=2.0, max_doc_size=None) -> dict:
     """
     Fetches a DT doc based on a DTID.
 
     Args:
       dtid: The DT identifier of the target DT. Must be URL.
+      max_doc_size: Maximum accepted DT doc size in bytes. None for no limit.
 
     Returns:
       DT doc in python dict form.
 
     """
-    dt_url = await fetch_host_url_async(dtid, timeout=timeout_registry)
-    r = await asks.get(dt_url + '/index.json',timeout=timeout_base)
+    dtdoc, _, _ = await fetch_dt_doc_timed_async(dtid, timeout_registry, timeout_base, max_doc_size)
+    return dtdoc
+
+
+async def fetch_dt_doc_timed_async(dtid: str, timeout_registry=3.0, timeout_base=2.0, max_doc_size=None, dt_url=None):
+    """
+    Fetches a DT doc based on a DTID and measures its size and parse time.
 
-    return r.json()
+    Args:
+      dtid: The DT identifier of the target DT. Must be URL.
+      max_doc_size: Maximum accepted DT doc size in bytes. None for no limit.
+      dt_url: Hosting URL of the DT if already resolved, None to resolve it.
 
+    Returns:
+      Tuple of DT doc in python dict form, DT doc size in bytes and parse time in seconds.
 
-async def fetch_and_log_dt_doc_async(dtid: str,log,number,timeout_registry=None,timeout_base=None) -> dict:
+    Raises:
+      DocTooLarge: If the DT doc is larger than max_doc_size.
+    """
+    if dt_url is None:
+        dt_url = await fetch_host_url_async(dtid, timeout=timeout_registry)
+    content = await fetch_doc_content_async(dt_url + '/index.json', timeout=timeout_base, max_doc_size=max_doc_size)
+
+    start = time.perf_counter()
+    dtdoc = json.loads(content)
+    return dtdoc, len(content), time.perf_counter() - start
+
+
+async def fetch_doc_content_async(url: str, timeout=None, max_doc_size=None) -> bytes:
+    """
+    Fetches a DT doc from a Twinbase without parsing it.
+
+    With max_doc_size, the DT doc is streamed and refused by its
+    content-length header before the body is read, or as soon as more than
+    max_doc_size bytes are received if the header is missing.
+
+    Returns:
+      DT doc as bytes
+
+    Raises:
+      DocTooLarge: If the DT doc is larger than max_doc_size.
+    """
+    if max_doc_size is None:
+        r = await fetch_base_async(url, timeout=timeout)
+        return r.content
+
+    async def read_limited():
+        r = await fetch_base_async(url, stream=True)
+        if int(r.headers.get('content-length', 0)) > max_doc_size:
+            await r.body.close()
+            raise docstream.DocTooLarge('DT doc is larger than ' + str(max_doc_size) + ' bytes')
+        content = bytearray()
+        async with r.body:
+            async for chunk in r.body:
+                content += chunk
+                if len(content) > max_doc_size:
+                    raise docstream.DocTooLarge('DT doc is larger than ' + str(max_doc_size) + ' bytes')
+        return bytes(content)
+
+    return await asyncio.wait_for(read_limited(), timeout)
+
+
+async def fetch_children_streaming_async(dtid: str, timeout_registry=3.0, timeout_base=2.0, max_doc_size=None, dt_url=None):
+    """
+    Fetches the child DTIDs of a twin by parsing its DT doc while it is received.
+
+    Only the relations of the DT doc are decoded, see docstream_module.
+
+    Args:
+      dtid: The DT identifier of the target DT. Must be URL.
+      max_doc_size: Maximum accepted DT doc size in bytes. None for no limit.
+      dt_url: Hosting URL of the DT if already resolved, None to resolve it.
+
+    Returns:
+      Tuple of list of child DTIDs, DT doc size in bytes and parse time in seconds.
+
+    Raises:
+      DocTooLarge: If the DT doc is larger than max_doc_size.
+    """
+    if dt_url is None:
+        dt_url = await fetch_host_url_async(dtid, timeout=timeout_registry)
+    return await asyncio.wait_for(stream_children_async(dt_url + '/index.json', max_doc_size), timeout_base)
+
+
+async def stream_children_async(url: str, max_doc_size=None, on_children=None):
+    """
+    Streams a DT doc from a URL and extracts the child DTIDs.
+
+    Args:
+      on_children: Function called with each list of child DTIDs as soon as
+        they are parsed, before the rest of the DT doc is received.
+
+    Returns:
+      Tuple of list of child DTIDs, DT doc size in bytes and parse time in seconds.
+    """
+    parser = docstream.ChildRelationParser(max_size=max_doc_size)
+    r = await fetch_base_async(url, stream=True)
+    if max_doc_size is not None and int(r.headers.get('content-length', 0)) > max_doc_size:
+        await r.body.close()
+        raise docstream.DocTooLarge('DT doc is larger than ' + str(max_doc_size) + ' bytes')
+    children = []
+    parse_time = 0
+    async with r.body:
+        async for chunk in r.body:
+            start = time.perf_counter()
+            new_children = parser.feed(chunk)
+            parse_time += time.perf_counter() - start
+            if new_children:
+                children += new_children
+                if on_children is not None:
+                    on_children(new_children)
+    parser.close()
+    return children, parser.size, parse_time
+
+
+async def time_dns_resolution_async(url: str):
+    """
+    Resolves the host of a URL with the caching resolver of the running event loop.
+
+    Returns:
+      DNS resolution time (s), None if no caching resolver is installed or
+      the host could not be resolved.
+    """
+    resolver = dns.running_resolver()
+    if resolver is None:
+        return None
+    start = time.perf_counter()
+    try:
+        await resolver.resolve(dns.host_of(url))
+    except OSError:
+        return None
+    return time.perf_counter() - start
+
+
+def preresolve_hosts(params: runplan.RunParams, log, number):
+    """
+    Resolves the hosts of all DTIDs and the hosts resolved in earlier samples
+    into the DNS cache, so that expired entries are not resolved during timing.
+    """
+    dtids = params.dtids
+    if dtids is None:
+        dtids = [dtid for twin_dtids in params.twins.values() for dtid in twin_dtids]
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    with closing(asyncio.get_event_loop()) as loop:
+        resolver = dns.install(loop)
+        hosts = [dns.host_of(dtid) for dtid in dtids] + resolver.hosts
+        durations = loop.run_until_complete(resolver.preresolve(hosts))
+    for host, duration in durations.items():
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},DNS pre-resolution time,{:4.6f},-,-,-,{}\n'
+        log.write(msg.format(0, host, duration, number))
+
+
+async def fetch_and_log_dt_doc_async(dtid: str,log,number,timeout_registry=None,timeout_base=None,policy=None,max_doc_size=None,domain_of=None) -> dict:
     """
     Fetches DT doc in dict form based on a DTID.
 
     Args:
       dtid: The DT identifier of the target DT. Must be URL.
+      policy: RequestPolicy for retrying and hedging the registry and base
+        fetches. Each attempt is logged separately. None for single attempts.
+      max_doc_size: Maximum accepted DT doc size in bytes. None for no limit.
+      domain_of: Function returning the domain of a DTID or hosting URL,
+        e.g. RunParams.domain. None to parse the domains here.
 
     Returns:
       DT doc in python dict form.
     """
 
+    if policy is None:
+        policy = retry.RequestPolicy()
+    if domain_of is None:
+        domain_of = lambda url: url.split('/')[2]
     starttime = time.perf_counter()
+
+    def attempt_logger(phase):
+        def log_attempt(hedged, outcome, duration):
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},{},{} {}attempt {},{:4.6f},-,-,{},{}\n'
+            log.write(msg.format(time.perf_counter()-starttime, dtid, phase, 'hedged ' if hedged else '', outcome, duration, dtid, number))
+        return log_attempt
+
+    # Resolve registry host, timed separately if DNS is cached
+    dns_time = await time_dns_resolution_async(dtid)
+    if dns_time is not None:
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Registry DNS resolution time,{:4.6f},-,-,{},{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, dns_time, dtid, number))
+
     # Fetch host url from DTID
     try:
-        dt_url = await fetch_host_url_async(dtid, timeout=timeout_registry)
+        dt_url = await retry.fetch_with_policy_async(
+            lambda timeout: fetch_host_url_async(dtid, timeout=timeout),
+            timeout_registry, policy, ('registry', domain_of(dtid)), attempt_logger('Registry'))
     except:
         print('Could not resolve DTID: ' + dtid + ' in ' + str(timeout_registry) + ' seconds')
         # Time,DTID,Event,Duration,Depth,Origin,Base,Number
@@ -65,10 +365,25 @@ async def fetch_and_log_dt_doc_async(dtid: str,log,number,timeout_registry=None,
     msg = '{:4.6f},{},DTID > hosturl fetch time,-,-,-,{},{}\n'
     log.write(msg.format(time.perf_counter()-starttime, dtid, dtid, number))
 
+    # Resolve base host, usually cached already when following the redirect
+    dns_time = await time_dns_resolution_async(dt_url)
+    if dns_time is not None:
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Base DNS resolution time,{:4.6f},-,-,{},{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, dns_time, dtid, number))
+
     # Fetch DT doc from host URL
     starttime_doc = time.perf_counter()
     try:
-        r = await asks.get(dt_url + '/index.json', timeout=timeout_base)
+        content = await retry.fetch_with_policy_async(
+            lambda timeout: fetch_doc_content_async(dt_url + '/index.json', timeout=timeout, max_doc_size=max_doc_size),
+            timeout_base, policy, ('base', domain_of(dt_url)), attempt_logger('Base'))
+    except docstream.DocTooLarge:
+        print('DT doc of ' + dtid + ' is larger than ' + str(max_doc_size) + ' bytes')
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},DT doc too large,-,-,-,{},{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, dtid, number))
+        return None
     except:
         print('Could not fetch DT doc from: ' + dt_url + ' in ' + str(timeout_base) + ' seconds')
         # Time,DTID,Event,Duration,Depth,Origin,Base,Number
@@ -82,53 +397,239 @@ async def fetch_and_log_dt_doc_async(dtid: str,log,number,timeout_registry=None,
     msg = '{:4.6f},{},DT doc received,-,-,-,{},{}\n'
     log.write(msg.format(time.perf_counter()-starttime, dtid, dtid, number))
 
-    return r.json()
+    start = time.perf_counter()
+    dtdoc = json.loads(content)
+    parse_time = time.perf_counter() - start
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},{},DT doc size (bytes),{},-,-,{},{}\n'
+    log.write(msg.format(time.perf_counter()-starttime, dtid, len(content), dtid, number))
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},{},DT doc parse time,{:4.6f},-,-,{},{}\n'
+    log.write(msg.format(time.perf_counter()-starttime, dtid, parse_time, dtid, number))
+
+    return dtdoc
 
 
-def get_multiple_dt_docs(params, log, number, show_time=True):
+def get_multiple_dt_docs(params: runplan.RunParams, log, number, show_time=True, policy=None):
     """
     Fetch multiple DT docs simultaneously
 
+    Args:
+      params: RunParams of a registry measurement
+      policy: RequestPolicy for the fetches, see fetch_and_log_dt_doc_async
+
     Returns:
       ?
     """
     start = time.perf_counter()
     pages = []
     tasks = []
-    timeout_registry = params['timeout_registry']
-    timeout_base = params['timeout_base']
+    timeout_registry = params.timeout_registry
+    timeout_base = params.timeout_base
     asyncio.set_event_loop(asyncio.new_event_loop())
     with closing(asyncio.get_event_loop()) as loop:
-        for dtid in params['dtids']:
-            tasks.append(fetch_and_log_dt_doc_async(dtid,log,number,timeout_registry=timeout_registry,timeout_base=timeout_base))
+        if params.dns_cache:
+            dns.install(loop)
+        client = http2.install(loop) if params.http2 else None
+        if params.local_twins:
+            localtwins.install(loop, localtwins.load(params.local_twins))
+        for dtid in params.dtids:
+            tasks.append(fetch_and_log_dt_doc_async(dtid,log,number,timeout_registry=timeout_registry,timeout_base=timeout_base,policy=policy,max_doc_size=params.max_doc_size,domain_of=params.domain))
         pages = loop.run_until_complete(asyncio.gather(*tasks))
+        if client is not None:
+            loop.run_until_complete(client.close())
     duration = time.perf_counter() - start
     if show_time:
         # Time,DTID,Event,Duration,Depth,Origin,Base,Number
         msg = 'It took {:4.3f} seconds to get {} DT docs.\n'
-        log.write(msg.format(duration, len(params['dtids'])))
+        log.write(msg.format(duration, len(params.dtids)))
 
     return pages
 
 
-async def fetch_children_async(dtid, log, starttime, depth, origin, params, number):
+async def fetch_race_dt_doc_async(twin: str, dtid: str, log, number, params: runplan.RunParams, policy) -> dict:
+    """
+    Fetches a DT doc for a race measurement with the retries, hedging and
+    maximum DT doc size of the run. Each attempt is logged separately.
+
+    Returns:
+      DT doc in python dict form.
+
+    Raises:
+      DocTooLarge: If the DT doc is larger than max_doc_size.
+    """
+    starttime = time.perf_counter()
+
+    def attempt_logger(phase):
+        def log_attempt(hedged, outcome, duration):
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},{},{} {}attempt {},{:4.6f},-,{},-,{}\n'
+            log.write(msg.format(time.perf_counter()-starttime, dtid, phase, 'hedged ' if hedged else '', outcome, duration, twin, number))
+        return log_attempt
+
+    dt_url = await retry.fetch_with_policy_async(
+        lambda timeout: fetch_host_url_async(dtid, timeout=timeout),
+        params.timeout_registry, policy, ('registry', params.domain(dtid)), attempt_logger('Registry'))
+    content = await retry.fetch_with_policy_async(
+        lambda timeout: fetch_doc_content_async(dt_url + '/index.json', timeout=timeout, max_doc_size=params.max_doc_size),
+        params.timeout_base, policy, ('base', params.domain(dt_url)), attempt_logger('Base'))
+    return json.loads(content)
+
+
+async def race_dt_doc_async(twin: str, dtids: list, log, number, params: runplan.RunParams, policy) -> dict:
+    """
+    Fetches the DT doc of a logical twin through several equivalent DTIDs at once.
+
+    The DTIDs are resolved concurrently through their registries. The first
+    successful fetch wins and the other fetches are cancelled.
+
+    Args:
+      twin: Name of the logical twin
+      dtids: Equivalent DTIDs of the twin, e.g. in different registries
+      params: RunParams of the race measurement
+      policy: RequestPolicy for the fetches through each DTID
+
+    Returns:
+      Tuple of the winning DTID and the DT doc, (None, None) if all fetches failed.
+    """
+    starttime = time.perf_counter()
+    tasks = {}
+    for dtid in dtids:
+        tasks[asyncio.ensure_future(fetch_race_dt_doc_async(twin, dtid, log, number, params, policy))] = dtid
+
+    winner, dtdoc = None, None
+    pending = set(tasks)
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and winner is None:
+                    winner, dtdoc = tasks[task], task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            # Retrieve exceptions of the cancelled fetches so that they are not reported
+            for task in pending:
+                if not task.cancelled():
+                    task.exception()
+
+    if winner is None:
+        print('Could not fetch DT doc of ' + twin + ' through any of its DTIDs')
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},"{}",Race lost by all registries,-,-,{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtids, twin, number))
+        return None, None
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},{},Race won,-,-,{},-,{}\n'
+    log.write(msg.format(time.perf_counter()-starttime, winner, twin, number))
+    return winner, dtdoc
+
+
+async def race_and_compare_async(twin: str, dtids: list, log, number, params: runplan.RunParams, policy):
+    """
+    Races the DTIDs of a logical twin and fetches through each DTID alone.
+
+    The gain of the race compared to each single DTID is logged. The order
+    of the race and the single fetches alternates between samples, so that
+    caching along the way does not favour either.
+    """
+    async def race():
+        start = time.perf_counter()
+        winner, _ = await race_dt_doc_async(twin, dtids, log, number, params, policy)
+        return winner, time.perf_counter() - start
+
+    async def single(dtid):
+        """
+        Returns:
+          Tuple of fetch time (s) and the failure event, None if the fetch succeeded
+        """
+        start = time.perf_counter()
+        try:
+            await fetch_race_dt_doc_async(twin, dtid, log, number, params, policy)
+        except docstream.DocTooLarge:
+            return time.perf_counter() - start, 'DT doc too large'
+        except:
+            return time.perf_counter() - start, 'Could not fetch DT doc'
+        return time.perf_counter() - start, None
+
+    if number % 2:
+        winner, race_duration = await race()
+        single_durations = await asyncio.gather(*[single(dtid) for dtid in dtids])
+    else:
+        single_durations = await asyncio.gather(*[single(dtid) for dtid in dtids])
+        winner, race_duration = await race()
+
+    for dtid, (duration, failure) in zip(dtids, single_durations):
+        if failure is not None:
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},{},{},-,-,{},-,{}\n'
+            log.write(msg.format(duration, dtid, failure, twin, number))
+            continue
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Single DTID fetch time,{:4.6f},-,{},-,{}\n'
+        log.write(msg.format(duration, dtid, duration, twin, number))
+        if winner is not None:
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},{},Race gain,{:4.6f},-,{},-,{}\n'
+            log.write(msg.format(race_duration, dtid, duration - race_duration, twin, number))
+
+
+async def fetch_children_async(dtid, log, starttime, depth, origin, params, number, dt_url=None, prefetched=None):
     """
     Fetches the children of a twin.
+
+    Args:
+      dt_url: Hosting URL of the twin if already resolved, None to resolve it.
+      prefetched: Tuple of DT doc, size and parse time if the DT doc was
+        already fetched in bulk, None to fetch it.
     
     Returns:
         children: A list of children's DTIDs
     """
+    max_doc_size = params.max_doc_size
+    dns_time = await time_dns_resolution_async(dtid)
+    if dns_time is not None:
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Registry DNS resolution time,{:4.6f},{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, dns_time, depth, origin, number))
+    stream_parse = params.stream_parse and prefetched is None
     try:
-        dtdoc = await fetch_dt_doc_async(dtid,timeout_registry=params['timeout_registry'],timeout_base=params['timeout_base'])
+        if prefetched is not None:
+            dtdoc, size, parse_time = prefetched
+            if max_doc_size is not None and size > max_doc_size:
+                raise docstream.DocTooLarge('DT doc is larger than ' + str(max_doc_size) + ' bytes')
+        elif stream_parse:
+            children, size, parse_time = await fetch_children_streaming_async(dtid,
+                timeout_registry=params.timeout_registry,timeout_base=params.timeout_base,max_doc_size=max_doc_size,dt_url=dt_url)
+        else:
+            dtdoc, size, parse_time = await fetch_dt_doc_timed_async(dtid,
+                timeout_registry=params.timeout_registry,timeout_base=params.timeout_base,max_doc_size=max_doc_size,dt_url=dt_url)
         # Time,DTID,Event,Duration,Depth,Origin,Base,Number
         msg = '{:4.6f},{},DT doc received,-,{},{},-,{}\n'
         log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, number))
+    except docstream.DocTooLarge:
+        print('DT doc of ' + dtid + ' is larger than ' + str(max_doc_size) + ' bytes')
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},DT doc too large,-,{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, number))
+        return None
     except:
         print('Could not fetch DT doc for: ' + dtid + ' due to registry or base timeout.')#' in ' + str(params['timeout_registry']) + ' seconds (may also be because of base)')
         # Time,DTID,Event,Duration,Depth,Origin,Base,Number
         msg = '{:4.6f},{},Could not fetch DT doc,-,{},{},-,{}\n'
         log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, number))
         return None
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},{},DT doc size (bytes),{},{},{},-,{}\n'
+    log.write(msg.format(time.perf_counter()-starttime, dtid, size, depth, origin, number))
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},{},DT doc parse time,{:4.6f},{},{},-,{}\n'
+    log.write(msg.format(time.perf_counter()-starttime, dtid, parse_time, depth, origin, number))
+
+    if stream_parse:
+        return children
 
     children = []
     try:
@@ -144,19 +645,123 @@ async def fetch_children_async(dtid, log, starttime, depth, origin, params, numb
     return children
 
 
-async def loop_through_children(dtid, log, starttime, depth, origin, params, number, show_time=True):
+async def fetch_children_bulk_async(dtid, child_dtids, log, starttime, depth, origin, params, number) -> dict:
+    """
+    Resolves the hosting URLs of the children of a twin and fetches the DT
+    docs of children hosted on the same Twinbase with one bulk request, if
+    the Twinbase advertises a bulk endpoint. See bulk_module.
+
+    Logs the latency and bytes saved by each bulk request compared to
+    fetching the DT docs one by one.
+
+    Args:
+      dtid: DTID of the parent
+      child_dtids: DTIDs of the children
+      depth: Depth of the children
+
+    Returns:
+      Dict of keyword arguments of loop_through_children by child DTID.
+      Children whose hosting URL could not be resolved are left out.
+    """
+    fetcher = bulk.running_fetcher()
+    dt_urls = await asyncio.gather(*[fetch_host_url_async(child, timeout=params.timeout_registry)
+        for child in child_dtids], return_exceptions=True)
+    fetched = {}
+    children_by_url = {}
+    for child, dt_url in zip(child_dtids, dt_urls):
+        if isinstance(dt_url, str):
+            fetched[child] = {'dt_url': dt_url}
+            children_by_url.setdefault(dt_url, []).append(child)
+
+    async def fetch_bulk(url, dt_urls):
+        base = params.domain(dt_urls[0])
+        start = time.perf_counter()
+        try:
+            r = await asyncio.wait_for(fetch_base_async(url, timeout=params.timeout_base), params.timeout_base)
+            duration = time.perf_counter() - start
+            start_parse = time.perf_counter()
+            docs = r.json()
+            parse_time = time.perf_counter() - start_parse
+            if not isinstance(docs, dict):
+                raise ValueError('Bulk response is not a JSON object')
+            # DT docs missing from the response are fetched one by one
+            sizes = {}
+            for dt_url in dt_urls:
+                doc = docs.get(bulk.twin_id_of(dt_url))
+                if isinstance(doc, dict):
+                    sizes[dt_url] = len(json.dumps(doc).encode())
+            size = len(r.content)
+            # Fetching one by one would have transferred each DT doc with its own headers
+            bytes_saved = 0
+            if sizes:
+                bytes_saved = sum(sizes.values()) + (len(sizes) - 1) * bulk.header_bytes(r) - size
+        except Exception as e:
+            # Children left out are fetched one by one
+            print('Could not bulk fetch DT docs from: ' + base + ': ' + repr(e))
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},{},Could not bulk fetch DT docs,-,{},{},{},{}\n'
+            log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, base, number))
+            return
+        for dt_url in sizes:
+            for child in children_by_url[dt_url]:
+                fetched[child]['prefetched'] = (docs[bulk.twin_id_of(dt_url)], sizes[dt_url], parse_time / len(dt_urls))
+
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Bulk fetch time,{:4.6f},{},{},{},{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, duration, depth, origin, base, number))
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Bulk fetch docs,{},{},{},{},{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, len(sizes), depth, origin, base, number))
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Bulk fetch size (bytes),{},{},{},{},{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, size, depth, origin, base, number))
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Bulk bytes saved,{},{},{},{},{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, bytes_saved, depth, origin, base, number))
+        single_time = fetcher.single_fetch_time(url)
+        if single_time is not None:
+            # Concurrent single fetches take at least the time of one single fetch
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},{},Bulk latency saved,{:4.6f},{},{},{},{}\n'
+            log.write(msg.format(time.perf_counter()-starttime, dtid, single_time - duration, depth, origin, base, number))
+
+    await asyncio.gather(*[fetch_bulk(url, dt_urls) for url, dt_urls in fetcher.bulk_urls(list(children_by_url))])
+    return fetched
+
+
+async def loop_through_children(dtid, log, starttime, depth, origin, params, number, show_time=True, tree=None, parent=-1, dt_url=None, prefetched=None):
     """
     Recursive loop through the children of a twin.
+
+    With params bulk_fetch, the DT docs of the children are fetched in
+    bulk from Twinbases that advertise it, see fetch_children_bulk_async.
+
+    Args:
+      tree: TwinTree to which visited twins are added. If None, a nested
+        dict {dtid: [[{...}, {...}]]} of the twins is returned instead.
+      parent: Node index of the parent in tree, -1 for origins.
+      dt_url: Hosting URL of the twin if already resolved by the parent.
+      prefetched: Tuple of DT doc, size and parse time if already fetched in bulk by the parent.
     """
     start = time.perf_counter()
-    twintree = {}
-    twintree[dtid] = []
-    child_dtids = await fetch_children_async(dtid, log, starttime, depth, origin, params, number)
+    if tree is not None:
+        node = tree.add(dtid, parent, depth)
+    else:
+        twintree = {}
+        twintree[dtid] = []
+    child_dtids = await fetch_children_async(dtid, log, starttime, depth, origin, params, number, dt_url=dt_url, prefetched=prefetched)
 
     depth +=1
     if isinstance(child_dtids, list):
-        children =  await asyncio.gather(*[loop_through_children(dtid, log, starttime, depth, origin, params, number) for dtid in child_dtids])
-        twintree[dtid].append(children)
+        fetched = {}
+        if child_dtids and bulk.running_fetcher() is not None:
+            fetched = await fetch_children_bulk_async(dtid, child_dtids, log, starttime, depth, origin, params, number)
+        if tree is not None:
+            tree.latencies[node] = time.perf_counter() - starttime
+            await asyncio.gather(*[loop_through_children(dtid, log, starttime, depth, origin, params, number, tree=tree, parent=node, **fetched.get(dtid, {})) for dtid in child_dtids])
+        else:
+            children =  await asyncio.gather(*[loop_through_children(dtid, log, starttime, depth, origin, params, number, **fetched.get(dtid, {})) for dtid in child_dtids])
+            twintree[dtid].append(children)
 
     duration = time.perf_counter() - start
     if show_time:
@@ -164,131 +769,315 @@ async def loop_through_children(dtid, log, starttime, depth, origin, params, num
         msg = '{:4.6f},{},Duration to fetch all children,{:4.6f},{},{},-,{}\n'
         log.write(msg.format(time.perf_counter()-starttime, dtid, duration, depth-1, origin, number))
     
+    if tree is not None:
+        return tree
     return twintree
 
 
-def start_loop_through_children(params: dict, log, starttime, number, show_time=True):
+async def pipeline_through_children(dtid, log, starttime, depth, origin, params, number, tree, parent=-1, show_time=True, host_url=None, previous=None):
+    """
+    Recursive loop through the children of a twin that starts fetching each
+    child as soon as it appears in the DT doc of its parent.
+
+    Args:
+      tree: TwinTree to which visited twins are added.
+      parent: Node index of the parent in tree, -1 for origins.
+      host_url: Task resolving the hosting URL of the twin that was started
+        speculatively by the parent. None to resolve it here.
+      previous: Dict of child DTIDs by parent DTID from an earlier traversal.
+        The hosting URLs of these children are resolved speculatively while
+        the DT doc of their parent is fetched. None for no speculation.
+    """
+    start = time.perf_counter()
+    node = tree.add(dtid, parent, depth)
+    max_doc_size = params.max_doc_size
+    child_tasks = []
+
+    # Resolve hosting URLs of previously seen children while the parent is fetched
+    speculative = {}
+    if previous is not None:
+        for child in previous.get(dtid, ()):
+            speculative[child] = asyncio.ensure_future(fetch_host_url_async(child, timeout=params.timeout_registry))
+
+    def start_children(child_dtids):
+        for child in child_dtids:
+            child_tasks.append(asyncio.ensure_future(pipeline_through_children(child, log, starttime, depth+1, origin, params, number,
+                tree, parent=node, show_time=show_time, host_url=speculative.pop(child, None), previous=previous)))
+
+    try:
+        dt_url = None
+        if host_url is not None:
+            try:
+                dt_url = await host_url
+                # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+                msg = '{:4.6f},{},Speculative hosturl used,-,{},{},-,{}\n'
+                log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, number))
+            except Exception:
+                pass
+        if dt_url is None:
+            dt_url = await fetch_host_url_async(dtid, timeout=params.timeout_registry)
+        _, size, parse_time = await asyncio.wait_for(
+            stream_children_async(dt_url + '/index.json', max_doc_size, on_children=start_children), params.timeout_base)
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},DT doc received,-,{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, number))
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},DT doc size (bytes),{},{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, size, depth, origin, number))
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},DT doc parse time,{:4.6f},{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, parse_time, depth, origin, number))
+        tree.latencies[node] = time.perf_counter() - starttime
+    except docstream.DocTooLarge:
+        print('DT doc of ' + dtid + ' is larger than ' + str(max_doc_size) + ' bytes')
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},DT doc too large,-,{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, number))
+    except:
+        print('Could not fetch DT doc for: ' + dtid + ' due to registry or base timeout.')
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Could not fetch DT doc,-,{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, depth, origin, number))
+    finally:
+        # Children that are no longer in the DT doc
+        for task in speculative.values():
+            task.cancel()
+        if speculative:
+            await asyncio.wait(speculative.values())
+            for task in speculative.values():
+                if not task.cancelled():
+                    task.exception()
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},{},Speculative hosturls unused,{},{},{},-,{}\n'
+            log.write(msg.format(time.perf_counter()-starttime, dtid, len(speculative), depth, origin, number))
+
+    # Children that were started before a failure are still fetched
+    await asyncio.gather(*child_tasks)
+
+    duration = time.perf_counter() - start
+    if show_time:
+        # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+        msg = '{:4.6f},{},Duration to fetch all children,{:4.6f},{},{},-,{}\n'
+        log.write(msg.format(time.perf_counter()-starttime, dtid, duration, depth, origin, number))
+    return tree
+
+
+def start_loop_through_children(params: runplan.RunParams, log, starttime, number, show_time=True, previous=None) -> TwinTree:
     """
     Starts a loop through children of a list of twins.
+
+    With params pipeline, children are fetched as soon as they appear in
+    the DT doc of their parent, see pipeline_through_children.
+    With params bulk_fetch, DT docs of children are fetched in bulk from
+    Twinbases that advertise a bulk endpoint, see fetch_children_bulk_async.
+
+    Args:
+      previous: TwinTree of an earlier sample for speculative prefetching
+        with params speculative_prefetch. None for no speculation.
+
+    Returns:
+      TwinTree of all visited twins.
     """
     start = time.perf_counter()
-    twintree_list = []
+    tree = TwinTree()
     tasks = []
     depth = 0
     # https://stackoverflow.com/questions/45600579/asyncio-event-loop-is-closed-when-getting-loop
     asyncio.set_event_loop(asyncio.new_event_loop())
     with closing(asyncio.get_event_loop()) as loop:
-        for dtid in params['dtids']:
+        if params.dns_cache:
+            dns.install(loop)
+        client = http2.install(loop) if params.http2 else None
+        if params.bulk_fetch:
+            bulk.install(loop)
+        if params.local_twins:
+            localtwins.install(loop, localtwins.load(params.local_twins))
+        previous_children = None
+        if params.pipeline and params.speculative_prefetch and previous is not None:
+            previous_children = previous.children()
+        for dtid in params.dtids:
             origin = dtid
-            tasks.append(loop_through_children(dtid, log, starttime, depth, origin, params, number))
-        twintree_list = loop.run_until_complete(asyncio.gather(*tasks))
+            if params.pipeline:
+                tasks.append(pipeline_through_children(dtid, log, starttime, depth, origin, params, number, tree, previous=previous_children))
+            else:
+                tasks.append(loop_through_children(dtid, log, starttime, depth, origin, params, number, tree=tree))
+        loop.run_until_complete(asyncio.gather(*tasks))
+        if client is not None:
+            loop.run_until_complete(client.close())
+            # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+            msg = '{:4.6f},metadata,HTTP/2 connections opened,{},-,-,-,{}\n'
+            log.write(msg.format(time.perf_counter()-starttime, client.connections_opened, number))
     duration = time.perf_counter() - start
     if show_time:
         # Time,DTID,Event,Duration,Depth,Origin,Base,Number
         msg = '{:4.6f},"{}",Whole loop to fetch children of {} DTs,{:4.6f},-,-,-,{}\n'
-        log.write(msg.format(time.perf_counter()-starttime, params['dtids'], len(params['dtids']),duration,number))
-    return twintree_list
+        log.write(msg.format(time.perf_counter()-starttime, params.dtids, len(params.dtids),duration,number))
+    return tree
 
 
-def init_network_measurement(params: dict, filepath: str, number: int, show_time=True):
+def init_network_measurement(params, filepath: str, number: int, show_time=True, previous=None):
     """
     Initializes a network measurement that fetches children of multiple origin DTIDs.
 
     Args:
-      params: Dict of measurement parameters
+      params: RunParams or dict of measurement parameters
       filepath: Path to file where the measurement log will be written.
       number: Sample number of measurement
+      previous: TwinTree of the previous sample for speculative prefetching
 
     Returns:
-      children: A list of twin trees. Can be printed with pprint.
+      TwinTree of all visited twins.
     """
 
     ### Setup
+    params = runplan.as_run_params(params, 'network')
     
     # Open file
-    try:
-        main_logfile = open(filepath, "a")
-    except:
-        print("Couldn't open file \"" + filepath + "\", exiting...")
-        exit()
-    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
-    main_logfile.write("Time,DTID,Event,Duration,Depth,Origin,Base,Number\n")
+    main_logfile = open_main_log(filepath)
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number,Timestamp
+    main_logfile.write("Time,DTID,Event,Duration,Depth,Origin,Base,Number,Timestamp\n")
+
+    # Fill DNS cache before timing starts
+    if params.dns_cache and params.preresolve:
+        preresolve_hosts(params, main_logfile, number)
+
+    # Parse local twins before timing starts
+    if params.local_twins:
+        localtwins.load(params.local_twins)
 
     starttime = time.perf_counter()
     # Time,DTID,Event,Duration,Depth,Origin,Base,Number
     msg = '{:4.6f},"{}",Start measurement loop for a list of twins,-,-,-,-,{}\n'
-    main_logfile.write(msg.format(time.perf_counter()-starttime, params['dtids'],number))
+    main_logfile.write(msg.format(time.perf_counter()-starttime, params.dtids,number))
     # Time,DTID,Event,Duration,Depth,Origin,Base,Number
     msg = '{:4.6f},metadata,Start at {},-,-,-,-,{}\n'
     main_logfile.write(msg.format(time.perf_counter()-starttime, datetime.now(timezone.utc).isoformat(), number))
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},metadata,Clock anchor (ns since epoch),{},-,-,-,{}\n'
+    main_logfile.write(msg.format(time.perf_counter()-starttime, main_logfile.anchor_ns, number))
     
 
     ### Go to measurement loop
-    children = start_loop_through_children(params, main_logfile, starttime, number)
+    tree = start_loop_through_children(params, main_logfile, starttime, number, previous=previous)
     
 
     ### Wrap up 
 
     # Time,DTID,Event,Duration,Depth,Origin,Base,Number
     msg = '{:4.6f},"{}",Ended measurement loop,-,-,-,-,{}\n'
-    main_logfile.write(msg.format(time.perf_counter()-starttime, params['dtids'], number))
+    main_logfile.write(msg.format(time.perf_counter()-starttime, params.dtids, number))
 
     main_logfile.close()
     
-    return children
+    return tree
 
 
-def init_registry_measurement(params: dict, filepath, number, show_time=True):
+def init_registry_measurement(params, filepath, number, show_time=True, policy=None):
     """
     Initializes a registry measurement for a list of DTIDs.
 
     Args:
-      params: Dict of measurement parameters
+      params: RunParams or dict of measurement parameters
       filepath: Path to file where the measurement log will be written.
       number: Sample number of measurement
+      policy: RequestPolicy for the fetches. Created from params if None.
 
     Returns:
       ?
     """
 
     ### Setup
+    params = runplan.as_run_params(params, 'registry')
 
     # Open file
-    try:
-        main_logfile = open(filepath, "a")
-    except:
-        print("Couldn't open file \"" + filepath + "\", exiting...")
-        exit()
-    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
-    main_logfile.write("Time,DTID,Event,Duration,Depth,Origin,Base,Number\n")
+    main_logfile = open_main_log(filepath)
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number,Timestamp
+    main_logfile.write("Time,DTID,Event,Duration,Depth,Origin,Base,Number,Timestamp\n")
+
+    # Fill DNS cache before timing starts
+    if params.dns_cache and params.preresolve:
+        preresolve_hosts(params, main_logfile, number)
+
+    # Parse local twins before timing starts
+    if params.local_twins:
+        localtwins.load(params.local_twins)
 
     starttime = time.perf_counter()
     # Time,DTID,Event,Duration,Depth,Origin,Base,Number
     msg = '{:4.6f},"{}",Start measurement loop for a list of twins,-,-,-,-,{}\n'
-    main_logfile.write(msg.format(time.perf_counter()-starttime, params['dtids'], number))
+    main_logfile.write(msg.format(time.perf_counter()-starttime, params.dtids, number))
     # Time,DTID,Event,Duration,Depth,Origin,Base,Number
     msg = '{:4.6f},metadata,Start at {},-,-,-,-,{}\n'
     main_logfile.write(msg.format(time.perf_counter()-starttime, datetime.now(timezone.utc).isoformat(), number))
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},metadata,Clock anchor (ns since epoch),{},-,-,-,{}\n'
+    main_logfile.write(msg.format(time.perf_counter()-starttime, main_logfile.anchor_ns, number))
 
     ### Go to measurement loop
-    docs = get_multiple_dt_docs(params, main_logfile,number)
+    if policy is None:
+        policy = retry.RequestPolicy.from_params(params)
+    docs = get_multiple_dt_docs(params, main_logfile,number, policy=policy)
 
     ### Wrap up 
     # Time,DTID,Event,Duration,Depth,Origin,Base,Number
     msg = '{:4.6f},"{}",Ended measurement loop,-,-,-,-,{}\n'
-    main_logfile.write(msg.format(time.perf_counter()-starttime, params['dtids'], number))
+    main_logfile.write(msg.format(time.perf_counter()-starttime, params.dtids, number))
 
     main_logfile.close()
 
     return docs
 
 
+def create_adaptive_sampler(params):
+    """
+    Creates an adaptive sampler if adaptive sampling is configured in params.
+
+    The adaptive parameters are validated with the other run parameters
+    when the plan is loaded.
+
+    Returns:
+      AdaptiveSampler or None
+    """
+    if params.adaptive is None:
+        return None
+    return stats.AdaptiveSampler(**params.adaptive)
+
+
+def update_adaptive_sampler(sampler, filepath, offset, key_column):
+    """
+    Adds the DT doc fetch times of the latest sample to an adaptive sampler.
+
+    Args:
+      sampler: AdaptiveSampler
+      filepath: Path to measurement log file
+      offset: Log file position where the latest sample begins
+      key_column: Log column used to group the fetch times, e.g. 'Base'
+
+    Returns:
+      Log file position after the latest sample
+    """
+    key_index = stats.LOG_COLUMNS.index(key_column)
+    rows, offset = stats.read_log_rows(filepath, offset)
+    for row in rows:
+        if row[2] == 'DT doc received':
+            sampler.add(row[key_index], float(row[0]))
+    sampler.add_sample()
+    return offset
+
+
+def print_adaptive_stop(sampler):
+    widths = sampler.widths()
+    print('\nConfidence interval of ' + sampler.statistic + ' below ' + str(sampler.target_width)
+        + ' s for all ' + str(len(widths)) + ' DTIDs after ' + str(sampler.samples) + ' samples (widest: '
+        + '{:4.4f}'.format(max(widths.values())) + ' s)')
+
+
 def run_registry_measurement(params, folderpath):
     """
     Prepares and starts a comparison measurement for multiple origin DTIDs.
 
     Args:
-      params: Dict with measurement parameters.
+      params: RunParams or dict with measurement parameters.
               Must follow the structure of params defined under
               registry_measurement in params-example.yaml
       folderpath: Path to folder where all measurement result files will be written.
@@ -301,11 +1090,12 @@ def run_registry_measurement(params, folderpath):
     ### Prepare measurement ###
 
     try:
-        samples = params['samples']
-        dtids = params['dtids']
-    except:
-        print('\nCould not use parameters, please check them. Exiting.')
+        params = runplan.as_run_params(params, 'registry')
+    except runplan.PlanError as e:
+        print('\nCould not use parameters, please check them. Exiting.\n' + str(e))
         exit()
+    samples = params.samples
+    dtids = params.dtids
 
     print('Measuring DTIDs:\n' + str(dtids) +'\n')
     print('Writing to folder: ' + folderpath + '\n')
@@ -315,7 +1105,15 @@ def run_registry_measurement(params, folderpath):
 
     # Save parameters as a YAML file
     with open (os.path.join(folderpath, 'params.yaml'), 'w') as yamlfile:
-        yaml.dump(params, yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
+        yaml.dump(params.to_dict(), yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+
+    # Samples is the maximum number of samples with adaptive sampling
+    sampler = create_adaptive_sampler(params)
+    offset = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+
+    # Retry and hedging policy keeps attempt durations over samples
+    policy = retry.RequestPolicy.from_params(params)
 
 
     ### Run measurements ###
@@ -326,7 +1124,13 @@ def run_registry_measurement(params, folderpath):
         print('Sample ' + str(sample+1) + ' / ' + str(samples) + ' Memory usage: ' + str(memory.percent) + '% (' + str((memory.total - memory.available)/1000000000) + '/' + str(memory.total/1000000000) + ')')
         
         time.sleep(0.2)
-        init_registry_measurement(params, filepath, sample+1)
+        init_registry_measurement(params, filepath, sample+1, policy=policy)
+
+        if sampler is not None:
+            offset = update_adaptive_sampler(sampler, filepath, offset, 'Base')
+            if sampler.done():
+                print_adaptive_stop(sampler)
+                break
 
     print('\nRegistry measurement done\n')
 
@@ -346,7 +1150,7 @@ def run_network_measurement(params, folderpath):
     Prepares and starts a network measurement for multiple origin DTIDs.
 
     Args:
-      params: Dict with measurement parameters.
+      params: RunParams or dict with measurement parameters.
               Must follow the structure of params defined under
               network_measurements in params-example.yaml
       folderpath: Path to folder where all measurement result files will be written.
@@ -359,15 +1163,20 @@ def run_network_measurement(params, folderpath):
     ### Prepare measurement ###
 
     # Parameters
-    dtids = params['dtids']
-    samples = params['samples']
+    try:
+        params = runplan.as_run_params(params, 'network')
+    except runplan.PlanError as e:
+        print('\nCould not use parameters, please check them. Exiting.\n' + str(e))
+        exit()
+    dtids = params.dtids
+    samples = params.samples
 
     print('Number of samples: ' + str(samples))
     print('Measuring DTIDs:\n' + str(dtids) +'\n')
 
     # Save parameters to a YAML file
     with open (os.path.join(folderpath, 'params.yaml'), 'w') as yamlfile:
-        yaml.dump(params, yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
+        yaml.dump(params.to_dict(), yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
 
     # Set filename
     filename = 'main_log.csv'
@@ -375,22 +1184,202 @@ def run_network_measurement(params, folderpath):
     print('Writing to file: ' + filepath)
 
 
+    # Create folder for twin trees of each sample
+    folderpath_trees = os.path.join(folderpath, 'twintrees')
+    os.makedirs(folderpath_trees, exist_ok=True)
+    topology_file = open(os.path.join(folderpath_trees, 'topology.csv'), 'w')
+    topology_file.write('Number,Nodes,Signature,Added edges,Removed edges\n')
+
+
     ### Run measurements ###
 
+    # Samples is the maximum number of samples with adaptive sampling
+    sampler = create_adaptive_sampler(params)
+    offset = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+
+    previous_tree = None
     for sample in range(samples):
         # Print statistics to terminal
         memory = psutil.virtual_memory()
         print('Sample ' + str(sample+1) + ' / ' + str(samples) + ' Memory usage: ' + str(memory.percent) + '% (' + str((memory.total - memory.available)/1000000000) + '/' + str(memory.total/1000000000) + ')')
  
         time.sleep(0.2)
-        init_network_measurement(params, filepath, sample+1)
+        tree = init_network_measurement(params, filepath, sample+1, previous=previous_tree)
+
+        # Save the twin tree and compare its topology to the previous sample
+        tree.save(os.path.join(folderpath_trees, 'sample-' + str(sample+1) + '.csv'))
+        signature = tree.signature()
+        added, removed = set(), set()
+        if previous_tree is not None and signature != previous_signature:
+            added, removed = tree.diff(previous_tree)
+            print('Topology changed: ' + str(len(added)) + ' edges added, ' + str(len(removed)) + ' edges removed')
+        topology_file.write('{},{},{},{},{}\n'.format(sample+1, len(tree), signature, len(added), len(removed)))
+        previous_tree, previous_signature = tree, signature
+
+        if sampler is not None:
+            offset = update_adaptive_sampler(sampler, filepath, offset, 'DTID')
+            if sampler.done():
+                print_adaptive_stop(sampler)
+                break
+
+    topology_file.close()
 
 
     ### Plot measurement results ###
 
     print('Plotting ' + filepath)
-    registry_domain = dtids[0].split('/')[2]
-    plot.plot_network_fetch_times(filepath, folderpath, registry_domain)
+    plot.plot_network_fetch_times(filepath, folderpath, params.domains[dtids[0]])
+
+    return filepath
+
+
+def init_race_measurement(params, filepath: str, number: int, policy=None):
+    """
+    Initializes a race measurement for logical twins with several equivalent DTIDs.
+
+    Args:
+      params: RunParams or dict of measurement parameters
+      filepath: Path to file where the measurement log will be written.
+      number: Sample number of measurement
+      policy: RequestPolicy for the fetches. Created from params if None.
+    """
+
+    ### Setup
+    params = runplan.as_run_params(params, 'race')
+
+    # Open file
+    main_logfile = open_main_log(filepath)
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number,Timestamp
+    main_logfile.write("Time,DTID,Event,Duration,Depth,Origin,Base,Number,Timestamp\n")
+
+    # Fill DNS cache before timing starts
+    if params.dns_cache and params.preresolve:
+        preresolve_hosts(params, main_logfile, number)
+
+    starttime = time.perf_counter()
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},"{}",Start race loop for a list of twins,-,-,-,-,{}\n'
+    main_logfile.write(msg.format(time.perf_counter()-starttime, list(params.twins), number))
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},metadata,Start at {},-,-,-,-,{}\n'
+    main_logfile.write(msg.format(time.perf_counter()-starttime, datetime.now(timezone.utc).isoformat(), number))
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},metadata,Clock anchor (ns since epoch),{},-,-,-,{}\n'
+    main_logfile.write(msg.format(time.perf_counter()-starttime, main_logfile.anchor_ns, number))
+
+    ### Go to measurement loop
+    if policy is None:
+        policy = retry.RequestPolicy.from_params(params)
+    tasks = []
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    with closing(asyncio.get_event_loop()) as loop:
+        if params.dns_cache:
+            dns.install(loop)
+        for twin, dtids in params.twins.items():
+            tasks.append(race_and_compare_async(twin, dtids, main_logfile, number, params, policy))
+        loop.run_until_complete(asyncio.gather(*tasks))
+
+    ### Wrap up
+    # Time,DTID,Event,Duration,Depth,Origin,Base,Number
+    msg = '{:4.6f},"{}",Ended race loop,-,-,-,-,{}\n'
+    main_logfile.write(msg.format(time.perf_counter()-starttime, list(params.twins), number))
+
+    main_logfile.close()
+
+
+def summarize_race_measurement(filepath: str, folderpath: str, params: runplan.RunParams) -> str:
+    """
+    Summarizes which registry won the races of each twin and the latency gained.
+
+    Writes race_summary.csv with one row per twin and DTID.
+
+    Args:
+      params: RunParams of the race measurement
+
+    Returns:
+      Path to the summary file
+    """
+    rows, _ = stats.read_log_rows(filepath)
+    summary = {}
+    for row in rows:
+        time_, dtid, event, duration, _, twin = row[:6]
+        if event not in ('Race won', 'Race gain'):
+            continue
+        entry = summary.setdefault((twin, dtid), {'wins': 0, 'gains': []})
+        if event == 'Race won':
+            entry['wins'] += 1
+        else:
+            entry['gains'].append(float(duration))
+
+    summarypath = os.path.join(folderpath, 'race_summary.csv')
+    with open(summarypath, 'w') as summaryfile:
+        summaryfile.write('Twin,DTID,Registry,Wins,Median gain,Mean gain\n')
+        for (twin, dtid), entry in sorted(summary.items()):
+            gains = sorted(entry['gains'])
+            median = stats.quantile(gains, 0.5)
+            mean = sum(gains) / len(gains) if gains else float('nan')
+            summaryfile.write('{},{},{},{},{:4.6f},{:4.6f}\n'.format(
+                twin, dtid, params.domain(dtid), entry['wins'], median, mean))
+            print('{:<20} {:<28} wins {:4d}  median gain vs single {:8.4f} s'.format(
+                twin, params.domain(dtid), entry['wins'], median))
+    return summarypath
+
+
+def run_race_measurement(params, folderpath):
+    """
+    Prepares and starts a race measurement for logical twins with several equivalent DTIDs.
+
+    Args:
+      params: RunParams or dict with measurement parameters.
+              Must follow the structure of params defined under
+              race_measurements in params-example.yaml
+      folderpath: Path to folder where all measurement result files will be written.
+
+    Returns:
+      String of measurement log filepath
+    """
+
+
+    ### Prepare measurement ###
+
+    try:
+        params = runplan.as_run_params(params, 'race')
+    except runplan.PlanError as e:
+        print('\nCould not use parameters, please check them. Exiting.\n' + str(e))
+        exit()
+    samples = params.samples
+    twins = params.twins
+
+    print('Number of samples: ' + str(samples))
+    print('Racing twins:\n' + str(twins) +'\n')
+
+    # Save parameters to a YAML file
+    with open (os.path.join(folderpath, 'params.yaml'), 'w') as yamlfile:
+        yaml.dump(params.to_dict(), yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+    # Set filename
+    filename = 'main_log.csv'
+    filepath = os.path.join(folderpath, filename)
+    print('Writing to file: ' + filepath)
+
+
+    ### Run measurements ###
+
+    # Retry and hedging policy keeps attempt durations over samples
+    policy = retry.RequestPolicy.from_params(params)
+    for sample in range(samples):
+        # Print statistics to terminal
+        memory = psutil.virtual_memory()
+        print('Sample ' + str(sample+1) + ' / ' + str(samples) + ' Memory usage: ' + str(memory.percent) + '% (' + str((memory.total - memory.available)/1000000000) + '/' + str(memory.total/1000000000) + ')')
+
+        time.sleep(0.2)
+        init_race_measurement(params, filepath, sample+1, policy=policy)
+
+
+    ### Summarize measurement results ###
+
+    print('\nRace results:')
+    summarize_race_measurement(filepath, folderpath, params)
 
     return filepath
 
@@ -0,0 +1,201 @@
+"""
+Live measurement metrics in Prometheus/OpenMetrics text format.
+
+Metrics are updated from the same rows that measurement_module writes to
+main logs and served over HTTP from the measurement process, e.g.
+http://localhost:9464/metrics
+"""
+import math, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import measurement_module as meas
+
+# Upper bounds of fetch time histogram buckets (s)
+FETCH_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Upper bounds of traversal depth histogram buckets
+DEPTH_BUCKETS = [0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20]
+
+# Failure events and their reasons
+FAILURE_REASONS = {
+    'Could not resolve DTID': 'registry',
+    'Could not fetch DT doc': 'base',
+    'DT doc too large': 'size',
+}
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(name + '="' + value + '"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing count per label values.
+    """
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} counter'.format(self.name)]
+        for label_values, value in sorted(self.values.items()):
+            lines.append('{}_total{} {}'.format(self.name, _format_labels(self.labels, label_values), value))
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative histogram with sum and count per label values.
+    """
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=FETCH_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # Bounds are rendered as floats like le="1.0", also when given as ints
+        self.buckets = [float(bound) for bound in buckets] + [math.inf]
+        self.values = {}
+
+    def observe(self, value: float, *label_values):
+        if label_values not in self.values:
+            # Bucket counts, sum
+            self.values[label_values] = [[0] * len(self.buckets), 0.0]
+        counts, _ = self.values[label_values]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self.values[label_values][1] += value
+
+    def render(self) -> list:
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        for label_values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(self.name,
+                    _format_labels(self.labels + ('le',), label_values + (_format_value(bound),)), cumulative))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(self.labels, label_values), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(self.labels, label_values), repr(total)))
+        return lines
+
+
+class MeasurementMetrics:
+    """
+    Metrics updated from measurement log rows.
+
+    Rows are labeled by registry domain and by DTID. The DTID is the
+    measured DTID in registry measurements and the origin DTID in network
+    measurements.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.registry_seconds = Histogram('dtweb_registry_fetch_seconds',
+            'Time to fetch the hosting URL of a DTID from the registry.', ('registry', 'dtid'))
+        self.base_seconds = Histogram('dtweb_base_fetch_seconds',
+            'Time to fetch a DT doc from its hosting URL.', ('registry', 'dtid'))
+        self.doc_seconds = Histogram('dtweb_dt_doc_seconds',
+            'Time from the start of a fetch or traversal until a DT doc was received.', ('registry', 'dtid'))
+        self.successes = Counter('dtweb_fetch_successes',
+            'DT docs received.', ('registry', 'dtid'))
+        self.failures = Counter('dtweb_fetch_failures',
+            'DT doc fetches that failed, by failed step.', ('registry', 'dtid', 'reason'))
+        self.depth = Histogram('dtweb_traversal_depth',
+            'Depth in the network of DT docs received in traversals.', ('registry', 'origin'), DEPTH_BUCKETS)
+        self.traversal_seconds = Histogram('dtweb_traversal_seconds',
+            'Duration to fetch a twin and all of its children.', ('registry', 'depth'))
+        self.metrics = [self.registry_seconds, self.base_seconds, self.doc_seconds,
+            self.successes, self.failures, self.depth, self.traversal_seconds]
+
+    def observe(self, row: list):
+        """
+        Updates metrics from a main log row.
+        """
+        time, dtid, event, duration, depth, origin, base = row[:7]
+        labeled = base if base != '-' else origin
+        registry = labeled.split('/')[2] if labeled.count('/') >= 2 else labeled
+        with self._lock:
+            if event == 'DTID > hosturl fetch time':
+                self.registry_seconds.observe(float(time), registry, labeled)
+            elif event == 'Hosturl > DT doc fetch time':
+                self.base_seconds.observe(float(time), registry, labeled)
+            elif event == 'DT doc received':
+                self.doc_seconds.observe(float(time), registry, labeled)
+                self.successes.inc(registry, labeled)
+                if depth != '-':
+                    self.depth.observe(int(depth), registry, labeled)
+            elif event in FAILURE_REASONS:
+                self.failures.inc(registry, labeled, FAILURE_REASONS[event])
+            elif event == 'Duration to fetch all children':
+                self.traversal_seconds.observe(float(duration), registry, depth)
+
+    def render(self) -> str:
+        """
+        Returns:
+          All metrics in OpenMetrics text format
+        """
+        lines = []
+        with self._lock:
+            for metric in self.metrics:
+                lines += metric.render()
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_exporter(port: int, address='127.0.0.1') -> MeasurementMetrics:
+    """
+    Starts serving live measurement metrics at http://<address>:<port>/metrics
+
+    The metrics are updated from all main logs written after this call.
+
+    Args:
+      port: TCP port of the metrics endpoint
+      address: Address to listen on, localhost by default
+
+    Returns:
+      MeasurementMetrics being served
+    """
+    metrics = MeasurementMetrics()
+    meas.LOG_OBSERVERS.append(metrics)
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print('Serving measurement metrics at http://' + address + ':' + str(port) + '/metrics')
+    return metrics
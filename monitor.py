@@ -0,0 +1,129 @@
+""" Monitors Digital Twin Web continuously.
+
+Runs the measurements defined in params.yaml periodically within one process
+until stopped with Ctrl + C. Each cycle measures one sample of the registry
+measurement and of each network measurement run.
+
+Results are written to a new folder "measurements/<foldername>/monitor-<timestamp>":
+    registry_measurement/main_log.csv and network_measurements/<run>/main_log.csv:
+        Measurement logs that are rotated when they grow too large
+    windows.csv:
+        Fetch time statistics over rolling windows, rewritten after each cycle
+
+The "latest" folder is pointed to the monitoring folder when monitoring starts.
+
+Monitoring is configured in the "monitoring" section of the parameter file.
+
+Usage example:
+    python3 monitor.py
+
+"""
+
+import os, time, yaml, pprint
+from datetime import datetime, timezone
+import measurement_module as meas
+import monitoring_module as monitor
+import metrics_module as metrics
+import statistics_module as stats
+import retry_module as retry
+import runplan_module as runplan
+
+
+##### Prepare monitoring #####
+
+
+# Open and validate parameters file before measuring anything
+try:
+    plan = runplan.load_plan()
+except runplan.PlanError as e:
+    print('\nCould not use parameters, please check them. Exiting.\n' + str(e))
+    exit(1)
+params = plan.params
+
+print('Parameters:')
+pprint.pprint(params)
+
+# Serve live metrics if configured
+if plan.metrics_port:
+    metrics.start_exporter(plan.metrics_port)
+
+monitoring = plan.monitoring
+interval = monitoring.get('interval', 60)
+window_lengths = monitoring.get('windows', monitor.DEFAULT_WINDOWS)
+log_max_bytes = monitoring.get('log_max_bytes', 100000000)
+log_backups = monitoring.get('log_backups', 5)
+
+# Create folders
+foldername_measurements = os.path.join('measurements', plan.foldername)
+folderpath = os.path.join(os.getcwd(), foldername_measurements,
+    'monitor-' + datetime.now(timezone.utc).isoformat()[:-13])
+os.makedirs(folderpath)
+print('\nWriting to folder: ' + folderpath + '\n')
+
+with open (os.path.join(folderpath, 'params.yaml'), 'w') as yamlfile:
+    yaml.dump(params, yamlfile, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+# Measurement runs as (name, kind, run parameters, folder, key column for statistics)
+runs = []
+if plan.registry is not None:
+    runs.append(('registry', 'registry', plan.registry,
+        os.path.join(folderpath, 'registry_measurement'), 'Base'))
+for key, run_params in plan.network.items():
+    runs.append((key, 'network', run_params,
+        os.path.join(folderpath, 'network_measurements', key), 'Depth'))
+
+header = 'Time,DTID,Event,Duration,Depth,Origin,Base,Number,Timestamp\n'
+logs = {}
+for name, kind, run_params, run_folderpath, _ in runs:
+    os.makedirs(run_folderpath)
+    logs[name] = monitor.RotatingLog(os.path.join(run_folderpath, 'main_log.csv'), header,
+        max_bytes=log_max_bytes, backups=log_backups)
+
+# The request policy is kept over cycles, so that hedging delays are learned from earlier cycles
+policy = retry.RequestPolicy.from_params(plan.registry) if plan.registry is not None else None
+
+windows = {}
+for window_name, length in window_lengths.items():
+    windows[window_name] = monitor.RollingWindow(length)
+
+monitor.update_latest(folderpath, os.path.join(foldername_measurements, 'latest'))
+
+
+#####  Monitor #####
+
+print('Measuring every ' + str(interval) + ' seconds, press Ctrl + C to stop\n')
+number = 0
+next_start = time.monotonic()
+try:
+    while True:
+        number += 1
+        print('\n---- Cycle ' + str(number) + ' at ' + datetime.now(timezone.utc).isoformat() + ' ----')
+        for name, kind, run_params, run_folderpath, key_column in runs:
+            # Measure one sample to a temporary file and move it to the rotating log
+            samplepath = os.path.join(run_folderpath, 'sample.csv')
+            if kind == 'registry':
+                meas.init_registry_measurement(run_params, samplepath, number, policy=policy)
+            else:
+                meas.init_network_measurement(run_params, samplepath, number)
+            with open(samplepath, 'r') as samplefile:
+                logs[name].write(samplefile.read())
+            logs[name].flush()
+            rows, _ = stats.read_log_rows(samplepath)
+            os.remove(samplepath)
+            monitor.add_log_rows(windows, rows, name, key_column)
+
+        monitor.write_window_summaries(windows, os.path.join(folderpath, 'windows.csv'))
+
+        # Wait for the next cycle, skipping cycles that were missed due to long measurements
+        next_start += interval
+        while next_start < time.monotonic():
+            next_start += interval
+        time.sleep(next_start - time.monotonic())
+except KeyboardInterrupt:
+    print('\nMonitoring stopped after ' + str(number) + ' cycles.')
+finally:
+    for log in logs.values():
+        log.close()
+
+print('\nSee this folder for results:')
+print(folderpath)
@@ -0,0 +1,222 @@
+"""
+Functions for long-term monitoring of Digital Twin Web.
+"""
+import os, shutil, time
+from array import array
+
+import statistics_module as stats
+
+# Lengths of rolling windows (s) by name
+DEFAULT_WINDOWS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+
+class RollingWindow:
+    """
+    Latency statistics over a rolling time window with bounded memory.
+
+    The window is divided into a fixed number of slots. Each slot keeps
+    counts, sums and a latency histogram per key and is reused when the
+    window has rolled over it, so memory does not grow with time.
+
+    Args:
+      length: Length of the window (s)
+      slots: Number of slots the window is divided into
+    """
+
+    def __init__(self, length: float, slots=60):
+        self.length = length
+        self.slot_length = length / slots
+        self._slots = [{} for _ in range(slots)]
+        self._slot_ids = [-1] * slots
+
+    def _slot(self, now) -> dict:
+        slot_id = int(now // self.slot_length)
+        index = slot_id % len(self._slots)
+        if self._slot_ids[index] != slot_id:
+            self._slots[index] = {}
+            self._slot_ids[index] = slot_id
+        return self._slots[index]
+
+    def _entry(self, key, now) -> list:
+        slot = self._slot(now)
+        if key not in slot:
+            # Count, failures, sum, max, histogram
+            slot[key] = [0, 0, 0.0, 0.0, array('L', [0] * (len(stats.HISTOGRAM_BOUNDS) + 1))]
+        return slot[key]
+
+    def add(self, key: str, value: float, now=None):
+        """
+        Adds a latency value (s) for a key, e.g. a DTID.
+        """
+        entry = self._entry(key, time.time() if now is None else now)
+        entry[0] += 1
+        entry[2] += value
+        entry[3] = max(entry[3], value)
+        entry[4][stats.histogram_index(value)] += 1
+
+    def add_failure(self, key: str, now=None):
+        """
+        Counts a failed fetch for a key.
+        """
+        self._entry(key, time.time() if now is None else now)[1] += 1
+
+    def summary(self, now=None) -> dict:
+        """
+        Statistics of each key over the window.
+
+        Returns:
+          Dict of dicts with count, failures, mean, p50, p99 and max per key
+        """
+        now = time.time() if now is None else now
+        current = int(now // self.slot_length)
+        merged = {}
+        for slot_id, slot in zip(self._slot_ids, self._slots):
+            if current - slot_id >= len(self._slots) or slot_id > current:
+                continue
+            for key, entry in slot.items():
+                if key not in merged:
+                    merged[key] = [0, 0, 0.0, 0.0, [0] * len(entry[4])]
+                total = merged[key]
+                total[0] += entry[0]
+                total[1] += entry[1]
+                total[2] += entry[2]
+                total[3] = max(total[3], entry[3])
+                for index, count in enumerate(entry[4]):
+                    total[4][index] += count
+        summary = {}
+        for key, (count, failures, total, maximum, counts) in merged.items():
+            summary[key] = {
+                'count': count,
+                'failures': failures,
+                'mean': total / count if count else float('nan'),
+                'p50': min(stats.histogram_quantile(counts, 0.5), maximum),
+                'p99': min(stats.histogram_quantile(counts, 0.99), maximum),
+                'max': maximum,
+            }
+        return summary
+
+
+class RotatingLog:
+    """
+    Measurement log file that is rotated when it grows too large.
+
+    The log is written to filepath, and full logs are renamed to
+    filepath.1, filepath.2, ... up to the number of backups. Each new
+    file starts with the CSV header.
+
+    Args:
+      filepath: Path to the current log file
+      header: Header line written to each new file
+      max_bytes: Size after which the log is rotated
+      backups: Number of rotated files kept
+    """
+
+    def __init__(self, filepath: str, header: str, max_bytes=100000000, backups=5):
+        self.filepath = filepath
+        self.header = header
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.filepath, 'a')
+        if self._file.tell() == 0:
+            self._file.write(self.header)
+
+    def rotate(self):
+        self._file.close()
+        for number in range(self.backups - 1, 0, -1):
+            source = '{}.{}'.format(self.filepath, number)
+            if os.path.exists(source):
+                os.replace(source, '{}.{}'.format(self.filepath, number + 1))
+        if self.backups > 0:
+            os.replace(self.filepath, self.filepath + '.1')
+        else:
+            os.remove(self.filepath)
+        self._open()
+
+    def write(self, text: str):
+        if self._file.tell() + len(text) > self.max_bytes:
+            self.rotate()
+        self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def update_latest(folderpath: str, latestpath: str):
+    """
+    Points the latest view to a measurement folder atomically.
+
+    A symbolic link is created next to latestpath and renamed over it, so
+    readers never see a partially updated latest folder. Falls back to
+    copying if symbolic links are not supported.
+
+    Args:
+      folderpath: Path to the measurement folder
+      latestpath: Path of the latest view, e.g. measurements/<foldername>/latest
+    """
+    if os.path.isdir(latestpath) and not os.path.islink(latestpath):
+        # Latest was a copy made by an earlier version, the original is in its own folder
+        shutil.rmtree(latestpath)
+    temppath = latestpath + '.tmp'
+    try:
+        if os.path.lexists(temppath):
+            os.remove(temppath)
+        os.symlink(os.path.relpath(folderpath, os.path.dirname(latestpath)), temppath, target_is_directory=True)
+        os.replace(temppath, latestpath)
+    except OSError:
+        print('Could not link ' + latestpath + ', copying instead')
+        if os.path.islink(latestpath):
+            os.remove(latestpath)
+        elif os.path.exists(latestpath):
+            shutil.rmtree(latestpath)
+        shutil.copytree(folderpath, latestpath)
+
+
+def write_window_summaries(windows: dict, filepath: str, now=None):
+    """
+    Writes the summaries of rolling windows to a CSV file atomically.
+
+    Args:
+      windows: Dict of RollingWindow by window name
+      filepath: Path to the summary file
+    """
+    temppath = filepath + '.tmp'
+    with open(temppath, 'w') as csvfile:
+        csvfile.write('Window,Key,Count,Failures,Mean,P50,P99,Max\n')
+        for name, window in windows.items():
+            for key, summary in sorted(window.summary(now).items()):
+                csvfile.write('{},"{}",{},{},{:4.6f},{:4.6f},{:4.6f},{:4.6f}\n'.format(
+                    name, key, summary['count'], summary['failures'], summary['mean'],
+                    summary['p50'], summary['p99'], summary['max']))
+    os.replace(temppath, filepath)
+
+
+# Events counted as failed fetches
+FAILURE_EVENTS = ('Could not resolve DTID', 'Could not fetch DT doc', 'DT doc too large')
+
+
+def add_log_rows(windows: dict, rows: list, prefix: str, key_column: str, now=None):
+    """
+    Adds DT doc fetch times and failures from measurement log rows to rolling windows.
+
+    Args:
+      windows: Dict of RollingWindow by window name
+      rows: Measurement log rows, see statistics_module.read_log_rows
+      prefix: Prefix of the keys, e.g. the name of the measurement run
+      key_column: Log column used to group the rows, e.g. 'Base' or 'Depth'
+    """
+    key_index = stats.LOG_COLUMNS.index(key_column)
+    for row in rows:
+        key = prefix + ' ' + key_column.lower() + ' ' + row[key_index]
+        if row[2] == 'DT doc received':
+            for window in windows.values():
+                window.add(key, float(row[0]), now)
+        elif row[2] in FAILURE_EVENTS:
+            for window in windows.values():
+                window.add_failure(key, now)
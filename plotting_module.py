@@ -6,6 +6,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+import statistics_module as stats
+
 # Set style for figures
 try:
     from distutils.spawn import find_executable
@@ -21,6 +23,169 @@ try:
 except:
     plt.rcParams.update({'font.size': 8})
 
+# Rows read from a measurement log at a time
+CHUNKSIZE = 100000
+
+# Grid points of binned kernel density estimates
+KDE_GRID = 1024
+
+
+def read_event_values(filepath: str, events: list, key_column: str, value_column='Time', chunksize=CHUNKSIZE) -> dict:
+    """
+    Reads the values of some events from a measurement log in chunks.
+
+    Only the rows of the given events are kept in memory, so that logs
+    larger than memory can be plotted.
+
+    Args:
+      filepath: Path to measurement log file
+      events: Names of the events to read
+      key_column: Column to group values by, e.g. 'Base' or 'Depth'
+      value_column: Column of the values
+
+    Returns:
+      Dict of float arrays of values in log order by (event, key)
+    """
+    chunks = {}
+    reader = pd.read_csv(filepath, usecols=['Event', key_column, value_column], dtype=str, chunksize=chunksize)
+    for df in reader:
+        df = df[df['Event'].isin(events)]
+        for (event, key), group in df.groupby(['Event', key_column], sort=False):
+            chunks.setdefault((event, key), []).append(group[value_column].values.astype('float'))
+    return {group: np.concatenate(values) for group, values in chunks.items()}
+
+
+def _scott_factor(n: float) -> float:
+    # Bandwidth factor of Scott's rule, the default of matplotlib violins
+    return n ** (-1. / 5)
+
+
+def _gaussian_smooth(counts, step: float, bandwidth: float):
+    """
+    Convolves counts on a regular grid with a Gaussian kernel using FFT.
+    """
+    radius = min(int(np.ceil(4 * bandwidth / step)), len(counts))
+    offsets = np.arange(-radius, radius+1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    size = 1 << int(np.ceil(np.log2(len(counts) + 2 * radius + 1)))
+    smoothed = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)
+    return np.maximum(smoothed[radius:radius+len(counts)], 0)
+
+
+def _binned_violin_stats(grid_counts, low: float, high: float, n: float, mean: float, std: float,
+        median: float, quantile_values: list, bw_method=None, points=100) -> dict:
+    """
+    Violin statistics from counts of values linearly binned on a regular grid from low to high.
+    """
+    coords = np.linspace(low, high, points)
+    bandwidth = 0
+    if n > 0:
+        bandwidth = (_scott_factor(n) if bw_method is None else bw_method) * std
+    if high <= low or bandwidth <= 0:
+        vals = np.zeros(points)
+    else:
+        step = (high - low) / (len(grid_counts) - 1)
+        density = _gaussian_smooth(grid_counts, step, bandwidth) / (n * bandwidth * np.sqrt(2 * np.pi))
+        vals = np.interp(coords, np.linspace(low, high, len(grid_counts)), density)
+    return {'coords': coords, 'vals': vals, 'mean': mean, 'median': median,
+        'min': low, 'max': high, 'quantiles': list(quantile_values)}
+
+
+def _linear_binning(values, low: float, high: float, weights=None, grid_size=KDE_GRID):
+    """
+    Distributes each value between its two neighbouring grid points.
+    """
+    grid_counts = np.zeros(grid_size)
+    if high <= low:
+        grid_counts[0] = len(values) if weights is None else np.sum(weights)
+        return grid_counts
+    weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype='float')
+    position = (np.asarray(values) - low) / (high - low) * (grid_size - 1)
+    lower = np.clip(np.floor(position).astype(int), 0, grid_size - 2)
+    fraction = position - lower
+    grid_counts += np.bincount(lower, weights * (1 - fraction), minlength=grid_size)
+    grid_counts += np.bincount(lower + 1, weights * fraction, minlength=grid_size)
+    return grid_counts
+
+
+def violin_stats(values, bw_method=None, points=100, quantiles=(), grid_size=KDE_GRID) -> dict:
+    """
+    Precomputes the statistics of one violin for Axes.violin().
+
+    The Gaussian kernel density is estimated over values binned on a
+    regular grid and smoothed with FFT, so that the time taken does not
+    grow with the number of values beyond binning them.
+
+    Args:
+      values: Array of values
+      bw_method: Bandwidth factor as in Axes.violinplot(), None for Scott's rule
+      points: Number of points at which the density is evaluated
+      quantiles: Quantiles (0-1) to mark in the violin
+
+    Returns:
+      Dict of coords, vals, mean, median, min, max and quantiles,
+      None if there are no values
+    """
+    values = np.asarray(values, dtype='float')
+    if len(values) == 0:
+        return None
+    low, high = values.min(), values.max()
+    std = values.std(ddof=1) if len(values) > 1 else 0.
+    return _binned_violin_stats(_linear_binning(values, low, high, grid_size=grid_size), low, high, len(values),
+        values.mean(), std, np.median(values), np.quantile(values, quantiles) if len(quantiles) else [],
+        bw_method, points)
+
+
+def histogram_violin_stats(counts, bw_method=None, points=100, quantiles=(), grid_size=KDE_GRID) -> dict:
+    """
+    Precomputes the statistics of one violin from a latency histogram of
+    aggregated results, see statistics_module.HISTOGRAM_BOUNDS.
+
+    Values are placed at the middle of their histogram bucket, so the
+    density is as coarse as the histogram.
+
+    Args:
+      counts: Counts per histogram bucket, e.g. from stats.parse_histogram()
+
+    Returns:
+      Dict of coords, vals, mean, median, min, max and quantiles,
+      None if the histogram is empty
+    """
+    counts = np.asarray(counts, dtype='float')
+    bounds = np.array(stats.HISTOGRAM_BOUNDS)
+    lowers = np.concatenate([[0.], bounds])
+    uppers = np.concatenate([bounds, [bounds[-1]]])
+    centers = (lowers + uppers) / 2
+    n = counts.sum()
+    if n == 0:
+        return None
+    used = np.nonzero(counts)[0]
+    low, high = lowers[used[0]], uppers[used[-1]]
+    mean = np.sum(counts * centers) / n
+    std = np.sqrt(np.sum(counts * (centers - mean) ** 2) / max(n - 1, 1))
+    return _binned_violin_stats(_linear_binning(centers[used], low, high, counts[used], grid_size), low, high, n,
+        mean, std, stats.histogram_quantile(counts, 0.5), [stats.histogram_quantile(counts, q) for q in quantiles],
+        bw_method, points)
+
+
+def draw_violins(axes, vpstats: list, widths=0.9) -> dict:
+    """
+    Draws violins from precomputed statistics at positions 1, 2, ...
+
+    Groups without values (None) are left empty at their position.
+
+    Returns:
+      Dict of the artists like Axes.violinplot(), empty if no group has values
+    """
+    positions = [position for position, vpstat in enumerate(vpstats, 1) if vpstat is not None]
+    if not positions:
+        return {}
+    plot = axes.violin([vpstat for vpstat in vpstats if vpstat is not None], positions=positions,
+        widths=widths, showmeans=False, showextrema=False, showmedians=False)
+    if 'cquantiles' in plot:
+        plot['cquantiles'].set_linewidth(0.5)
+    return plot
+
 
 def plot_network_fetch_times(filepath: str, folderpath: str, registry_domain: str):
     """
@@ -35,35 +200,26 @@ def plot_network_fetch_times(filepath: str, folderpath: str, registry_domain: st
     width = 2.3 # inches
     height = 3.5 # inches
     
-    df = pd.read_csv(filepath)
+    values = read_event_values(filepath, ['DT doc received'], 'Depth')
 
     print(filepath)
 
     # Check max depth
-    df = df[df['Event'] == 'DT doc received']
-    max_depth = int(df["Depth"].max())
+    max_depth = max((int(depth) for _, depth in values), default=0)
     print('Max depth: ' + str(max_depth))
 
     fig, axes = plt.subplots(figsize=(width,height))
 
     # Prepare data
-    violindata = []
-    quantiles = []
+    vpstats = []
     labels = []
     for depth in range(max_depth+1):
-        violindata.append(df[df.Depth == str(depth)]["Time"].values.astype('float'))
-        quantiles.append([0,0.5,0.99])
+        vpstats.append(violin_stats(values.get(('DT doc received', str(depth)), np.array([])),
+            points=100, quantiles=[0,0.5,0.99]))
         labels.append(str(depth))
 
     # Plot
-    plot = axes.violinplot(dataset = violindata,
-        points=100,
-        widths=0.9,
-        showmeans=False, showextrema=False, showmedians=False,
-        quantiles=quantiles, 
-        # bw_method=0.1
-        )
-    plot['cquantiles'].set_linewidth(0.5)
+    draw_violins(axes, vpstats, widths=0.9)
     
     # axes.violinplot(dataset = violindata,
     #     points=100,
@@ -89,6 +245,48 @@ def plot_network_fetch_times(filepath: str, folderpath: str, registry_domain: st
     return True
 
 
+def plot_phase_fetch_times(histograms: dict, folderpath: str, measurement: str):
+    """
+    Plots the fetch times of each phase of a measurement from the latency
+    histograms of its aggregated results, see analysis_module.
+
+    Args:
+      histograms: Dict of histogram counts by event, e.g. from report_module.pool_phases()
+      folderpath: Path to folder where the figure will be written.
+      measurement: Name of the measurement for figure title and file name
+    """
+    if not histograms:
+        return False
+
+    fig, axes = plt.subplots(figsize=(0.6*len(histograms)+1.5, 3.5))
+
+    # Prepare data
+    vpstats = []
+    labels = []
+    for event, counts in histograms.items():
+        vpstats.append(histogram_violin_stats(counts, points=100, quantiles=[0,0.5,0.99]))
+        labels.append(event)
+
+    # Plot
+    draw_violins(axes, vpstats, widths=0.9)
+
+    # Set texts to figure
+    axes.set_title(measurement)
+    axes.yaxis.grid(True)
+    axes.set_ylabel('Fetch time (s)')
+    axes.set_ylim(bottom=0)
+    axes.set_xticks(range(1,len(labels)+1))
+    axes.set_xticklabels(labels)
+    plt.xticks(rotation=90)
+    plt.tight_layout()
+
+    figurename = 'phase_times_' + measurement.replace('/', '_') + '.pdf'
+    fig.savefig(os.path.join(folderpath, figurename))
+    plt.close(fig)
+
+    return True
+
+
 def plot_registry_fetch_times(filepath, folderpath, dtids):
     """
     Plots registry comparison measurement
@@ -99,7 +297,8 @@ def plot_registry_fetch_times(filepath, folderpath, dtids):
       dtids: List of DTIDs to be plotted
     """
 
-    df = pd.read_csv(filepath)
+    values = read_event_values(filepath,
+        ['DT doc received', 'DTID > hosturl fetch time', 'Hosturl > DT doc fetch time'], 'Base')
 
 
     #### VIOLIN simple ####
@@ -108,34 +307,23 @@ def plot_registry_fetch_times(filepath, folderpath, dtids):
     fig, axes = plt.subplots(figsize=(3.5,3.5))
 
     # Prepare data
-    df = df[df['Event'] == 'DT doc received']
-    violindata = []
-    quantiles = []
+    vpstats = []
     labels = []
     stddev = {}
     anomalies = {}
     for dtid in dtids:
         reg = dtid.split('/')[2]
-        violindata.append(df[df.Base == dtid]["Time"].values.astype('float'))
-        anomalies[reg] = 0
-        for idx, val in enumerate(violindata[-1]):
-            if val > 2:
-                anomalies[reg] += 1
-                violindata[-1] = np.delete(violindata[-1], idx)
-        stddev[reg] = np.std(violindata[-1])
-        quantiles.append([0,0.5,0.99])
+        data = values.get(('DT doc received', dtid), np.array([]))
+        anomalies[reg] = int(np.count_nonzero(data > 2))
+        data = data[data <= 2]
+        stddev[reg] = np.std(data) if len(data) else np.nan
+        vpstats.append(violin_stats(data, bw_method=0.1, points=100, quantiles=[0,0.5,0.99]))
         labels.append(reg)
     print('Standard deviations:')
     print(stddev)
 
     # Plot
-    plot = axes.violinplot(dataset = violindata,
-        points=100,
-        widths=0.9,
-        showmeans=False, showextrema=False, showmedians=False, \
-        quantiles=quantiles,
-        bw_method=0.1)
-    plot['cquantiles'].set_linewidth(0.5)
+    draw_violins(axes, vpstats, widths=0.9)
 
 
     # Set texts to figure
@@ -168,54 +356,29 @@ def plot_registry_fetch_times(filepath, folderpath, dtids):
     # VIOLIN with divided base & registry ####
     # https://stackoverflow.com/questions/43345599/process-pandas-dataframe-into-violinplot
 
-    df = pd.read_csv(filepath)
     fig, axes = plt.subplots(figsize=(3.5,3.5))
 
     # Prepare data
-    df_dh = df[df['Event'] == 'DTID > hosturl fetch time']
-    violindata_dh = []
-    quantiles = []
+    vpstats_dh = []
     labels = []
     for dtid in dtids:
-        violindata_dh.append(df_dh[df_dh.Base == dtid]["Time"].values.astype('float'))
-        quantiles.append([0,0.5,0.99,1])
+        vpstats_dh.append(violin_stats(values.get(('DTID > hosturl fetch time', dtid), np.array([])),
+            bw_method=0.1, points=100, quantiles=[0,0.5,0.99,1]))
         labels.append(dtid.split('/')[2])
 
-
     # Plot
-    plot_dh = axes.violinplot(dataset = violindata_dh,
-        points=100,
-        widths=0.9,
-        showmeans=False, showextrema=False, showmedians=False, \
-        quantiles=quantiles, 
-        # bw_method=0.1
-        )
-    plot_dh['cquantiles'].set_linewidth(0.5)
-
-    plot_dh = axes.violinplot(dataset = violindata_dh,
-        points=100,
-        widths=0.9,
-        showmeans=False, showextrema=False, showmedians=False, \
-        quantiles=quantiles, 
-        bw_method=0.1
-        )
-
-    plot_dh['cquantiles'].set_linewidth(0.5)
+    draw_violins(axes, vpstats_dh, widths=0.9)
 
     # Prepare data
-    df_hosdoc = df[df['Event'] == 'Hosturl > DT doc fetch time']
-    violindata_hosdoc = []
-    quantiles = []
+    vpstats_hosdoc = []
     labels = []
     for dtid in dtids:
-        violindata_hosdoc.append(df_hosdoc[df_hosdoc.Base == dtid]["Time"].values.astype('float'))
-        quantiles.append([0,0.5,0.99,1])
+        vpstats_hosdoc.append(violin_stats(values.get(('Hosturl > DT doc fetch time', dtid), np.array([])),
+            bw_method=0.1, points=100, quantiles=[0,0.5,0.99,1]))
         labels.append(dtid.split('/')[2])
     
     # Plot
-    plot_hosdoc = axes.violinplot(dataset = violindata_hosdoc, points=100, widths=0.9, showmeans=False, showextrema=False, showmedians=False, \
-        quantiles=quantiles, 
-        bw_method=0.1)
+    draw_violins(axes, vpstats_hosdoc, widths=0.9)
 
     # Set texts to figure
     # axes.set_title('Fetch time')
@@ -227,8 +390,6 @@ def plot_registry_fetch_times(filepath, folderpath, dtids):
     axes.set_xticklabels(labels)
     plt.xticks(rotation=90)
     plt.tight_layout()
-   
-    plot_hosdoc['cquantiles'].set_linewidth(0.5)
 
     fig.savefig(os.path.join(folderpath, "base_fetch_times_violin_divided.png"))
     fig.savefig(os.path.join(folderpath, "base_fetch_times_violin_divided.pdf"))
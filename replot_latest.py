@@ -5,6 +5,7 @@ Replots the latest measurement according to the parameter files.
 # import pandas as pd
 import os
 import plotting_module as plot
+import report_module as report
 import yaml
 import pprint
 
@@ -68,4 +69,19 @@ for key in params['network_measurements']:
         print('\n--Parameter file has a measurement run called ' + key + ' but it is set to False')
 
 
+## Plot phases from aggregated results ##
+print('\n---- Plotting phases ----\n')
+measurements = {}
+for row in report.run_rows(folderpath_latest):
+    if row['Histogram']:
+        measurements.setdefault(row['Measurement'], []).append(row)
+for measurement, rows in sorted(measurements.items()):
+    plot.plot_phase_fetch_times(report.pool_phases(rows), folderpath_latest, measurement)
+
+
+## Write HTML report ##
+print('\n---- Writing report ----')
+print('Wrote report to ' + report.write_report(folderpath_latest))
+
+
 print('\nFinished')
\ No newline at end of file
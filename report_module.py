@@ -0,0 +1,237 @@
+"""
+Self-contained HTML report of a measurement run.
+
+The report is built from the aggregated index rows of the run (percentiles
+and latency histograms per DTID or depth and event, see analysis_module)
+instead of the main logs, so its size depends only on the numbers of
+DTIDs, depths and events measured. The page has no external resources and
+can be opened directly from the run folder.
+"""
+import html, math, os
+
+import analysis_module as analysis
+import statistics_module as stats
+
+REPORT_FILENAME = 'report.html'
+
+# Events shown as phases of fetching DT docs, in fetch order
+PHASES = [
+    'Registry DNS resolution time',
+    'DTID > hosturl fetch time',
+    'Base DNS resolution time',
+    'Hosturl > DT doc fetch time',
+    'Bulk fetch time',
+    'DT doc received',
+    'Duration to fetch all children',
+]
+
+HISTOGRAM_WIDTH = 200       # Width (px) of histogram images
+HISTOGRAM_HEIGHT = 28       # Height (px) of histogram images
+
+STYLE = """
+body { font-family: sans-serif; font-size: 14px; margin: 2em; color: #222; }
+h1 { font-size: 22px; } h2 { font-size: 18px; margin-top: 2em; } h3 { font-size: 15px; }
+table { border-collapse: collapse; margin-bottom: 1em; }
+th, td { padding: 3px 10px; border-bottom: 1px solid #ddd; text-align: right; white-space: nowrap; }
+th { cursor: pointer; background: #f3f3f3; user-select: none; }
+td.text, th.text { text-align: left; }
+input { margin: 0.5em 0; padding: 3px; width: 20em; }
+svg rect { fill: #4a78b5; } svg rect:hover { fill: #d9822b; }
+.note { color: #666; }
+"""
+
+SCRIPT = """
+function sortTable(th) {
+  var table = th.closest('table'), body = table.tBodies[0];
+  var index = Array.prototype.indexOf.call(th.parentNode.children, th);
+  var ascending = th.dataset.order !== 'asc';
+  th.dataset.order = ascending ? 'asc' : 'desc';
+  var rows = Array.prototype.slice.call(body.rows);
+  rows.sort(function (a, b) {
+    var x = a.cells[index].dataset.value || a.cells[index].textContent;
+    var y = b.cells[index].dataset.value || b.cells[index].textContent;
+    var nx = parseFloat(x), ny = parseFloat(y);
+    var order = (isNaN(nx) || isNaN(ny)) ? x.localeCompare(y) : nx - ny;
+    return ascending ? order : -order;
+  });
+  rows.forEach(function (row) { body.appendChild(row); });
+}
+function filterTable(input) {
+  var text = input.value.toLowerCase();
+  var rows = document.getElementById(input.dataset.table).tBodies[0].rows;
+  for (var i = 0; i < rows.length; i++) {
+    rows[i].style.display = rows[i].textContent.toLowerCase().indexOf(text) >= 0 ? '' : 'none';
+  }
+}
+"""
+
+
+def run_rows(runpath: str) -> list:
+    """
+    Aggregated rows of a run, read from the index of its measurement folder
+    if the run is indexed and summarized from its main logs otherwise.
+
+    Returns:
+      List of index rows as dicts
+    """
+    folderpath, run = os.path.split(os.path.realpath(runpath))
+    if os.path.exists(os.path.join(folderpath, analysis.INDEX_FILENAME)):
+        rows = analysis.read_index(folderpath, {run})
+        if rows:
+            return rows
+    rows = []
+    for measurement, logpath, key_column in analysis.find_logs(runpath):
+        for row in analysis.summarize_log(logpath, key_column):
+            rows.append(dict(zip(analysis.INDEX_COLUMNS, [run, measurement] + row)))
+    return rows
+
+
+def _format_seconds(value: float) -> str:
+    if value is None or math.isnan(value):
+        return '-'
+    return '{:.1f} ms'.format(value * 1000)
+
+
+def _cell(value, text=False, sort_value=None) -> str:
+    attributes = ' class="text"' if text else ''
+    if sort_value is not None:
+        attributes += ' data-value="{}"'.format(sort_value)
+    return '<td{}>{}</td>'.format(attributes, html.escape(str(value)))
+
+
+def histogram_svg(counts) -> str:
+    """
+    Inline SVG bar chart of a latency histogram over its non-empty bucket range.
+
+    Buckets grow exponentially, so the time axis is logarithmic.
+    """
+    used = [index for index, count in enumerate(counts) if count]
+    if not used:
+        return ''
+    first, last = used[0], used[-1]
+    highest = max(counts)
+    width = HISTOGRAM_WIDTH / (last - first + 1)
+    bars = []
+    for index in range(first, last+1):
+        if not counts[index]:
+            continue
+        height = max(1.0, HISTOGRAM_HEIGHT * counts[index] / highest)
+        lower = stats.HISTOGRAM_BOUNDS[index-1] if index > 0 else 0.0
+        upper = stats.HISTOGRAM_BOUNDS[min(index, len(stats.HISTOGRAM_BOUNDS)-1)]
+        bars.append('<rect x="{:.1f}" y="{:.1f}" width="{:.1f}" height="{:.1f}"><title>{} - {}: {}</title></rect>'.format(
+            (index - first) * width, HISTOGRAM_HEIGHT - height, max(width - 1, 0.5), height,
+            _format_seconds(lower), _format_seconds(upper), counts[index]))
+    return '<svg width="{}" height="{}">{}</svg>'.format(HISTOGRAM_WIDTH, HISTOGRAM_HEIGHT, ''.join(bars))
+
+
+def _phase_order(event: str):
+    return (PHASES.index(event) if event in PHASES else len(PHASES), event)
+
+
+def pool_phases(rows: list) -> dict:
+    """
+    Sums the histograms of the timed index rows of one measurement over keys.
+
+    Returns:
+      Dict of histogram counts by event, in the order of PHASES
+    """
+    pooled = {}
+    for (_, _, event), counts in analysis.pool_histograms(rows).items():
+        pooled[event] = counts if event not in pooled else [a + b for a, b in zip(pooled[event], counts)]
+    return {event: pooled[event] for event in sorted(pooled, key=_phase_order)}
+
+
+def _table(table_id: str, header: list, rows: list, filter_text=None) -> str:
+    parts = []
+    if filter_text:
+        parts.append('<input placeholder="{}" data-table="{}" oninput="filterTable(this)">'.format(
+            html.escape(filter_text), table_id))
+    parts.append('<table id="{}"><thead><tr>'.format(table_id))
+    for title in header:
+        parts.append('<th{} onclick="sortTable(this)">{}</th>'.format(
+            ' class="text"' if title in ('Key', 'Event', 'Phase', 'DTID', 'Depth') else '', html.escape(title)))
+    parts.append('</tr></thead><tbody>')
+    for row in rows:
+        parts.append('<tr>' + ''.join(row) + '</tr>')
+    parts.append('</tbody></table>')
+    return ''.join(parts)
+
+
+def measurement_section(measurement: str, rows: list, number: int) -> str:
+    """
+    HTML section of one measurement with per phase, per key and failure tables.
+    """
+    key_title = 'Depth' if measurement.startswith('network_measurements') else 'DTID'
+    timed = [row for row in rows if row['Histogram']]
+    failures = [row for row in rows if not row['Histogram']]
+    parts = ['<h2>' + html.escape(measurement) + '</h2>']
+
+    # Phases pooled over all keys
+    phase_rows = []
+    for event, counts in pool_phases(timed).items():
+        quantiles = [stats.histogram_quantile(counts, q) for q in (0.5, 0.9, 0.99)]
+        phase_rows.append([_cell(event, text=True, sort_value=_phase_order(event)[0]), _cell(sum(counts))]
+            + [_cell(_format_seconds(value), sort_value=value) for value in quantiles]
+            + ['<td>' + histogram_svg(counts) + '</td>'])
+    parts.append('<h3>Per phase</h3>')
+    parts.append('<p class="note">Percentiles are approximated from the histograms pooled over all '
+        + ('depths' if key_title == 'Depth' else 'DTIDs') + '.</p>')
+    parts.append(_table('phases{}'.format(number), ['Phase', 'Count', 'P50', 'P90', 'P99', 'Histogram'], phase_rows))
+
+    # Each key and event
+    key_rows = []
+    for row in sorted(timed, key=lambda row: (row['Key'], _phase_order(row['Event']))):
+        values = [float(row[column]) for column in ('Mean', 'P50', 'P90', 'P99', 'Max')]
+        key_rows.append([_cell(row['Key'], text=True), _cell(row['Event'], text=True, sort_value=_phase_order(row['Event'])[0]),
+            _cell(row['Count'])] + [_cell(_format_seconds(value), sort_value=value) for value in values]
+            + ['<td>' + histogram_svg(stats.parse_histogram(row['Histogram'])) + '</td>'])
+    parts.append('<h3>Per ' + key_title + '</h3>')
+    parts.append(_table('keys{}'.format(number), [key_title, 'Event', 'Count', 'Mean', 'P50', 'P90', 'P99', 'Max', 'Histogram'],
+        key_rows, filter_text='Filter by ' + key_title + ' or event'))
+
+    if failures:
+        failure_rows = [[_cell(row['Key'], text=True), _cell(row['Event'], text=True), _cell(row['Count'])]
+            for row in sorted(failures, key=lambda row: (row['Key'], row['Event']))]
+        parts.append('<h3>Failures</h3>')
+        parts.append(_table('failures{}'.format(number), [key_title, 'Event', 'Count'], failure_rows))
+    return '\n'.join(parts)
+
+
+def write_report(runpath: str, filepath=None) -> str:
+    """
+    Writes the HTML report of a measurement run.
+
+    Args:
+      runpath: Run folder, e.g. measurements/<foldername>/measurements-<time>
+      filepath: Path of the report, <runpath>/report.html by default
+
+    Returns:
+      Path of the report
+    """
+    filepath = filepath or os.path.join(runpath, REPORT_FILENAME)
+    run = os.path.basename(os.path.realpath(runpath))
+    rows = run_rows(runpath)
+    measurements = {}
+    for row in rows:
+        measurements.setdefault(row['Measurement'], []).append(row)
+
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">',
+        '<title>' + html.escape(run) + '</title>',
+        '<style>' + STYLE + '</style><script>' + SCRIPT + '</script></head><body>',
+        '<h1>' + html.escape(run) + '</h1>',
+        '<p class="note">Times in milliseconds. Click a column to sort. '
+        'Histogram buckets grow exponentially, hover a bar for its range and count.</p>']
+    if not measurements:
+        parts.append('<p>No measurements found.</p>')
+    for number, (measurement, measurement_rows) in enumerate(sorted(measurements.items())):
+        parts.append(measurement_section(measurement, measurement_rows, number))
+
+    paramspath = os.path.join(runpath, 'params.yaml')
+    if os.path.exists(paramspath):
+        with open(paramspath, 'r') as yamlfile:
+            parts.append('<h2>Parameters</h2><pre>' + html.escape(yamlfile.read()) + '</pre>')
+    parts.append('</body></html>')
+
+    with open(filepath, 'w') as reportfile:
+        reportfile.write('\n'.join(parts) + '\n')
+    return filepath
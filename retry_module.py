@@ -0,0 +1,193 @@
+"""
+Retry and hedging policies for resolution requests.
+"""
+import asyncio, json, random, time
+from collections import deque
+
+import asks
+
+import docstream_module as docstream
+import statistics_module as stats
+
+# Failures that would fail again in the same way, so they are not retried or hedged
+NOT_RETRIED = (docstream.DocTooLarge, json.JSONDecodeError)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Returns:
+      False for failures that would repeat, i.e. NOT_RETRIED and 4xx responses
+    """
+    if isinstance(error, asks.errors.BadStatus):
+        return not 400 <= error.status_code < 500
+    return not isinstance(error, NOT_RETRIED)
+
+
+class RequestPolicy:
+    """
+    Decides how a request is retried and hedged.
+
+    A failed attempt is retried after a jittered exponential backoff. An
+    attempt that takes longer than a percentile of earlier successful
+    attempts is hedged by starting a duplicate attempt, and the first
+    successful attempt wins.
+
+    Args:
+      retries: Number of retries after the first failed attempt
+      backoff: Delay before the first retry (s), doubled for each retry
+        and multiplied by a random jitter between 0.5 and 1.5
+      hedge_percentile: Percentile (0-100) of earlier attempt durations
+        after which a hedged attempt is started. None for no hedging.
+      hedge_after: Hedging delay (s) used until enough attempt durations
+        are known for the percentile. None for no hedging until then.
+      timeout_budget: Total time (s) for all attempts of a request.
+        None for no limit other than the timeout of each attempt.
+      history: Number of earlier attempt durations kept per key
+      min_history: Number of attempt durations needed for the percentile
+    """
+
+    def __init__(self, retries=0, backoff=0.1, hedge_percentile=None, hedge_after=None,
+                 timeout_budget=None, history=200, min_history=20):
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.timeout_budget = timeout_budget
+        self.min_history = min_history
+        self._history_length = history
+        self._durations = {}
+
+    @classmethod
+    def from_params(cls, params: dict) -> 'RequestPolicy':
+        """
+        Creates a policy from optional measurement parameters.
+        """
+        return cls(
+            retries=params.get('retries', 0),
+            backoff=params.get('backoff', 0.1),
+            hedge_percentile=params.get('hedge_percentile'),
+            hedge_after=params.get('hedge_after'),
+            timeout_budget=params.get('timeout_budget'))
+
+    @property
+    def active(self) -> bool:
+        return (self.retries > 0 or self.hedge_percentile is not None
+            or self.hedge_after is not None or self.timeout_budget is not None)
+
+    def record(self, key, duration: float):
+        """
+        Records the duration of a successful attempt, e.g. per registry.
+        """
+        if key not in self._durations:
+            self._durations[key] = deque(maxlen=self._history_length)
+        self._durations[key].append(duration)
+
+    def hedge_delay(self, key):
+        """
+        Returns:
+          Delay (s) after which to start a hedged attempt, None for no hedging
+        """
+        durations = self._durations.get(key, ())
+        if self.hedge_percentile is not None and len(durations) >= self.min_history:
+            return stats.quantile(sorted(durations), self.hedge_percentile / 100)
+        return self.hedge_after
+
+    def backoff_delay(self, retry: int) -> float:
+        return self.backoff * 2 ** (retry - 1) * random.uniform(0.5, 1.5)
+
+
+async def fetch_with_policy_async(request, timeout, policy: RequestPolicy, key, log_attempt):
+    """
+    Runs a request with retries and hedging according to a policy.
+
+    Args:
+      request: Async function taking a timeout (s) and returning the result
+      timeout: Timeout of each attempt (s)
+      policy: RequestPolicy
+      key: Key of the attempt durations used for hedging, e.g. registry domain
+      log_attempt: Function called with (hedged, outcome, duration) for each
+        attempt, outcome being 'succeeded', 'failed' or 'cancelled'
+
+    Returns:
+      Result of the first successful attempt
+
+    Raises:
+      The exception of the last failed attempt if all attempts failed, or
+      of the first attempt that failed in a way that is not retryable.
+    """
+    if not policy.active:
+        return await request(timeout)
+
+    start = time.perf_counter()
+    for retry in range(policy.retries + 1):
+        if retry > 0:
+            await asyncio.sleep(policy.backoff_delay(retry))
+        attempt_timeout = timeout
+        if policy.timeout_budget is not None:
+            remaining = policy.timeout_budget - (time.perf_counter() - start)
+            attempt_timeout = remaining if timeout is None else min(timeout, remaining)
+            if attempt_timeout <= 0:
+                raise asyncio.TimeoutError('Timeout budget of ' + str(policy.timeout_budget) + ' s used')
+        try:
+            return await _hedged_async(request, attempt_timeout, policy, key, log_attempt)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            error = e
+    raise error
+
+
+async def _hedged_async(request, timeout, policy, key, log_attempt):
+    """
+    Runs one attempt of a request, hedged with a duplicate attempt if it is slow.
+    """
+    # Set when the other attempts are cancelled. Some HTTP clients turn the
+    # cancellation into other exceptions, so it is not enough to catch CancelledError.
+    finished = []
+
+    async def attempt(hedged):
+        start = time.perf_counter()
+        try:
+            result = await request(timeout)
+        except BaseException as e:
+            if finished or isinstance(e, asyncio.CancelledError):
+                log_attempt(hedged, 'cancelled', time.perf_counter() - start)
+            else:
+                log_attempt(hedged, 'failed', time.perf_counter() - start)
+            raise
+        duration = time.perf_counter() - start
+        log_attempt(hedged, 'succeeded', duration)
+        policy.record(key, duration)
+        return result
+
+    pending = {asyncio.ensure_future(attempt(False))}
+    delay = policy.hedge_delay(key)
+    if delay is not None and (timeout is None or delay < timeout):
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            pending.add(asyncio.ensure_future(attempt(True)))
+        else:
+            pending = done
+
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+                if not is_retryable(error):
+                    # The other attempt would fail in the same way
+                    raise error
+    finally:
+        finished.append(True)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            # Retrieve exceptions of the cancelled fetches so that they are not reported
+            for task in pending:
+                if not task.cancelled():
+                    task.exception()
+    raise error
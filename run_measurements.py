@@ -1,6 +1,10 @@
 import os
 from datetime import datetime, timezone
 import measurement_module as meas
+import monitoring_module as monitor
+import metrics_module as metrics
+import runplan_module as runplan
+import report_module as report
 import yaml
 import pprint
 import time
@@ -12,21 +16,24 @@ measurement_starttime = time.perf_counter()
 ##### Prepare measurement #####
 
 
-# Open parameters file
+# Open and validate parameters file before measuring anything
 try:
-    with open('params.yaml', 'r') as yamlfile:
-        params = yaml.load(yamlfile, Loader=yaml.FullLoader)
-except:
-    print('Could not open params.yaml, using params-example.yaml instead.')
-    with open('params-example.yaml', 'r') as yamlfile:
-        params = yaml.load(yamlfile, Loader=yaml.FullLoader)    
+    plan = runplan.load_plan()
+except runplan.PlanError as e:
+    print('\nCould not use parameters, please check them. Exiting.\n' + str(e))
+    exit(1)
+params = plan.params
 
 print('Parameters:')
 
 pprint.pprint(params)
 
+# Serve live metrics if configured
+if plan.metrics_port:
+    metrics.start_exporter(plan.metrics_port)
+
 # Set foldernames
-foldername_measurements = os.path.join('measurements', params['foldername'])
+foldername_measurements = os.path.join('measurements', plan.foldername)
 foldername = os.path.join(foldername_measurements, 'measurements-' + datetime.now(timezone.utc).isoformat()[:-13])
 try:
     os.mkdir(foldername)
@@ -64,39 +71,60 @@ with open (os.path.join(folderpath, 'params.yaml'), 'w') as yamlfile:
 #####  Run measurements #####
 
 ## Run registry measurement ##
-if params['registry_measurement']['run']:
+if plan.registry is not None:
     print('\n---- Starting registry measurement ----\n')
     ######## Run ########
-    filepath = meas.run_registry_measurement(params['registry_measurement']['params'], folderpath_registry)
+    filepath = meas.run_registry_measurement(plan.registry, folderpath_registry)
 else: 
     print('\n---- Skipped registry measurement due to parameter file configuration ----\n')
 
 ## Run network measurements ##
 print('\n\n---- Starting network measurement ----')
 for key in params['network_measurements']:
-    if params['network_measurements'][key]['run']:
+    if key in plan.network:
         print('\n-- Running measurement: ' + key)
         # Create folder
         foldername_key = key
         folderpath_key = os.path.join(folderpath_network, foldername_key)
         os.mkdir(folderpath_key)
-        run_params = params['network_measurements'][key]['params']
+        run_params = plan.network[key]
         ###### Run ######
         filepath = meas.run_network_measurement(run_params, folderpath_key)
     else:
         print('\n--Parameter file has a measurement run called ' + key + ' but it is set to False')
 
 
+## Run race measurements ##
+race_measurements = params.get('race_measurements', {})
+if race_measurements:
+    print('\n\n---- Starting race measurement ----')
+    folderpath_race = os.path.join(folderpath, 'race_measurements')
+    os.mkdir(folderpath_race)
+for key in race_measurements:
+    if key in plan.race:
+        print('\n-- Running race measurement: ' + key)
+        # Create folder
+        folderpath_key = os.path.join(folderpath_race, key)
+        os.mkdir(folderpath_key)
+        run_params = plan.race[key]
+        ###### Run ######
+        filepath = meas.run_race_measurement(run_params, folderpath_key)
+    else:
+        print('\n--Parameter file has a race measurement called ' + key + ' but it is set to False')
+
+
 #####  Postprocess #####
 
 print('\n---- Postprocessing ----\n')
 
-### Copy to latest
-from distutils.dir_util import copy_tree
-fromDirectory = folderpath
-toDirectory = os.path.join(foldername_measurements, 'latest')
-copy_tree(fromDirectory, toDirectory)
-print('\nCopied all files to ' + toDirectory)
+### Write HTML report from aggregated results
+reportpath = report.write_report(folderpath)
+print('Wrote report to ' + reportpath)
+
+### Point latest to this measurement
+latestpath = os.path.join(foldername_measurements, 'latest')
+monitor.update_latest(folderpath, latestpath)
+print('\nUpdated ' + latestpath + ' to point to this measurement')
 
 
 print('\nMeasurement finished, see this folder for results:')
@@ -0,0 +1,302 @@
+"""
+Validated measurement plan built from a parameter file.
+
+The parameter file is checked once before any measurement starts, so that
+misconfigured runs fail before any network traffic. Each measurement run
+gets a RunParams object whose parameters are plain attributes, e.g.
+params.timeout_registry, so that measurement loops do not look up dict
+keys per request.
+"""
+import importlib.util, os, sys
+
+import yaml
+
+import statistics_module as stats
+
+
+class PlanError(ValueError):
+    """
+    Raised when the parameter file is not valid. Lists all problems found.
+    """
+
+
+# Marks run parameters without a default
+REQUIRED = object()
+
+# Run parameters as name: (type, default). Parameters of type float also accept integers.
+RUN_PARAMETERS = {
+    'samples': (int, REQUIRED),
+    'timeout_registry': (float, REQUIRED),
+    'timeout_base': (float, REQUIRED),
+    'dtids': (list, None),
+    'twins': (dict, None),
+    'adaptive': (dict, None),
+    'retries': (int, 0),
+    'backoff': (float, 0.1),
+    'timeout_budget': (float, None),
+    'hedge_percentile': (float, None),
+    'hedge_after': (float, None),
+    'stream_parse': (bool, False),
+    'max_doc_size': (int, None),
+    'pipeline': (bool, False),
+    'speculative_prefetch': (bool, False),
+    'dns_cache': (bool, False),
+    'preresolve': (bool, False),
+    'http2': (bool, False),
+    'bulk_fetch': (bool, False),
+    'local_twins': (str, None),
+}
+
+# Parameters of adaptive sampling, see statistics_module.AdaptiveSampler
+ADAPTIVE_PARAMETERS = ('statistic', 'target_width', 'confidence', 'min_samples')
+
+# Parameters used by every kind of measurement run
+COMMON_PARAMETERS = ('samples', 'timeout_registry', 'timeout_base')
+
+# Parameters used by each kind of measurement run in addition to the common ones.
+# The first one must be given.
+KIND_PARAMETERS = {
+    'registry': ('dtids', 'adaptive', 'retries', 'backoff', 'timeout_budget', 'hedge_percentile', 'hedge_after',
+        'max_doc_size', 'dns_cache', 'preresolve', 'http2', 'local_twins'),
+    'network': ('dtids', 'adaptive', 'stream_parse', 'max_doc_size', 'pipeline', 'speculative_prefetch',
+        'dns_cache', 'preresolve', 'http2', 'bulk_fetch', 'local_twins'),
+    'race': ('twins', 'retries', 'backoff', 'timeout_budget', 'hedge_percentile', 'hedge_after',
+        'max_doc_size', 'dns_cache', 'preresolve'),
+}
+
+
+def _check_type(value, expected) -> bool:
+    if expected is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected is bool:
+        return isinstance(value, bool) or value in (0, 1)
+    return isinstance(value, expected)
+
+
+def _check_dtid(dtid, problems: list, name: str) -> str:
+    """
+    Returns:
+      Interned domain of the DTID, None if the DTID is not an HTTP(S) URL
+    """
+    if not isinstance(dtid, str) or not dtid.startswith(('http://', 'https://')) or not dtid.split('/')[2]:
+        problems.append(name + ': DTID must be an http(s) URL: ' + repr(dtid))
+        return None
+    return sys.intern(dtid.split('/')[2])
+
+
+class RunParams:
+    """
+    Parameters of one measurement run.
+
+    Parameters are attributes with the defaults of RUN_PARAMETERS. Only the
+    parameters of KIND_PARAMETERS used by the kind of run may be given. Item
+    access and get() are supported for code written for parameter dicts.
+
+    Args:
+      params: Dict of run parameters as in params-example.yaml
+      kind: 'registry', 'network' or 'race'
+      name: Name of the run in error messages
+
+    Raises:
+      PlanError: If the parameters are not valid.
+    """
+
+    def __init__(self, params: dict, kind: str, name=None):
+        name = name or kind
+        problems = []
+        if not isinstance(params, dict):
+            raise PlanError(name + ': params must be a mapping')
+        self.kind = kind
+        self._given = dict(params)
+
+        for key in params:
+            if key not in RUN_PARAMETERS:
+                problems.append(name + ': unknown parameter ' + repr(key))
+            elif key not in COMMON_PARAMETERS and key not in KIND_PARAMETERS[kind]:
+                problems.append(name + ': parameter ' + repr(key) + ' is not used by ' + kind + ' measurements')
+        for key, (expected, default) in RUN_PARAMETERS.items():
+            value = params.get(key)
+            if value is None:
+                if default is REQUIRED or key == KIND_PARAMETERS[kind][0]:
+                    problems.append(name + ': missing parameter ' + repr(key))
+                value = None if default is REQUIRED else default
+            elif not _check_type(value, expected):
+                problems.append(name + ': ' + key + ' must be of type ' + expected.__name__ + ', not ' + repr(value))
+            elif expected is float:
+                value = float(value)
+            elif expected is bool:
+                value = bool(value)
+            setattr(self, key, value)
+
+        if isinstance(self.samples, int) and self.samples < 1:
+            problems.append(name + ': samples must be at least 1')
+        for key in ('timeout_registry', 'timeout_base', 'timeout_budget', 'backoff', 'max_doc_size'):
+            value = getattr(self, key)
+            if isinstance(value, (int, float)) and value <= 0:
+                problems.append(name + ': ' + key + ' must be positive')
+        if isinstance(self.hedge_percentile, float) and not 0 < self.hedge_percentile < 100:
+            problems.append(name + ': hedge_percentile must be between 0 and 100')
+        if self.bulk_fetch and self.pipeline:
+            problems.append(name + ': bulk_fetch cannot be used with pipeline')
+        if isinstance(self.local_twins, str) and not os.path.isdir(self.local_twins):
+            problems.append(name + ': local_twins folder not found: ' + self.local_twins)
+        if self.http2 and importlib.util.find_spec('h2') is None:
+            problems.append(name + ': http2 needs the h2 package: pip install h2')
+        if isinstance(self.adaptive, dict):
+            unknown = [key for key in self.adaptive if key not in ADAPTIVE_PARAMETERS]
+            for key in unknown:
+                problems.append(name + ': unknown adaptive parameter ' + repr(key))
+            if not unknown:
+                # The sampler checks its arguments, so that the run does not fail when it starts
+                try:
+                    stats.AdaptiveSampler(**self.adaptive)
+                except ValueError as e:
+                    problems.append(name + ': adaptive ' + str(e))
+
+        # Domains of DTIDs are parsed once and interned, so that equal domains are the same object.
+        # Domains of hosting URLs are added by domain() during measurements.
+        self.domains = {}
+        if isinstance(self.dtids, list):
+            if not self.dtids:
+                problems.append(name + ': dtids must not be empty')
+            for dtid in self.dtids:
+                self.domains[dtid] = _check_dtid(dtid, problems, name)
+        if isinstance(self.twins, dict):
+            if not self.twins:
+                problems.append(name + ': twins must not be empty')
+            for twin, dtids in self.twins.items():
+                if not isinstance(dtids, list) or not dtids:
+                    problems.append(name + ': twin ' + str(twin) + ' must have a list of DTIDs')
+                    continue
+                for dtid in dtids:
+                    self.domains[dtid] = _check_dtid(dtid, problems, name)
+
+        if problems:
+            raise PlanError('\n'.join(problems))
+
+    def domain(self, url: str) -> str:
+        """
+        Returns:
+          Interned domain of a DTID or hosting URL, parsed only on the first call for the URL
+        """
+        domain = self.domains.get(url)
+        if domain is None:
+            domain = self.domains[url] = sys.intern(url.split('/')[2])
+        return domain
+
+    def __getitem__(self, key):
+        if key not in RUN_PARAMETERS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._given
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in RUN_PARAMETERS else None
+        return default if value is None else value
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+          Dict of the parameters given in the parameter file
+        """
+        return dict(self._given)
+
+
+def as_run_params(params, kind: str) -> RunParams:
+    """
+    Returns:
+      params as RunParams, validated if given as a dict
+    """
+    if isinstance(params, RunParams):
+        return params
+    return RunParams(params, kind)
+
+
+class RunPlan:
+    """
+    All measurement runs of a parameter file.
+
+    Only runs that are set to run are validated.
+
+    Args:
+      params: Dict of the parameter file
+
+    Raises:
+      PlanError: If the parameter file is not valid.
+    """
+
+    def __init__(self, params: dict):
+        problems = []
+        if not isinstance(params, dict):
+            raise PlanError('Parameter file must be a mapping')
+        self.params = params
+        self.foldername = params.get('foldername')
+        if not isinstance(self.foldername, str) or not self.foldername:
+            problems.append('foldername must be given')
+        self.metrics_port = params.get('metrics_port')
+        if self.metrics_port is not None and not _check_type(self.metrics_port, int):
+            problems.append('metrics_port must be an integer')
+        self.monitoring = params.get('monitoring') or {}
+
+        self.registry = None
+        self.network = {}
+        self.race = {}
+        sections = [('registry', {'registry': params.get('registry_measurement')}),
+            ('network', params.get('network_measurements') or {}),
+            ('race', params.get('race_measurements') or {})]
+        for kind, runs in sections:
+            for key, run in runs.items():
+                if run is None and kind == 'registry':
+                    problems.append('registry_measurement must be given')
+                    continue
+                if not isinstance(run, dict) or 'run' not in run:
+                    problems.append(key + ': run must be given')
+                    continue
+                if not run['run']:
+                    continue
+                try:
+                    run_params = RunParams(run.get('params'), kind, key)
+                except PlanError as e:
+                    problems.append(str(e))
+                    continue
+                if kind == 'registry':
+                    self.registry = run_params
+                else:
+                    getattr(self, kind)[key] = run_params
+
+        if problems:
+            raise PlanError('\n'.join(problems))
+
+    def runs(self) -> list:
+        """
+        Returns:
+          List of (kind, name, RunParams) of the runs to measure, in measuring order
+        """
+        runs = []
+        if self.registry is not None:
+            runs.append(('registry', 'registry', self.registry))
+        for kind in ('network', 'race'):
+            for key, run_params in getattr(self, kind).items():
+                runs.append((kind, key, run_params))
+        return runs
+
+
+def load_plan(filepath='params.yaml', fallback='params-example.yaml') -> RunPlan:
+    """
+    Reads and validates a parameter file.
+
+    Raises:
+      PlanError: If the parameter file is not valid.
+    """
+    try:
+        with open(filepath, 'r') as yamlfile:
+            params = yaml.load(yamlfile, Loader=yaml.FullLoader)
+    except OSError:
+        print('Could not open ' + filepath + ', using ' + fallback + ' instead.')
+        with open(fallback, 'r') as yamlfile:
+            params = yaml.load(yamlfile, Loader=yaml.FullLoader)
+    return RunPlan(params)
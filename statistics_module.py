@@ -0,0 +1,222 @@
+"""
+Statistics for measurement results of Digital Twin Web.
+"""
+import bisect, csv, math
+from statistics import NormalDist
+
+# Columns of the main log
+# Time,DTID,Event,Duration,Depth,Origin,Base,Number
+LOG_COLUMNS = ['Time', 'DTID', 'Event', 'Duration', 'Depth', 'Origin', 'Base', 'Number']
+
+# Column appended to LOG_COLUMNS in main logs: absolute time of the row as
+# integer nanoseconds since the Unix epoch. Missing from older logs.
+TIMESTAMP_COLUMN = 'Timestamp'
+
+STATISTICS = {'median': 0.5, 'p99': 0.99}
+
+# Upper bounds of latency histogram buckets (s), logarithmically spaced from 1 ms to 64 s.
+# The last bucket of a histogram counts values above the highest bound.
+HISTOGRAM_BOUNDS = [0.001 * 2 ** (i / 4) for i in range(65)]
+
+
+def quantile(sorted_values: list, q: float) -> float:
+    """
+    Quantile of sorted values with linear interpolation.
+    """
+    if not sorted_values:
+        return math.nan
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def quantile_ci(sorted_values: list, q: float, confidence=0.95):
+    """
+    Distribution-free confidence interval of a quantile.
+
+    Uses order statistics with the normal approximation of the binomial
+    distribution, so no assumptions are made about the latency distribution.
+
+    Args:
+      sorted_values: Sorted sample values
+      q: Quantile between 0 and 1, e.g. 0.5 for median
+      confidence: Confidence level of the interval
+
+    Returns:
+      Tuple of lower and upper bound, or None if there are too few values
+      for the interval to be within the sample.
+    """
+    n = len(sorted_values)
+    if n == 0:
+        return None
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    spread = z * math.sqrt(n * q * (1 - q))
+    lower = math.floor(n * q - spread)
+    upper = math.ceil(n * q + spread)
+    if lower < 0 or upper > n - 1:
+        return None
+    return sorted_values[lower], sorted_values[upper]
+
+
+def histogram_index(value: float) -> int:
+    """
+    Index of the latency histogram bucket of a value.
+    """
+    return bisect.bisect_left(HISTOGRAM_BOUNDS, value)
+
+
+def histogram_quantile(counts, q: float) -> float:
+    """
+    Approximate quantile of values counted in a latency histogram.
+
+    The value is interpolated linearly inside the bucket of the quantile.
+
+    Args:
+      counts: Counts per bucket, len(HISTOGRAM_BOUNDS) + 1 buckets
+      q: Quantile between 0 and 1
+
+    Returns:
+      Approximate quantile, NaN for an empty histogram
+    """
+    total = sum(counts)
+    if total == 0:
+        return math.nan
+    target = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= target:
+            lower = HISTOGRAM_BOUNDS[index-1] if index > 0 else 0.0
+            upper = HISTOGRAM_BOUNDS[index] if index < len(HISTOGRAM_BOUNDS) else HISTOGRAM_BOUNDS[-1]
+            return lower + (upper - lower) * (target - cumulative) / count
+        cumulative += count
+    return HISTOGRAM_BOUNDS[-1]
+
+
+def parse_histogram(text: str) -> list:
+    """
+    Parses a sparse latency histogram written by format_histogram().
+    """
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for item in text.split():
+        index, count = item.split(':')
+        counts[int(index)] = int(count)
+    return counts
+
+
+def format_histogram(counts) -> str:
+    """
+    Formats a latency histogram compactly as space separated index:count pairs.
+    """
+    return ' '.join('{}:{}'.format(index, count) for index, count in enumerate(counts) if count)
+
+
+def ks_test_histograms(counts_a, counts_b):
+    """
+    Two-sample Kolmogorov-Smirnov test for values counted in latency histograms.
+
+    Values in the same bucket are treated as equal, which makes the test
+    slightly conservative.
+
+    Returns:
+      Tuple of the KS statistic D and its asymptotic p-value
+    """
+    n, m = sum(counts_a), sum(counts_b)
+    if n == 0 or m == 0:
+        return math.nan, math.nan
+    d = 0.0
+    cumulative_a = cumulative_b = 0
+    for count_a, count_b in zip(counts_a, counts_b):
+        cumulative_a += count_a
+        cumulative_b += count_b
+        d = max(d, abs(cumulative_a / n - cumulative_b / m))
+    effective = math.sqrt(n * m / (n + m))
+    lam = (effective + 0.12 + 0.11 / effective) * d
+    if lam < 0.2:
+        return d, 1.0
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam) for k in range(1, 101))
+    return d, min(max(p, 0.0), 1.0)
+
+
+def read_log_rows(filepath: str, offset=0):
+    """
+    Reads measurement rows appended to a main log after an offset.
+
+    Header rows and other lines that are not measurement rows are skipped.
+
+    Args:
+      filepath: Path to measurement log file
+      offset: File position to start reading from
+
+    Returns:
+      Tuple of list of rows as lists and the file position after the last row
+    """
+    with open(filepath, 'r', newline='') as logfile:
+        logfile.seek(offset)
+        lines = logfile.read()
+        offset = logfile.tell()
+    rows = [row for row in csv.reader(lines.splitlines())
+        if len(row) >= len(LOG_COLUMNS) and row[0] != 'Time']
+    return rows, offset
+
+
+class AdaptiveSampler:
+    """
+    Decides when enough samples have been measured.
+
+    Sampling is done when the confidence interval of the chosen statistic
+    is narrower than the target width for every key, e.g. DTID.
+
+    Args:
+      statistic: 'median' or 'p99'
+      target_width: Target width of the confidence interval (s)
+      confidence: Confidence level of the interval
+      min_samples: Minimum number of samples before stopping
+
+    Raises:
+      ValueError: If any of the arguments is not valid.
+    """
+
+    def __init__(self, statistic='median', target_width=0.05, confidence=0.95, min_samples=5):
+        if statistic not in STATISTICS:
+            raise ValueError('statistic must be one of ' + ', '.join(STATISTICS) + ', not ' + repr(statistic))
+        if isinstance(target_width, bool) or not isinstance(target_width, (int, float)) or target_width <= 0:
+            raise ValueError('target_width must be a positive number, not ' + repr(target_width))
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 < confidence < 1:
+            raise ValueError('confidence must be between 0 and 1, not ' + repr(confidence))
+        if isinstance(min_samples, bool) or not isinstance(min_samples, int) or min_samples < 1:
+            raise ValueError('min_samples must be a positive integer, not ' + repr(min_samples))
+        self.statistic = statistic
+        self.q = STATISTICS[statistic]
+        self.target_width = target_width
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.samples = 0
+        self.values = {}
+
+    def add(self, key: str, value: float):
+        self.values.setdefault(key, []).append(value)
+
+    def add_sample(self):
+        """
+        Marks one sample as measured.
+        """
+        self.samples += 1
+
+    def widths(self) -> dict:
+        """
+        Returns:
+          Dict of confidence interval widths per key, inf if the interval
+          cannot yet be computed.
+        """
+        widths = {}
+        for key, values in self.values.items():
+            values.sort()
+            interval = quantile_ci(values, self.q, self.confidence)
+            widths[key] = math.inf if interval is None else interval[1] - interval[0]
+        return widths
+
+    def done(self) -> bool:
+        if self.samples < self.min_samples or not self.values:
+            return False
+        return all(width <= self.target_width for width in self.widths().values())
@@ -0,0 +1,144 @@
+"""
+Compact representation of twin trees fetched in network measurements.
+"""
+import csv, hashlib, math
+from array import array
+
+
+class TwinTree:
+    """
+    Array-backed graph of twins visited in one measurement sample.
+
+    DTIDs are stored once in an interned table. Each visit of a twin is a node
+    stored as a row in parallel arrays, so that a twin reachable from several
+    parents is stored once in the table but visited as several nodes.
+
+    Attributes:
+      dtids: Table of unique DTIDs
+      nodes: DTID table index of each node
+      parents: Node index of the parent of each node, -1 for origins
+      depths: Steps from origin of each node
+      latencies: Time from the start of the sample until the DT doc of
+        each node was received (s), NaN if the DT doc was not received
+    """
+    __slots__ = ('dtids', '_ids', 'nodes', 'parents', 'depths', 'latencies')
+
+    def __init__(self):
+        self.dtids = []
+        self._ids = {}
+        self.nodes = array('l')
+        self.parents = array('l')
+        self.depths = array('H')
+        self.latencies = array('d')
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, dtid: str, parent=-1, depth=0, latency=math.nan) -> int:
+        """
+        Adds a node for a visit of a twin.
+
+        Args:
+          dtid: DTID of the twin
+          parent: Node index of the parent, -1 for origins
+          depth: Steps from origin
+          latency: Time until the DT doc was received (s)
+
+        Returns:
+          Index of the new node
+        """
+        dtid_id = self._ids.get(dtid)
+        if dtid_id is None:
+            dtid_id = len(self.dtids)
+            self._ids[dtid] = dtid_id
+            self.dtids.append(dtid)
+        self.nodes.append(dtid_id)
+        self.parents.append(parent)
+        self.depths.append(depth)
+        self.latencies.append(latency)
+        return len(self.nodes) - 1
+
+    def dtid(self, node: int) -> str:
+        return self.dtids[self.nodes[node]]
+
+    def edges(self) -> set:
+        """
+        Returns:
+          Set of (parent DTID, child DTID) tuples. Origins have None as parent.
+        """
+        edges = set()
+        for node, parent in enumerate(self.parents):
+            edges.add((self.dtid(parent) if parent >= 0 else None, self.dtid(node)))
+        return edges
+
+    def children(self) -> dict:
+        """
+        Returns:
+          Dict of lists of child DTIDs by parent DTID
+        """
+        children = {}
+        for node, parent in enumerate(self.parents):
+            if parent >= 0:
+                children.setdefault(self.dtid(parent), []).append(self.dtid(node))
+        return children
+
+    def signature(self) -> str:
+        """
+        Digest of the topology that is equal for trees with equal edges.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for parent, child in sorted(self.edges(), key=lambda edge: (edge[0] or '', edge[1])):
+            digest.update((str(parent) + ' ' + child + '\n').encode())
+        return digest.hexdigest()
+
+    def diff(self, other: 'TwinTree'):
+        """
+        Compares the topology to another tree.
+
+        Returns:
+          Tuple of sets of edges added and removed in this tree compared to the other tree.
+        """
+        edges, other_edges = self.edges(), other.edges()
+        return edges - other_edges, other_edges - edges
+
+    def save(self, filepath: str):
+        """
+        Writes the tree to a CSV file with one row per node.
+        """
+        with open(filepath, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Node', 'Parent', 'Depth', 'Latency', 'DTID'])
+            for node in range(len(self.nodes)):
+                writer.writerow([node, self.parents[node], self.depths[node],
+                    '{:4.6f}'.format(self.latencies[node]), self.dtid(node)])
+
+    @classmethod
+    def load(cls, filepath: str) -> 'TwinTree':
+        """
+        Reads a tree written with save().
+        """
+        tree = cls()
+        with open(filepath, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader)
+            for _, parent, depth, latency, dtid in reader:
+                tree.add(dtid, int(parent), int(depth), float(latency))
+        return tree
+
+    @classmethod
+    def from_nested(cls, twintree_list: list) -> 'TwinTree':
+        """
+        Converts nested {dtid: [[{...}, {...}]]} trees to a TwinTree.
+        """
+        tree = cls()
+
+        def add_nested(twintree, parent, depth):
+            for dtid, children in twintree.items():
+                node = tree.add(dtid, parent, depth)
+                for child_list in children:
+                    for child in child_list:
+                        add_nested(child, node, depth+1)
+
+        for twintree in twintree_list:
+            add_nested(twintree, -1, 0)
+        return tree
@@ -0,0 +1,27 @@
+""" Measures Digital Twin Web as a worker of a coordinator.
+
+Connects to a coordinator started with coordinator.py, measures the samples
+it sends and returns the measurement logs. Run one worker on each host
+(vantage point) to be measured.
+
+Arguments:
+    coordinator: Address of the coordinator as <host>:<port>
+    --name: Name of the worker in merged logs, the host name by default.
+
+Usage examples:
+    python3 worker.py 192.0.2.10:9470
+    python3 worker.py localhost:9470 --name helsinki
+
+"""
+
+import argparse, socket
+import distributed_module as distributed
+
+parser = argparse.ArgumentParser(description='Measure Digital Twin Web as a worker of a coordinator.')
+parser.add_argument('coordinator', help='Address of the coordinator as <host>:<port>')
+parser.add_argument('--name', default=socket.gethostname(), help='Name of the worker in merged logs')
+args = parser.parse_args()
+
+host, port = args.coordinator.rsplit(':', 1)
+distributed.run_worker(host, int(port), args.name)
+print('\nWorker done.')